@@ -0,0 +1,774 @@
+"""HW8 for the Performance aware programming course (https://www.computerenhance.com/)
+
+A simple testbed for disassembling 8086 set of instructions. 
+Takes in a binary file from the 8086 format and decodes it to relavant x86 assembly code
+Referenced from 8086 Family User Manual 
+
+Supported:
+-Decoding complete flavors of : MOV, conditional Jumps, ADD, ADC, SUB, SBB, CMP
+-Simming of non-memory MOVs, ADD, SUB, CMP. JNZ
+-Implementation of the IP register.
+-Memory MOVs, ADD, SUB and CMPs without segment registers.
+-Adding estimated log on Instruction Cycles
+-Simulator object with instruction budgets and an async stepping API
+-String instructions (MOVS, CMPS, SCAS, LODS, STOS) with REP prefixes, repeated as block copies
+-Estimated clocks from the 8086 manual timings
+-Programs run from the simulated memory. Self modifying code drops its stale cached decodes.
+-Segment registers, 20 bit physical addresses and segment override prefixes.
+-Stack: PUSH/POP, PUSHF/POPF and near/far CALL/RET
+-Memory access heatmap per 16 byte line with a working set report and PGM export
+-Memory dumps and RGBA framebuffer images written straight from the memory pages
+-Execution coverage bitmap of the binary, written with a listing marking the instructions that never ran
+-Deterministic record and replay of runs from periodic state checkpoints (replay_8086)
+-Stepping backwards through an undo log of the overwritten registers, flags and memory
+-Breakpoints by IP and read/write watchpoints on memory ranges
+-Linear sweep disassembly of large binaries across processes (parallel_disassembly_8086)
+-MOV, ADD/SUB/CMP and jump decoders generated from a declarative encoding table (encoding_spec_8086)
+-Prefetch queue and bus cycle timing model next to the manual clocks (prefetch_queue_8086)
+-Headless API returning typed results and step records, text rendered only on demand (headless_8086)
+-Reusable Simulator: load() a new program or reset() the loaded one, restoring only the written pages
+-Local JSON job server running binaries on a pool of warm worker processes with per job budgets (job_server_8086)
+-Execution counts per op_funcs handler and ModRM addressing form, printed as a histogram
+-Loop statistics: trip counts, body size and clocks per iteration of the loops found from backward jumps
+-Installable sim8086 package with the sim8086 command. ALU tables and generated decoders are built on first use for a fast import
+Author: Soumitra Goswami 
+"""
+
+from __future__ import annotations
+import functools
+import struct
+import typing as t
+
+
+from . import instruction_utils_8086 as utils_8086
+from . import encoding_spec_8086
+from . import coverage_8086
+
+# The opt in tools are imported by the enable_x() that turns them on, and the command line
+# by disassemble_CPU8086, so importing the simulator only loads the decoder and the core.
+if t.TYPE_CHECKING:
+    from . import loop_analysis_8086
+    from . import memory_heatmap_8086
+    from . import undo_log_8086
+    from . import debugger_8086
+    from . import prefetch_queue_8086
+    from . import opcode_stats_8086
+
+
+
+# Function tables
+op_funcs = dict()
+# MOV, ADD/SUB/CMP and JUMP flavors, generated from the rows of encoding_spec_8086.encoding_specs
+op_funcs.update(encoding_spec_8086.op_funcs)
+
+# String instruction flavors
+op_funcs["0b1111001"] = utils_8086.string_instruction # REP prefixes
+op_funcs["0b1010010"] = utils_8086.string_instruction # MOVS
+op_funcs["0b1010011"] = utils_8086.string_instruction # CMPS
+op_funcs["0b1010101"] = utils_8086.string_instruction # STOS
+op_funcs["0b1010110"] = utils_8086.string_instruction # LODS
+op_funcs["0b1010111"] = utils_8086.string_instruction # SCAS
+
+# Stack flavors
+op_funcs["0b01010"] = utils_8086.push_pop_register # PUSH
+op_funcs["0b01011"] = utils_8086.push_pop_register # POP
+op_funcs["0b00000110"] = utils_8086.push_pop_segment_register # PUSH ES
+op_funcs["0b00001110"] = utils_8086.push_pop_segment_register # PUSH CS
+op_funcs["0b00010110"] = utils_8086.push_pop_segment_register # PUSH SS
+op_funcs["0b00011110"] = utils_8086.push_pop_segment_register # PUSH DS
+op_funcs["0b00000111"] = utils_8086.push_pop_segment_register # POP ES
+op_funcs["0b00001111"] = utils_8086.push_pop_segment_register # POP CS
+op_funcs["0b00010111"] = utils_8086.push_pop_segment_register # POP SS
+op_funcs["0b00011111"] = utils_8086.push_pop_segment_register # POP DS
+op_funcs["0b10001111"] = utils_8086.pop_register_memory
+op_funcs["0b11111111"] = utils_8086.call_push_register_memory
+op_funcs["0b10011100"] = utils_8086.push_pop_flags # PUSHF
+op_funcs["0b10011101"] = utils_8086.push_pop_flags # POPF
+
+# CALL/RET flavors
+op_funcs["0b11101000"] = utils_8086.call_within_segment
+op_funcs["0b10011010"] = utils_8086.call_intersegment
+op_funcs["0b11000010"] = utils_8086.return_from_call # RET data
+op_funcs["0b11000011"] = utils_8086.return_from_call # RET
+op_funcs["0b11001010"] = utils_8086.return_from_call # RETF data
+op_funcs["0b11001011"] = utils_8086.return_from_call # RETF
+
+
+
+@functools.lru_cache(maxsize=256)
+def decode_opcode(buf:bytes):
+    """Since opcodes vary from 3 bit to 8 bits. A simple way to decode the opcode to it's relevant instructions
+    Matched once per first byte value and cached, so the lookup table fills in as opcodes are seen.
+    """
+    decoded_func = None
+    for i in range(6):
+        num_bits = 3 + i
+        bin_format = f"#0{num_bits+2}b"
+        temp_code = format(buf>>(5-i),bin_format)
+        if temp_code in op_funcs:
+            decoded_func = op_funcs[temp_code]
+
+    if decoded_func == None:
+        raise NotImplementedError(f"opcode not recognized or implemented for byte {bin(buf)}")
+
+    return decoded_func
+
+def decode_instruction(buf:bytes, buf_off:int)->t.Tuple[utils_8086.Instruction, int]:
+    """Decodes the instruction at buf_off without simming it. Returns the instruction and the offset of the next one."""
+    opcode_func = decode_opcode(buf[buf_off])
+    return utils_8086.instruction_decoders[opcode_func](buf, buf_off)
+
+def decode_segment_override(buf:bytes, buf_off:int)->t.Tuple[utils_8086.Instruction, int]:
+    """Decodes a segment override prefix and the instruction it applies to."""
+    segment = utils_8086.segment_override_prefixes[buf[buf_off]]
+    instruction, new_offset = decode_instruction(buf, buf_off + 1)
+    return utils_8086.override_segment(instruction, segment), new_offset
+
+def segment_override(buf:bytes, mem_layout:utils_8086.MemoryLayout8086)->t.Tuple[utils_8086.Instruction, str]:
+    """Reference Manual: Intel 8086 Family User's Manual October 1979
+       Reference page: 4-22 SEGMENT override prefix
+    """
+    print(f"I'm doing a segment override to {utils_8086.segment_override_prefixes[buf[0]]}")
+    ip_old = mem_layout.registers[utils_8086.register_lables["IP"]["pos"]]
+    output, n_bytes = decode_segment_override(buf, 0)
+    print(f"Dest={output.dest}, Source={output.src}")
+
+    sim_out = utils_8086.sim_instruction(output, ip_old, ip_old + n_bytes, mem_layout)
+    return output, sim_out
+
+# Segment override prefixes need the opcode table to decode the instruction after them.
+for prefix in utils_8086.segment_override_prefixes.keys():
+    op_funcs[format(prefix, "#010b")] = segment_override
+utils_8086.instruction_decoders[segment_override] = decode_segment_override
+
+def print_registers(registers:t.List[int])->str:
+    lables = ["AX", "BX", "CX", "DX", "SP", "BP", "SI", "DI", "ES", "CS", "SS", "DS", "IP"]
+    output = "Final Registers: \n"
+    for i, reg in enumerate(registers):
+        if reg == 0:
+            continue
+        output += f"\t\t{lables[i]}: {reg:#06x} ({reg}) \n"
+
+    return output
+
+
+class Simulator():
+    """Steps through a 8086 binary one instruction at a time.
+
+    Unlike looping until IP runs off the end of the binary, run() takes an instruction
+    budget so a looping binary can't spin forever, and run_async() hands control back
+    to the event loop every few instructions so many simulations can share one asyncio loop.
+
+    The binary is loaded into the simulated memory and executed from there, so programs can
+    modify their own code. Writes into pages with cached decodes drop the decodes whose bytes changed.
+
+    One Simulator can run many programs: load() swaps the binary in and reset() rolls back to
+    the state right after loading. Both restore a copy on write snapshot, so they only swap
+    back the pages the run wrote to. reset() keeps the cached ops of unchanged code, load()
+    starts the cache over.
+    """
+    def __init__(self, bin_data: bytes, mem_layout: t.Optional[utils_8086.MemoryLayout8086] = None,
+                 load_program: bool = True):
+        self.bin_data = bin_data
+        if mem_layout is None:
+            mem_layout = utils_8086.MemoryLayout8086(registers=13*[0], flags=0b0, memory=utils_8086.PagedMemory8086())
+        self.mem_layout = mem_layout
+        # The binary is loaded at CS:0. Running outside of it halts.
+        self.code_start = self.mem_layout.segment_bases["CS"]
+        self.code_end = self.code_start + len(bin_data)
+        if load_program:
+            self.mem_layout.load_program(bin_data, self.code_start)
+        # State reset() rolls back to
+        self._loaded_state = self.mem_layout.snapshot()
+        self.instruction_count = 0
+        self.is_halted = not self._is_in_code()
+        self.loop_detector: t.Optional[loop_analysis_8086.InfiniteLoopDetector8086] = None
+        self.loop_stats: t.Optional[loop_analysis_8086.LoopStats8086] = None
+        self.memory_heatmap: t.Optional[memory_heatmap_8086.MemoryHeatmap8086] = None
+        self.undo_log: t.Optional[undo_log_8086.UndoLog8086] = None
+        self.prefetch_model: t.Optional[prefetch_queue_8086.PrefetchQueueModel8086] = None
+        self.opcode_stats: t.Optional[opcode_stats_8086.OpcodeStats8086] = None
+        # Breakpoint IPs. run() stops before them, except for the instruction it starts on.
+        self.breakpoints: t.Set[int] = set()
+        # Breakpoint and watchpoint hits, left for the caller to look at and clear()
+        self.debug_events: t.List[debugger_8086.DebugEvent8086] = []
+        # Made by the first add_watchpoint()
+        self.watchpoints: t.Optional[debugger_8086.Watchpoints8086] = None
+        # Computes the flags of fused ops even when the code after them overwrites them unread
+        self.is_flags_exact = False
+        # Instruction starts that ran, marked as they run
+        self.coverage = coverage_8086.ExecutionCoverage8086(len(bin_data))
+        # CS << 16 | ip -> (op, number of instructions in op, op of the first instruction alone, ip of the last instruction)
+        self._ops: t.Dict[int, t.Tuple[utils_8086.SimOp, int, utils_8086.SimOp, int]] = dict()
+        # CS << 16 | ip -> code regions the op was compiled from: its instruction bytes and the code
+        # after a fused jump that proved its flags dead. Each is (first page, last page, physical address, bytes).
+        self._op_pages: t.Dict[int, t.Tuple[t.Tuple[int, int, int, bytes], ...]] = dict()
+
+    def _is_in_code(self)->bool:
+        pc = self.mem_layout.segment_bases["CS"] + self.mem_layout.registers[12]
+        return self.code_start <= pc < self.code_end
+
+    def enable_loop_detection(self):
+        """Opt in to infinite loop detection. step() raises InfiniteLoopError once the run is proven to never end."""
+        if self.loop_detector is None:
+            from . import loop_analysis_8086
+            self.loop_detector = loop_analysis_8086.InfiniteLoopDetector8086(self.mem_layout)
+            self.loop_detector.attach()
+
+    def enable_loop_stats(self):
+        """Opt in to trip counts and clocks per iteration of the loops of the run. See loop_analysis_8086."""
+        if self.loop_stats is None:
+            from . import loop_analysis_8086
+            self.loop_stats = loop_analysis_8086.LoopStats8086(self._decode)
+
+    def enable_memory_heatmap(self):
+        """Opt in to counting memory reads and writes per 16 byte line. See memory_heatmap_8086."""
+        if self.memory_heatmap is None:
+            from . import memory_heatmap_8086
+            self.memory_heatmap = memory_heatmap_8086.MemoryHeatmap8086(self.mem_layout)
+            self.memory_heatmap.attach()
+
+    def enable_undo_log(self, max_steps: int = 4096, max_mem_writes: int = 65536):
+        """Opt in to step_back(). Keeps what the last max_steps instructions overwrote. See undo_log_8086.
+        run() sims fused ops one instruction at a time while the log is on.
+        """
+        if self.undo_log is None:
+            from . import undo_log_8086
+            self.undo_log = undo_log_8086.UndoLog8086(self.mem_layout, max_steps, max_mem_writes)
+            self.undo_log.attach()
+
+    def enable_prefetch_model(self):
+        """Opt in to modelling the clocks with the prefetch queue and bus cycles. See prefetch_queue_8086.
+        run() sims fused ops one instruction at a time and decodes each one again for its length while the model is on.
+        """
+        if self.prefetch_model is None:
+            from . import prefetch_queue_8086
+            self.prefetch_model = prefetch_queue_8086.PrefetchQueueModel8086(self.mem_layout)
+            self.prefetch_model.attach()
+
+    def enable_opcode_stats(self):
+        """Opt in to counting the instructions run per op_funcs handler and addressing form. See opcode_stats_8086."""
+        if self.opcode_stats is None:
+            from . import opcode_stats_8086
+            self.opcode_stats = opcode_stats_8086.OpcodeStats8086(op_funcs)
+            # Cached ops need their count index
+            self._ops.clear()
+            self._op_pages.clear()
+
+    def step_back(self, n: int = 1)->int:
+        """Undoes the last n instructions. Returns how many were undone, fewer if the undo log ran out."""
+        if self.undo_log is None:
+            raise RuntimeError("Stepping back needs the undo log. Call enable_undo_log() before running")
+        n_undone = self.undo_log.undo(n)
+        self.instruction_count -= n_undone
+        self.is_halted = not self._is_in_code()
+        return n_undone
+
+    def add_breakpoint(self, ip: int):
+        self.breakpoints.add(ip)
+
+    def remove_breakpoint(self, ip: int):
+        self.breakpoints.discard(ip)
+
+    def add_watchpoint(self, start: int, end: int, on_read: bool = False, on_write: bool = True):
+        """Watches the physical memory from start to end (exclusive). The run stops after the instruction accessing it.
+        run() sims fused ops one instruction at a time while a watch is set.
+        """
+        if self.watchpoints is None:
+            from . import debugger_8086
+            self.watchpoints = debugger_8086.Watchpoints8086(self.mem_layout, self.debug_events)
+        self.watchpoints.add(start, end, on_read, on_write)
+
+    def remove_watchpoint(self, start: int, end: int):
+        if self.watchpoints is not None:
+            self.watchpoints.remove(start, end)
+
+    def is_at_breakpoint(self)->bool:
+        return bool(self.breakpoints) and self.mem_layout.registers[12] in self.breakpoints
+
+    def _tag_debug_events(self, ip: int):
+        for event in self.debug_events:
+            if event.ip is None:
+                event.ip = ip
+
+    def enable_exact_flags(self):
+        """Opt in to run() leaving the same flags as step() after every instruction, not only where they are read.
+        Needed to look at the state in the middle of a run (see replay_8086).
+        """
+        if not self.is_flags_exact:
+            self.is_flags_exact = True
+            self._ops.clear()
+            self._op_pages.clear()
+
+    def load(self, bin_data: bytes):
+        """Replaces the program with bin_data, loaded at 0 into a cleared memory with cleared registers.
+        Breakpoints, watchpoints and the opt ins stay set.
+        """
+        self.mem_layout.restore(utils_8086.MemoryLayout8086())
+        self.bin_data = bin_data
+        self.code_start = self.mem_layout.segment_bases["CS"]
+        self.code_end = self.code_start + len(bin_data)
+        self.mem_layout.load_program(bin_data, self.code_start)
+        self._loaded_state = self.mem_layout.snapshot()
+        # Fused ops depend on the code around them, not only on their own bytes
+        self._ops.clear()
+        self._op_pages.clear()
+        self.mem_layout.code_pages[:] = bytes(len(self.mem_layout.code_pages))
+        self.mem_layout.dirty_code_pages[:] = bytes(len(self.mem_layout.dirty_code_pages))
+        self.mem_layout.is_code_dirty = False
+        if self.opcode_stats is not None:
+            self.opcode_stats.op_indices.clear()
+        self.reset()
+
+    def reset(self):
+        """Rolls back to the state right after the program was loaded, to run it again.
+        Only the pages written since are swapped back. Breakpoints, watchpoints and the opt ins stay set.
+        """
+        self.mem_layout.restore(self._loaded_state)
+        self.instruction_count = 0
+        self.is_halted = not self._is_in_code()
+        self.debug_events.clear()
+        self.coverage = coverage_8086.ExecutionCoverage8086(len(self.bin_data))
+        # The opt ins start over on the restored state
+        if self.loop_detector is not None:
+            self.loop_detector.detach()
+            self.loop_detector = None
+            self.enable_loop_detection()
+        if self.loop_stats is not None:
+            self.loop_stats = None
+            self.enable_loop_stats()
+        if self.memory_heatmap is not None:
+            self.memory_heatmap.detach()
+            self.memory_heatmap = None
+            self.enable_memory_heatmap()
+        if self.undo_log is not None:
+            self.undo_log.detach()
+            max_steps, max_mem_writes = self.undo_log.max_steps, self.undo_log.max_mem_writes
+            self.undo_log = None
+            self.enable_undo_log(max_steps, max_mem_writes)
+        if self.prefetch_model is not None:
+            self.prefetch_model.detach()
+            self.prefetch_model = None
+            self.enable_prefetch_model()
+        if self.opcode_stats is not None:
+            self.opcode_stats.clear()
+
+    def fork(self)->Simulator:
+        """Returns a Simulator continuing from the current state. Memory is shared copy on write."""
+        forked = Simulator(self.bin_data, self.mem_layout.snapshot(), load_program=False)
+        forked.instruction_count = self.instruction_count
+        forked.coverage = self.coverage.copy()
+        return forked
+
+    @classmethod
+    def from_file(cls, bin_path: str)->Simulator:
+        with open(bin_path, "rb") as f:
+            return cls(f.read())
+
+    def step(self)->t.Tuple[utils_8086.Instruction, str]:
+        """Decodes and sims the instruction at IP. Returns the decoded instruction and its sim log."""
+        if self.is_halted:
+            raise RuntimeError("Simulator is halted. IP is past the end of the binary")
+        if self.mem_layout.is_code_dirty:
+            self._drop_dirty_code()
+        if self.undo_log is not None:
+            self.undo_log.begin_instruction()
+        ip_old = self.mem_layout.registers[12]
+        pc = self.mem_layout.segment_bases["CS"] + ip_old
+        m_byte_1 = self.mem_layout.memory[pc]
+        opcode_func = decode_opcode(m_byte_1)
+        if self.prefetch_model is not None:
+            self.prefetch_model.begin_instruction(pc, self._decode(ip_old)[1] - ip_old)
+        output, sim_out = opcode_func(self.mem_layout.fetch(pc), self.mem_layout)
+        if self.prefetch_model is not None:
+            self.prefetch_model.end_instruction()
+        if self.opcode_stats is not None:
+            self.opcode_stats.count(opcode_func, output)
+        self.coverage.mark(pc - self.code_start)
+        if self.debug_events:
+            self._tag_debug_events(ip_old)
+        self.instruction_count += 1
+        if self.loop_detector is not None and self.mem_layout.registers[12] < ip_old:
+            self.loop_detector.on_backward_jump(ip_old, self.mem_layout.registers[12])
+        ip = self.mem_layout.registers[12]
+        if self.loop_stats is not None and (ip <= ip_old or ip in self.loop_stats.loops):
+            self.loop_stats.on_arrival(ip_old, ip, self.instruction_count, self.mem_layout.clocks)
+        # CS:IP
+        if not self._is_in_code():
+            self.is_halted = True
+        return output, sim_out
+
+    def _decode(self, ip: int)->t.Tuple[utils_8086.Instruction, int]:
+        """Decodes the instruction at CS:ip. Returns the instruction and the ip of the next one."""
+        instruction, n_bytes = decode_instruction(self.mem_layout.fetch(self.mem_layout.segment_bases["CS"] + ip), 0)
+        return instruction, ip + n_bytes
+
+    def _drop_dirty_code(self):
+        """Drops the cached ops whose code regions changed in a page written to since they were compiled.
+        Ops whose regions are unchanged, like code next to data written in the same page, are kept.
+        """
+        layout = self.mem_layout
+        dirty_code_pages = layout.dirty_code_pages
+        for key, regions in list(self._op_pages.items()):
+            if not any(any(dirty_code_pages[first_page:last_page + 1]) for first_page, last_page, _, _ in regions):
+                continue
+            if all(layout.memory.read_block(pc, len(code)) == code for _, _, pc, code in regions):
+                for first_page, last_page, _, _ in regions:
+                    layout.code_pages[first_page:last_page + 1] = (last_page + 1 - first_page) * b"\x01"
+            else:
+                del self._ops[key]
+                del self._op_pages[key]
+        dirty_code_pages[:] = bytes(len(dirty_code_pages))
+        self.mem_layout.is_code_dirty = False
+
+    def _flags_dead_until(self, ip: int, max_lookahead: int = 8)->t.Optional[int]:
+        """If the straight line code at ip overwrites the arithmetic flags before anything reads them,
+        returns the ip right after the instruction overwriting them. None otherwise.
+        """
+        for _ in range(max_lookahead):
+            pc = self.mem_layout.segment_bases["CS"] + ip
+            if pc < self.code_start or pc >= self.code_end:
+                return None # Flags are part of the final state
+            try:
+                instruction, ip = self._decode(ip)
+            except (NotImplementedError, KeyError, struct.error):
+                return None
+            if instruction.memonic in utils_8086.fusable_arith_memonics:
+                return ip
+            if instruction.memonic != "MOV":
+                return None
+        return None
+
+    def _code_region(self, ip: int, end_ip: int)->t.Tuple[int, int, int, bytes]:
+        """Marks the code from CS:ip to CS:end_ip as cached and returns its region for _op_pages."""
+        pc = self.mem_layout.segment_bases["CS"] + ip
+        n_bytes = end_ip - ip
+        self.mem_layout.mark_code(pc, n_bytes)
+        return (pc >> utils_8086.PAGE_SHIFT, (pc + n_bytes - 1) >> utils_8086.PAGE_SHIFT, pc,
+                self.mem_layout.memory.read_block(pc, n_bytes))
+
+    def _compile(self, ip: int)->t.Tuple[utils_8086.SimOp, int, utils_8086.SimOp, int]:
+        """Decodes the instruction at ip into a cached op. ADD/SUB/CMP followed by a conditional jump becomes one fused op."""
+        instruction, next_ip = self._decode(ip)
+        op = utils_8086.compile_instruction(instruction, ip, next_ip)
+        entry = (op, 1, op, ip)
+        code_end = next_ip
+        # Code after the fused jump its flags dead decision read, as (start ip, end ip)
+        lookahead_code = []
+        jump_stats_idx = None
+        # The fused op runs a jump decoded ahead of time, so an ADD/SUB writing memory (maybe the jump's
+        # own bytes) isn't fused.
+        is_fusable = (instruction.memonic in utils_8086.fusable_arith_memonics
+                      and (instruction.memonic == "CMP" or not instruction.dest.is_memory))
+        cs_base = self.mem_layout.segment_bases["CS"]
+        if is_fusable and self.code_start <= cs_base + next_ip < self.code_end:
+            try:
+                jump, jump_next_ip = self._decode(next_ip)
+            except (NotImplementedError, KeyError, struct.error):
+                jump = None
+            if jump is not None and jump.memonic in utils_8086.fusable_jump_memonics:
+                jump_target = jump_next_ip + int(jump.dest.val) - 2
+                is_flags_live = True
+                if not self.is_flags_exact:
+                    target_dead_until = self._flags_dead_until(jump_target)
+                    next_dead_until = self._flags_dead_until(jump_next_ip)
+                    if target_dead_until is not None and next_dead_until is not None:
+                        is_flags_live = False
+                        lookahead_code = [(jump_target, target_dead_until), (jump_next_ip, next_dead_until)]
+                fused_op = utils_8086.compile_fused_arith_jump(instruction, jump, jump_next_ip, is_flags_live)
+                entry = (fused_op, 2, op, next_ip)
+                code_end = jump_next_ip
+                if self.opcode_stats is not None:
+                    jump_handler = decode_opcode(self.mem_layout.memory[cs_base + next_ip])
+                    jump_stats_idx = self.opcode_stats.index(jump_handler, jump)
+        key = (cs_base << 16) | ip
+        pc = cs_base + ip
+        if self.opcode_stats is not None:
+            stats_idx = self.opcode_stats.index(decode_opcode(self.mem_layout.memory[pc]), instruction)
+            self.opcode_stats.op_indices[key] = (stats_idx, jump_stats_idx)
+        self._ops[key] = entry
+        # A write to any of them drops the op, so a fused op also goes when the code deciding its flags changes
+        self._op_pages[key] = tuple(self._code_region(start_ip, end_ip)
+                                    for start_ip, end_ip in [(ip, code_end)] + lookahead_code)
+        return entry
+
+    def run(self, max_instructions: t.Optional[int] = None)->int:
+        """Runs until the binary ends or max_instructions have been simmed. Returns the number simmed.
+        Runs from cached compiled ops without building any sim log.
+        """
+        count = 0
+        mem_layout = self.mem_layout
+        registers = mem_layout.registers
+        segment_bases = mem_layout.segment_bases
+        code_start = self.code_start
+        code_end = self.code_end
+        ops = self._ops
+        undo_log = self.undo_log
+        prefetch_model = self.prefetch_model
+        opcode_stats = self.opcode_stats
+        loop_stats = self.loop_stats
+        breakpoints = self.breakpoints
+        coverage_bitmap = self.coverage.bitmap
+        # None unless a watch is set, so runs without watches skip the check
+        watch_events = self.debug_events if self.watchpoints is not None and self.watchpoints.watches else None
+        is_split = undo_log is not None or watch_events is not None or prefetch_model is not None
+        while not self.is_halted:
+            if mem_layout.is_code_dirty:
+                self._drop_dirty_code()
+            ip = registers[12]
+            # Stops are checked before compiling, so the code past them is never decoded
+            if max_instructions is not None and count >= max_instructions:
+                break
+            if breakpoints and count and ip in breakpoints:
+                from . import debugger_8086
+                self.debug_events.append(debugger_8086.DebugEvent8086("break", ip))
+                break
+            key = (segment_bases["CS"] << 16) | ip
+            entry = ops.get(key)
+            if entry is None:
+                entry = self._compile(ip)
+            op, n_instructions, first_op, ip_last = entry
+            if n_instructions == 2:
+                if breakpoints and ip_last in breakpoints:
+                    # Stop before the jump of the fused op
+                    op, n_instructions, ip_last = first_op, 1, ip
+                elif max_instructions is not None and count + 2 > max_instructions:
+                    # Not enough budget left for the whole fused op
+                    op, n_instructions, ip_last = first_op, 1, ip
+            if is_split:
+                # Every instruction gets its own undo entry, model timing and watch hits stop right after the access
+                op, n_instructions, ip_last = first_op, 1, ip
+                if undo_log is not None:
+                    undo_log.begin_instruction()
+                if prefetch_model is not None:
+                    prefetch_model.begin_instruction(segment_bases["CS"] + ip, self._decode(ip)[1] - ip)
+            op(mem_layout)
+            # Coverage bits of the instruction starts that ran, see ExecutionCoverage8086.mark
+            offset = (key >> 16) + ip - code_start
+            coverage_bitmap[offset >> 3] |= 1 << (offset & 7)
+            if n_instructions == 2:
+                offset += ip_last - ip
+                coverage_bitmap[offset >> 3] |= 1 << (offset & 7)
+            if prefetch_model is not None:
+                prefetch_model.end_instruction()
+            if opcode_stats is not None:
+                stats_idx, jump_stats_idx = opcode_stats.op_indices[key]
+                opcode_stats.counts[stats_idx] += 1
+                if n_instructions == 2:
+                    opcode_stats.counts[jump_stats_idx] += 1
+            count += n_instructions
+            self.instruction_count += n_instructions
+            if self.loop_detector is not None and registers[12] < ip_last:
+                self.loop_detector.on_backward_jump(ip_last, registers[12])
+            if loop_stats is not None and (registers[12] <= ip_last or registers[12] in loop_stats.loops):
+                loop_stats.on_arrival(ip_last, registers[12], self.instruction_count, mem_layout.clocks)
+            pc = segment_bases["CS"] + registers[12]
+            if pc < code_start or pc >= code_end:
+                self.is_halted = True
+            if watch_events:
+                self._tag_debug_events(ip)
+                break
+        # Stopping between a fused op and the code overwriting its flags would leave them stale
+        mem_layout.apply_pending_flags()
+        return count
+
+    async def run_async(self, max_instructions: t.Optional[int] = None, yield_every: int = 1000)->int:
+        """Same as run() but yields to the event loop every `yield_every` instructions."""
+        # Imported here, it would be most of the import time of this module
+        import asyncio
+        if yield_every < 1:
+            raise ValueError(f"yield_every needs to be at least 1. Got {yield_every}")
+        count = 0
+        while not self.is_halted:
+            batch = yield_every
+            if max_instructions is not None:
+                batch = min(batch, max_instructions - count)
+                if batch <= 0:
+                    break
+            n_ran = self.run(batch)
+            count += n_ran
+            # Stopped by a breakpoint or watchpoint
+            if n_ran < batch:
+                break
+            await asyncio.sleep(0)
+        return count
+
+
+def disassemble_CPU8086(bin_path: str, is_print_cycles:bool = True, max_instructions: t.Optional[int] = None,
+                        detect_infinite_loops: bool = False, memory_heatmap: bool = False,
+                        heatmap_pgm_path: t.Optional[str] = None, dump_path: t.Optional[str] = None,
+                        dump_range: t.Optional[t.Tuple[int, int]] = None, image_path: t.Optional[str] = None,
+                        image_region: t.Tuple[int, int, int] = (0, 64, 64),
+                        coverage_path: t.Optional[str] = None, breakpoints: t.Optional[t.Iterable[int]] = None,
+                        watchpoints: t.Optional[t.List[t.Tuple[int, int, str]]] = None,
+                        prefetch_model: bool = False, opcode_stats: bool = False, loop_stats: bool = False)->str:
+    ''' A simple disassembler of limited 8086 set of instruction
+    loop_stats: reports the trip count, body size and clocks per iteration of every loop at the end.
+    opcode_stats: prints the histogram of the instructions run per handler and addressing form at the end.
+    prefetch_model: logs the clocks modelled with the prefetch queue and bus cycles next to the manual ones.
+    breakpoints: IPs to stop the run before.
+    watchpoints: (start, end, "r", "w" or "rw") memory ranges to stop the run after an access to.
+    coverage_path: writes the coverage bitmap there and the listing marking the instructions that never ran next to it (.asm).
+    dump_path: writes the final memory (dump_range (start, end) of it, all of it by default) there.
+    image_path: writes image_region (address, width, height) of the final memory as an RGBA image.
+    '''
+    from pathlib import Path
+    from . import loop_analysis_8086
+    from . import memory_dump_8086
+    from . import debugger_8086
+
+    sim = Simulator.from_file(bin_path)
+    if detect_infinite_loops:
+        sim.enable_loop_detection()
+    if memory_heatmap or heatmap_pgm_path is not None:
+        sim.enable_memory_heatmap()
+    if prefetch_model:
+        sim.enable_prefetch_model()
+    if opcode_stats:
+        sim.enable_opcode_stats()
+    if loop_stats:
+        sim.enable_loop_stats()
+    for ip in breakpoints or []:
+        sim.add_breakpoint(ip)
+    for start, end, mode in watchpoints or []:
+        sim.add_watchpoint(start, end, on_read="r" in mode, on_write="w" in mode)
+    filename = Path(bin_path).stem
+    out_file = f"; {filename}\n"
+    out_file += "bits 16\n"
+    out_op_text = f"; {filename}\n"
+
+    myLayout = sim.mem_layout
+    while not sim.is_halted:
+        if max_instructions is not None and sim.instruction_count >= max_instructions:
+            print(f"Instruction budget of {max_instructions} reached")
+            break
+        if sim.is_at_breakpoint():
+            sim.debug_events.append(debugger_8086.DebugEvent8086("break", myLayout.registers[12]))
+        if sim.debug_events:
+            for event in sim.debug_events:
+                print(event)
+                out_op_text += f"; {event}\n"
+            break
+        try:
+            clocks_old = myLayout.clocks
+            output, sim_out = sim.step()
+            if is_print_cycles:
+                clocks = myLayout.clocks
+                sim_out = f"{sim_out.rstrip()} Clocks: +{clocks - clocks_old} = {clocks}"
+                if sim.prefetch_model is not None:
+                    sim_out += f" Modelled: +{sim.prefetch_model.last_clocks} = {sim.prefetch_model.clocks}"
+                sim_out += "\n"
+            out_file += str(output) + '\n'
+            out_op_text += sim_out
+            print(sim_out)
+        except NotImplementedError as e:
+            print(f"NotImplementedError: {e}")
+            break
+        except loop_analysis_8086.InfiniteLoopError as e:
+            print(f"InfiniteLoopError: {e}")
+            out_op_text += f"; {e}\n"
+            break
+        except TypeError as e:
+            opcode_func = decode_opcode(myLayout.memory[myLayout.segment_bases["CS"] + myLayout.registers[12]])
+            print(f"'{opcode_func.__name__}' function is not fleshed out yet or has an error")
+            print(f"TypeError: {e}")
+            break
+    buff_off = myLayout.registers[12]
+    print(f"End of Instructions at byte offset: {hex(buff_off)}")
+
+    #Print the final registers
+    out_op_text += "\n"
+    out_op_text += print_registers(myLayout.registers)
+    out_op_text += "Flags: \n" + utils_8086.serialize_flags(myLayout.flags) + '\n'
+    if is_print_cycles:
+        out_op_text += f"Clocks: {myLayout.clocks}\n"
+        if sim.prefetch_model is not None:
+            out_op_text += f"Modelled clocks: {sim.prefetch_model.clocks}\n"
+            out_op_text += "\n" + sim.prefetch_model.report()
+    if sim.memory_heatmap is not None:
+        heatmap_report = sim.memory_heatmap.report()
+        print(heatmap_report)
+        out_op_text += "\n" + heatmap_report
+        if heatmap_pgm_path is not None:
+            sim.memory_heatmap.write_pgm(heatmap_pgm_path)
+    if sim.opcode_stats is not None:
+        opcode_histogram = sim.opcode_stats.histogram()
+        print(opcode_histogram)
+        out_op_text += "\n" + opcode_histogram
+    if sim.loop_stats is not None:
+        loop_report = sim.loop_stats.report()
+        print(loop_report)
+        out_op_text += "\n" + loop_report
+    if dump_path is not None:
+        if dump_range is None:
+            memory_dump_8086.dump_memory(myLayout.memory, dump_path)
+        else:
+            memory_dump_8086.dump_memory(myLayout.memory, dump_path, dump_range[0], dump_range[1] - dump_range[0])
+    if image_path is not None:
+        memory_dump_8086.export_framebuffer(myLayout.memory, image_path, *image_region)
+    if coverage_path is not None:
+        sim.coverage.write(coverage_path)
+        write_file(str(Path(coverage_path).with_suffix('.asm')), sim.coverage.listing(sim.bin_data, decode_instruction))
+    return out_file, out_op_text
+    
+def write_file(out_path: str, output: str):
+    with open(out_path, 'w') as ofh:
+        ofh.write(output)
+
+
+
+def main(argv: t.Optional[t.List[str]] = None):
+    """Command line entry point (the sim8086 console script)."""
+    import argparse
+    import os
+    from pathlib import Path
+
+    # The homework listings sit next to the package
+    dirname = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    parent = Path(dirname).parent
+    path = os.path.join(dirname, "listing_0051_memory_mov")
+    path = os.path.join(dirname, "listing_0052_memory_add_loop")
+    path = os.path.join(dirname, "listing_0053_add_loop_challenge")
+
+    #path =os.path.join(parent,'HW6', 'listing_0049_conditional_jumps')
+    parser = argparse.ArgumentParser(description="Disassembles and sims a 8086 binary")
+    parser.add_argument("bin_path", nargs="?", default=path)
+    parser.add_argument("--dump", help="write the final memory to this file")
+    parser.add_argument("--dump-range", help="START:END of the memory to dump, eg. 0x100:0x200")
+    parser.add_argument("--image", help="write a framebuffer of the final memory (.pam, .rgba or .ppm)")
+    parser.add_argument("--image-region", default="0,64,64", help="ADDRESS,WIDTH,HEIGHT of the framebuffer")
+    parser.add_argument("--break", dest="breakpoints", action="append", default=[], help="stop before this IP")
+    parser.add_argument("--watch", action="append", default=[],
+                        help="START:END[:r|w|rw] stop after an access to the memory range, writes by default")
+    parser.add_argument("--prefetch", action="store_true",
+                        help="also model the clocks with the prefetch queue and bus cycles")
+    parser.add_argument("--opcode-stats", action="store_true",
+                        help="print a histogram of the instructions run per handler and addressing form")
+    parser.add_argument("--loop-stats", action="store_true",
+                        help="report the trip count and clocks per iteration of every loop")
+    args = parser.parse_args(argv)
+    path = args.bin_path
+    dump_range = None
+    if args.dump_range is not None:
+        dump_range = tuple(int(val, 0) for val in args.dump_range.split(":"))
+    image_region = tuple(int(val, 0) for val in args.image_region.split(","))
+    breakpoints = [int(ip, 0) for ip in args.breakpoints]
+    watchpoints = []
+    for watch in args.watch:
+        start, end, *mode = watch.split(":")
+        watchpoints.append((int(start, 0), int(end, 0), mode[0] if mode else "w"))
+
+    out_path = str(path) + '_out.asm'
+    coverage_path = str(path) + '_coverage.bin'
+    output, out_sim = disassemble_CPU8086(path, dump_path=args.dump, dump_range=dump_range,
+                                          image_path=args.image, image_region=image_region,
+                                          coverage_path=coverage_path, breakpoints=breakpoints,
+                                          watchpoints=watchpoints, prefetch_model=args.prefetch,
+                                          opcode_stats=args.opcode_stats, loop_stats=args.loop_stats)
+    out_sim_path = str(path) + '_instructions.txt'
+    write_file(out_path, output)
+    write_file(out_sim_path, out_sim)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,11 @@
+"""8086 disassembler and simulator from the Performance Aware Programming course homework.
+
+SG_HW8 holds the decoder, the Simulator and the sim8086 command line. The other modules
+are the opt in tools around it (headless_8086, job_server_8086, replay_8086, ...) and are
+imported on their own, so importing the package stays cheap:
+
+    from sim8086 import headless_8086
+    result = headless_8086.simulate_file("listing_0057_challenge_cycles")
+
+Author: Soumitra Goswami
+"""
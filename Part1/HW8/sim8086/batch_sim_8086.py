@@ -0,0 +1,219 @@
+"""Lockstep simulation of one 8086 binary over many instances with NumPy.
+
+Parameter sweeps run the same program with different initial registers. Instead of one
+Simulator per instance, registers, flags and memory of all instances are kept as NumPy
+arrays (one column per instance) and every decoded instruction is simmed across all of
+them at once. Like Simulator, the binary is loaded at physical address 0 and each instance
+runs while its CS:IP is inside it. Instances may diverge on conditional jumps or by starting
+with different registers: each step sims the lowest CS:IP any active instance is at, masked
+to the instances sitting on it, so diverged instances wait and reconverge after the branch.
+Instructions are decoded from the binary, writes into the code don't change what runs.
+
+Memory operands go through the segment registers of each instance like in MemoryLayout8086:
+(segment << 4) + effective address, wrapped at 1 MiB. `memory_size` defaults to the first
+64 KiB to keep many instances cheap. A physical address past it raises IndexError, so
+programs moving their segments up need a memory_size of up to 1 MiB.
+
+Decoding comes from op_funcs (SG_HW8.decode_instruction) and flags/jump conditions from
+instruction_utils_8086.calc_flags and jump_conditions, so the batch engine sims the same
+semantics as the single instance handlers.
+
+Author: Soumitra Goswami
+"""
+from __future__ import annotations
+import typing as t
+
+import numpy as np
+
+from . import instruction_utils_8086 as utils_8086
+from . import coverage_8086
+from . import SG_HW8
+
+
+IP_POS = utils_8086.register_lables["IP"]["pos"]
+CX_POS = utils_8086.register_lables["CX"]["pos"]
+segment_positions = dict()
+for segment in utils_8086.seg_reg_field.values():
+    segment_positions[segment] = utils_8086.register_lables[segment]["pos"]
+
+
+class BatchSimulator8086():
+    """Sims `n_instances` copies of a binary in lockstep.
+
+    registers: (13, n_instances) array, same register order as MemoryLayout8086.registers
+    flags:     (n_instances,) array
+    memory:    (n_instances, memory_size) uint8 array, physical addresses from 0
+    """
+    def __init__(self, bin_data: bytes, n_instances: int, memory_size: int = 0x10000):
+        self.bin_data = bin_data
+        self.n_instances = n_instances
+        self.memory_size = memory_size
+        # int64 so the flag math in calc_flags can go negative without wrapping.
+        self.registers = np.zeros((13, n_instances), dtype=np.int64)
+        self.flags = np.zeros(n_instances, dtype=np.int64)
+        self.memory = np.zeros((n_instances, memory_size), dtype=np.uint8)
+        self.instruction_count = np.zeros(n_instances, dtype=np.int64)
+        self.step_count = 0
+        self._lanes = np.arange(n_instances)
+        self.memory[:, :len(bin_data)] = np.frombuffer(bin_data, dtype=np.uint8)
+        # CS:IP -> (Instruction, bytes). Each instruction is decoded once for all instances.
+        self._decoded: t.Dict[int, t.Tuple[utils_8086.Instruction, int]] = dict()
+        # Instruction starts any instance ran, marked on decode
+        self.coverage = coverage_8086.ExecutionCoverage8086(len(bin_data))
+
+    def set_register(self, reg_name: str, values: t.Any):
+        """Sets a register for all instances. `values` is a scalar or one value per instance."""
+        address = utils_8086.Address(reg_name, is_register=True)
+        self._set_reg(address, np.broadcast_to(np.asarray(values, dtype=np.int64), (self.n_instances,)),
+                      np.ones(self.n_instances, dtype=bool))
+
+    def get_register(self, reg_name: str)->np.ndarray:
+        return self._get_reg(utils_8086.Address(reg_name, is_register=True))
+
+    @property
+    def pcs(self)->np.ndarray:
+        """Physical CS:IP address of each instance."""
+        return ((self.registers[segment_positions["CS"]] << 4) + self.registers[IP_POS]) & utils_8086.PHYSICAL_MASK
+
+    @property
+    def active(self)->np.ndarray:
+        return self.pcs < len(self.bin_data)
+
+    def step(self)->bool:
+        """Sims one instruction for the instances at the lowest active CS:IP. Returns False once all instances are done."""
+        pcs = self.pcs
+        active = pcs < len(self.bin_data)
+        if not active.any():
+            return False
+        pc = int(pcs[active].min())
+        mask = active & (pcs == pc)
+
+        if pc not in self._decoded:
+            instruction, next_offset = SG_HW8.decode_instruction(self.bin_data, pc)
+            self._decoded[pc] = (instruction, next_offset - pc)
+            self.coverage.mark(pc)
+        instruction, instruction_bytes = self._decoded[pc]
+
+        self._sim(instruction, instruction_bytes, mask)
+        self.instruction_count += mask
+        self.step_count += 1
+        return True
+
+    def run(self, max_steps: t.Optional[int] = None)->int:
+        """Steps until every instance ran off the end of the binary or max_steps. Returns the steps taken."""
+        count = 0
+        while max_steps is None or count < max_steps:
+            if not self.step():
+                break
+            count += 1
+        return count
+
+    # Operand access. All reads are done for every instance, writes are masked.
+    def _get_reg(self, address: utils_8086.Address)->np.ndarray:
+        reg = utils_8086.register_lables[address.val]
+        # Copy, the row is overwritten in place when the register is set.
+        val = self.registers[reg["pos"]].copy()
+        if reg["bytes"] == 1:
+            val = (val >> 8) if reg["is_high"] else (val & 0xff)
+        return val
+
+    def _set_reg(self, address: utils_8086.Address, val: np.ndarray, mask: np.ndarray):
+        reg = utils_8086.register_lables[address.val]
+        old_val = self.registers[reg["pos"]]
+        if reg["bytes"] == 2:
+            new_val = val & 0xffff
+        else:
+            bit_mask = 0xff00 if reg["is_high"] else 0x00ff
+            val = (val << 8) if reg["is_high"] else val
+            new_val = (old_val & ~bit_mask) | (val & bit_mask)
+        self.registers[reg["pos"]] = np.where(mask, new_val, old_val)
+
+    def _get_mem_location(self, address: utils_8086.Address, mask: np.ndarray)->np.ndarray:
+        """Physical address of a memory operand per instance, same as MemoryLayout8086.get_mem_location."""
+        mem_loc = np.full(self.n_instances, address.mem_displacement, dtype=np.int64)
+        segment = address.segment
+        if address.mem_from_reg:
+            for reg in address.val:
+                mem_loc = mem_loc + self.registers[utils_8086.register_lables[reg]["pos"]]
+            # Addressing through BP defaults to the stack segment
+            if segment is None:
+                segment = "SS" if "BP" in address.val else "DS"
+        else:
+            mem_loc = mem_loc + address.val[0]
+            if segment is None:
+                segment = "DS"
+        # Effective addresses wrap around at 16 bits
+        mem_loc = ((self.registers[segment_positions[segment]] << 4) + (mem_loc & 0xffff)) & utils_8086.PHYSICAL_MASK
+        last_loc = mem_loc[mask] + (1 if address.is_wide else 0)
+        if self.memory_size <= utils_8086.PHYSICAL_MASK and (last_loc >= self.memory_size).any():
+            raise IndexError(f"Physical address {int(last_loc.max()):#07x} is past the memory_size of {self.memory_size:#x}")
+        # Instances not simming this instruction read values that are thrown away
+        return mem_loc % self.memory_size
+
+    def _get_mem(self, address: utils_8086.Address, mask: np.ndarray)->np.ndarray:
+        mem_loc = self._get_mem_location(address, mask)
+        val = self.memory[self._lanes, mem_loc].astype(np.int64)
+        if address.is_wide:
+            val |= self.memory[self._lanes, (mem_loc + 1) % self.memory_size].astype(np.int64) << 8
+        return val
+
+    def _set_mem(self, address: utils_8086.Address, val: np.ndarray, mask: np.ndarray):
+        lanes = np.nonzero(mask)[0]
+        mem_loc = self._get_mem_location(address, mask)[lanes]
+        val = val[lanes]
+        self.memory[lanes, mem_loc] = val & 0xff
+        if address.is_wide:
+            self.memory[lanes, (mem_loc + 1) % self.memory_size] = (val >> 8) & 0xff
+
+    def _get_value(self, address: utils_8086.Address, mask: np.ndarray)->np.ndarray:
+        if address.is_register:
+            return self._get_reg(address)
+        if address.is_memory:
+            return self._get_mem(address, mask)
+        value_mask = 0xffff if address.is_wide else 0xff
+        return np.full(self.n_instances, address.val & value_mask, dtype=np.int64)
+
+    def _set_value(self, address: utils_8086.Address, val: np.ndarray, mask: np.ndarray):
+        if address.is_register:
+            self._set_reg(address, val, mask)
+        elif address.is_memory:
+            self._set_mem(address, val, mask)
+
+    def _sim(self, instruction: utils_8086.Instruction, instruction_bytes: int, mask: np.ndarray):
+        memonic = instruction.memonic
+        # Instances at the same CS:IP can have different CS and IP
+        next_ips = (self.registers[IP_POS] + instruction_bytes) & 0xffff
+        self.registers[IP_POS] = np.where(mask, next_ips, self.registers[IP_POS])
+
+        if memonic == "MOV":
+            self._set_value(instruction.dest, self._get_value(instruction.src, mask), mask)
+
+        elif memonic in utils_8086.arith_memonics:
+            arith_opcode = utils_8086.arith_memonics[memonic]
+            n_bytes = 2 if instruction.dest.is_wide else 1
+            value_mask = 0xffff if n_bytes == 2 else 0xff
+            src_val = self._get_value(instruction.src, mask) & value_mask
+            dest_val = self._get_value(instruction.dest, mask)
+            # All the add opcodes are even while sub opcodes are odd.
+            if arith_opcode % 2 == 0:
+                new_val = (dest_val + src_val) & value_mask
+            else:
+                new_val = (dest_val - src_val) & value_mask
+            # CMP (0b111) only sets the flags
+            if arith_opcode != 0b111:
+                self._set_value(instruction.dest, new_val, mask)
+            new_flags = utils_8086.calc_flags(self.flags, new_val, dest_val, src_val, arith_opcode, n_bytes)
+            self.flags = np.where(mask, new_flags, self.flags)
+
+        elif memonic in utils_8086.jump_conditions:
+            cx = self.registers[CX_POS]
+            if memonic in utils_8086.loop_memonics:
+                cx = np.where(mask, (cx - 1) & 0xffff, cx)
+                self.registers[CX_POS] = cx
+            is_taken = utils_8086.jump_conditions[memonic](self.flags, cx).astype(bool)
+            # Fixing the +2 offset the decoder adds to guide NASM.
+            target = (next_ips + int(instruction.dest.val) - 2) & 0xffff
+            self.registers[IP_POS] = np.where(mask & is_taken, target, self.registers[IP_POS])
+
+        else:
+            raise NotImplementedError(f"Batch simulation of {memonic} is not implemented yet.")
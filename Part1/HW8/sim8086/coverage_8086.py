@@ -0,0 +1,99 @@
+"""Execution coverage of a 8086 binary.
+
+ExecutionCoverage8086 keeps one bit per byte of the binary, set when an instruction starting
+at that byte ran. Bit i of the binary is bit (i & 7) of byte (i >> 3) of the bitmap, so the
+bitmap file of a 1 KiB binary is 128 bytes and the coverage of many runs merges with a
+bitwise OR (merge_coverage_files, or |= on two ExecutionCoverage8086).
+
+Instructions are marked as they run. step() and run() mark every instruction they sim, the
+two of a fused op included, so a run stopped early or split between a fused op's two
+instructions only marks what ran. The batch engine marks an instruction the first time
+it sims it for any instance.
+
+Author: Soumitra Goswami
+"""
+from __future__ import annotations
+import struct
+import typing as t
+
+from . import instruction_utils_8086 as utils_8086
+
+
+DecodeFunc = t.Callable[[bytes, int], t.Tuple[utils_8086.Instruction, int]]
+
+
+class ExecutionCoverage8086():
+    """Bitmap of the executed instruction starts of a binary of `n_bytes` bytes."""
+    def __init__(self, n_bytes: int, bitmap: t.Optional[bytearray] = None):
+        self.n_bytes = n_bytes
+        if bitmap is None:
+            bitmap = bytearray((n_bytes + 7) >> 3)
+        elif len(bitmap) != (n_bytes + 7) >> 3:
+            raise ValueError(f"Bitmap of {len(bitmap)} bytes doesn't cover a binary of {n_bytes} bytes")
+        self.bitmap = bitmap
+
+    def mark(self, offset: int):
+        self.bitmap[offset >> 3] |= 1 << (offset & 7)
+
+    def is_executed(self, offset: int)->bool:
+        return bool(self.bitmap[offset >> 3] & (1 << (offset & 7)))
+
+    def n_executed(self)->int:
+        return int.from_bytes(self.bitmap, "little").bit_count()
+
+    def copy(self)->ExecutionCoverage8086:
+        return ExecutionCoverage8086(self.n_bytes, bytearray(self.bitmap))
+
+    def __ior__(self, other: ExecutionCoverage8086)->ExecutionCoverage8086:
+        if other.n_bytes != self.n_bytes:
+            raise ValueError(f"Can't merge coverage of a {other.n_bytes} byte binary into a {self.n_bytes} byte one")
+        merged = int.from_bytes(self.bitmap, "little") | int.from_bytes(other.bitmap, "little")
+        self.bitmap[:] = merged.to_bytes(len(self.bitmap), "little")
+        return self
+
+    def write(self, out_path: str):
+        with open(out_path, 'wb') as ofh:
+            ofh.write(self.bitmap)
+
+    @classmethod
+    def from_file(cls, bitmap_path: str, n_bytes: int)->ExecutionCoverage8086:
+        with open(bitmap_path, 'rb') as f:
+            return cls(n_bytes, bytearray(f.read()))
+
+    def listing(self, bin_data: bytes, decode: DecodeFunc)->str:
+        """Linear disassembly of the binary with the instructions that never ran marked.
+        decode(bin_data, offset) returns the instruction and the offset of the next one (SG_HW8.decode_instruction).
+        Bytes that don't decode are listed as db.
+        """
+        lines = []
+        n_instructions = 0
+        n_executed = 0
+        offset = 0
+        while offset < len(bin_data):
+            try:
+                instruction, next_offset = decode(bin_data, offset)
+                text = str(instruction)
+            except (NotImplementedError, KeyError, IndexError, struct.error):
+                instruction, next_offset, text = None, offset + 1, f"db {bin_data[offset]:#04x}"
+            is_executed = self.is_executed(offset)
+            if instruction is not None:
+                n_instructions += 1
+                n_executed += is_executed
+            marker = "" if is_executed else " never ran"
+            lines.append(f"{text} ; {offset:#06x}{marker}")
+            offset = next_offset
+
+        percent = 100 * n_executed / n_instructions if n_instructions else 0
+        output = f"; Coverage: {n_executed}/{n_instructions} instructions ran ({percent:.1f}%)\n"
+        output += "bits 16\n"
+        output += "\n".join(lines) + "\n"
+        return output
+
+
+def merge_coverage_files(bitmap_paths: t.List[str], out_path: str, n_bytes: int)->ExecutionCoverage8086:
+    """ORs the coverage bitmaps of many runs of the same binary together and writes the result to out_path."""
+    merged = ExecutionCoverage8086(n_bytes)
+    for bitmap_path in bitmap_paths:
+        merged |= ExecutionCoverage8086.from_file(bitmap_path, n_bytes)
+    merged.write(out_path)
+    return merged
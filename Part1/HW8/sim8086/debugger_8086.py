@@ -0,0 +1,88 @@
+"""Breakpoints and memory watchpoints for the 8086 simulator.
+
+Breakpoints are a set of IPs the Simulator checks before each instruction, only while the
+set isn't empty. Watchpoints are a MemoryObserver8086 attached only while a watch is set,
+so with none set memory accesses cost the usual single empty observer list check. A watched
+access first checks a per page "has watch" bitmap, so accesses to pages without watches
+return right away and only the rest look at the watched ranges.
+
+A watch hit doesn't stop in the middle of an instruction: it is queued as a DebugEvent8086
+and the Simulator stops after the instruction that made the access.
+
+Author: Soumitra Goswami
+"""
+from __future__ import annotations
+import typing as t
+from dataclasses import dataclass
+
+from . import instruction_utils_8086 as utils_8086
+
+
+@dataclass
+class DebugEvent8086():
+    # "break", "read" or "write"
+    kind: str
+    # IP of the instruction that hit the breakpoint or made the access
+    ip: t.Optional[int] = None
+    mem_loc: int = 0
+    n_bytes: int = 0
+    old_value: int = 0
+    new_value: int = 0
+
+    def __str__(self):
+        ip = "?" if self.ip is None else f"{self.ip:#x}"
+        if self.kind == "break":
+            return f"Breakpoint at ip:{ip}"
+        if self.kind == "read":
+            return f"Watchpoint: read of {self.n_bytes} bytes at {self.mem_loc:#07x} by ip:{ip}"
+        return (f"Watchpoint: write of {self.n_bytes} bytes at {self.mem_loc:#07x} "
+                f"({self.old_value:#x}->{self.new_value:#x}) by ip:{ip}")
+
+
+class Watchpoints8086(utils_8086.MemoryObserver8086):
+    """Read and write watches on physical memory ranges. Hits are appended to `events`."""
+    def __init__(self, mem_layout: utils_8086.MemoryLayout8086, events: t.List[DebugEvent8086]):
+        self.mem_layout = mem_layout
+        self.events = events
+        # (start, end, on_read, on_write). end is exclusive.
+        self.watches: t.List[t.Tuple[int, int, bool, bool]] = []
+        self.page_has_watch = bytearray(len(mem_layout.memory.pages))
+
+    def add(self, start: int, end: int, on_read: bool = False, on_write: bool = True):
+        if not 0 <= start < end <= len(self.mem_layout.memory):
+            raise ValueError(f"Watch range {start:#x}:{end:#x} is outside of the memory")
+        if not self.watches:
+            self.mem_layout.observers.append(self)
+        self.watches.append((start, end, on_read, on_write))
+        self._update_pages()
+
+    def remove(self, start: int, end: int):
+        self.watches = [watch for watch in self.watches if watch[:2] != (start, end)]
+        self._update_pages()
+        if not self.watches and self in self.mem_layout.observers:
+            self.mem_layout.observers.remove(self)
+
+    def _update_pages(self):
+        self.page_has_watch[:] = bytes(len(self.page_has_watch))
+        for start, end, _, _ in self.watches:
+            for page_idx in range(start >> utils_8086.PAGE_SHIFT, ((end - 1) >> utils_8086.PAGE_SHIFT) + 1):
+                self.page_has_watch[page_idx] = 1
+
+    def _hits(self, mem_loc: int, n_bytes: int, is_write: bool)->bool:
+        last = (mem_loc + n_bytes - 1) & utils_8086.PHYSICAL_MASK
+        if not (self.page_has_watch[mem_loc >> utils_8086.PAGE_SHIFT]
+                or self.page_has_watch[last >> utils_8086.PAGE_SHIFT]):
+            return False
+        for start, end, on_read, on_write in self.watches:
+            if (on_write if is_write else on_read) and (start <= mem_loc < end or start <= last < end):
+                return True
+        return False
+
+    def on_mem_read(self, mem_loc: int, n_bytes: int):
+        if self._hits(mem_loc, n_bytes, False):
+            self.events.append(DebugEvent8086("read", mem_loc=mem_loc, n_bytes=n_bytes))
+
+    def on_mem_write(self, mem_loc: int, n_bytes: int, old_value: int, new_value: int):
+        if self._hits(mem_loc, n_bytes, True):
+            self.events.append(DebugEvent8086("write", mem_loc=mem_loc, n_bytes=n_bytes,
+                                              old_value=old_value, new_value=new_value))
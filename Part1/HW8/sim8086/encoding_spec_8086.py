@@ -0,0 +1,261 @@
+"""Declarative encoding table of the 8086 MOV, ADD/SUB/CMP and conditional jump instructions.
+
+Every row of encoding_specs describes one encoding the way the 8086 manual's instruction
+table does: the bit fields of each byte, msb first, with the bytes separated by "|".
+
+    0 / 1          literal opcode bits
+    d, w, s        direction, wide and sign extend bits (1 bit)
+    reg            register (3 bits)
+    sr             segment register (2 bits)
+    mod, rm        register/memory mode and operand (2 and 3 bits), followed by DISP-LO/DISP-HI
+    op             the REG field picking the operation of a group (3 bits, see arith_opcodes)
+    data           immediate data, 16 bits if w
+    data_sw        immediate data, 16 bits if w and not s
+    addr           16 bit direct address
+    disp8          8 bit IP increment of the jumps
+
+Literal bits after the opcode byte document the encoding and aren't checked, like the
+hand written decoders before the table. The dest and src of a row name the fields that fill
+the operands (before a D bit swaps them), with "acc" for the implied accumulator.
+
+A decoder specialized to each row is generated from it, straight line code extracting only
+that row's fields, and a handler decoding with it and simming through sim_instruction. The
+decoders are generated on their first call, so importing doesn't pay for compiling all of them. op_funcs maps the opcode prefixes of every row to its handler, for
+SG_HW8.op_funcs. A new encoding of an existing operation is one more row.
+
+Author: Soumitra Goswami
+"""
+from __future__ import annotations
+import re
+import struct
+import typing as t
+from dataclasses import dataclass
+
+from . import instruction_utils_8086 as utils_8086
+
+
+@dataclass(frozen=True)
+class EncodingSpec():
+    # Name of the handler. The decoder is decode_<name>.
+    name: str
+    # None when the op field picks the operation
+    memonic: t.Optional[str]
+    fields: str
+    dest: str
+    src: t.Optional[str] = None
+    # Log line of the handler
+    desc: str = ""
+
+
+# Reference Manual: Intel 8086 Family User's Manual October 1979
+# Reference page: 4-22 (Instruction set table)
+encoding_specs: t.List[EncodingSpec] = []
+# MOV instruction flavors
+encoding_specs.append(EncodingSpec("mov_between_mem_and_reg", "MOV", "100010 d w | mod reg rm", "rm", "reg",
+                                   "mov between memory and register"))
+encoding_specs.append(EncodingSpec("mov_immediate_to_reg_or_memory", "MOV", "1100011 w | mod 000 rm | data", "rm", "data",
+                                   "mov from immediate to memory or register"))
+encoding_specs.append(EncodingSpec("mov_immediate_to_reg", "MOV", "1011 w reg | data", "reg", "data",
+                                   "mov from immediate to register"))
+encoding_specs.append(EncodingSpec("mov_mem_to_accum", "MOV", "1010000 w | addr", "acc", "addr",
+                                   "mov from memory to accumulator"))
+encoding_specs.append(EncodingSpec("mov_accum_to_mem", "MOV", "1010001 w | addr", "addr", "acc",
+                                   "mov from accumulator to memory"))
+encoding_specs.append(EncodingSpec("mov_between_segs_regs_and_memory", "MOV", "100011 d 0 | mod 0 sr rm", "rm", "sr",
+                                   "mov between segment register and memory/register"))
+# ADD instruction flavors
+encoding_specs.append(EncodingSpec("add_between_register_memory", "ADD", "000000 d w | mod reg rm", "rm", "reg",
+                                   "an add flavor : reg/memory with register to either"))
+encoding_specs.append(EncodingSpec("add_immediate_to_accumulator", "ADD", "0000010 w | data", "acc", "data",
+                                   "an add flavor : Immediate to accumulator"))
+# SUB instruction flavors
+encoding_specs.append(EncodingSpec("sub_between_register_memory", "SUB", "001010 d w | mod reg rm", "rm", "reg",
+                                   "a sub flavor : reg/memory with register to either"))
+encoding_specs.append(EncodingSpec("sub_immediate_from_accumulator", "SUB", "0010110 w | data", "acc", "data",
+                                   "a sub flavor : Immediate from accumulator"))
+# CMP instruction flavors
+encoding_specs.append(EncodingSpec("cmp_between_register_memory", "CMP", "001110 d w | mod reg rm", "rm", "reg",
+                                   "a cmp flavor : reg/memory with register to either"))
+encoding_specs.append(EncodingSpec("cmp_immediate_from_accumulator", "CMP", "0011110 w | data", "acc", "data",
+                                   "a cmp flavor : Immediate from accumulator"))
+# Common arithmetic flavor, the op field picks ADD/ADC/SUB/SBB/CMP
+encoding_specs.append(EncodingSpec("arith_immediate_to_register_memory", None, "100000 s w | mod op rm | data_sw", "rm", "data",
+                                   "an arithmetic flavor : Immediate to register/memory"))
+# JUMP instructions
+for jump_opcode, jump_memonic in utils_8086.jump_opcodes.items():
+    encoding_specs.append(EncodingSpec(f"jmp_{jump_memonic.lower()}", jump_memonic, f"{jump_opcode:08b} | disp8", "disp8",
+                                       desc="a conditional jump"))
+
+
+field_widths = {"d": 1, "w": 1, "s": 1, "reg": 3, "sr": 2, "mod": 2, "rm": 3, "op": 3}
+payload_fields = {"data", "data_sw", "addr", "disp8"}
+
+# Operand fields -> code building the operand. Fields are local variables of the generated decoder.
+operand_code = dict()
+operand_code["rm"] = "op_rm"
+operand_code["reg"] = "Address(reg_field[reg][w], is_register=True, is_wide=(w==1))"
+operand_code["sr"] = "Address(seg_reg_field[sr], is_register=True, is_wide=True)"
+operand_code["acc"] = "Address(reg_field[0b000][w], is_register=True, is_wide=(w==1))"
+operand_code["data"] = "op_data"
+operand_code["addr"] = "op_addr"
+operand_code["disp8"] = "op_disp8"
+
+
+def parse_fields(fields: str)->t.List[t.List[t.Tuple[str, int, int]]]:
+    """Splits the fields into bytes of (field, width, shift). Payload fields come as their own byte."""
+    out = []
+    for byte_fields in fields.split("|"):
+        tokens = byte_fields.split()
+        if len(tokens) == 1 and tokens[0] in payload_fields:
+            out.append([(tokens[0], 0, 0)])
+            continue
+        parsed = []
+        shift = 8
+        for token in tokens:
+            width = len(token) if re.fullmatch("[01]+", token) else field_widths[token]
+            shift -= width
+            parsed.append((token, width, shift))
+        if shift != 0:
+            raise ValueError(f"Byte '{byte_fields}' of '{fields}' isn't 8 bits")
+        out.append(parsed)
+    return out
+
+
+def opcode_keys(spec: EncodingSpec)->t.List[str]:
+    """op_funcs keys of the row: the literal opcode prefix, with any field in front of a literal bit enumerated."""
+    opcode_byte = parse_fields(spec.fields)[0]
+    last_literal = max(idx for idx, (token, _, _) in enumerate(opcode_byte) if token[0] in "01")
+    keys = [""]
+    for token, width, _ in opcode_byte[:last_literal + 1]:
+        if token[0] in "01":
+            keys = [key + token for key in keys]
+        else:
+            keys = [key + format(val, f"0{width}b") for key in keys for val in range(1 << width)]
+    return ["0b" + key for key in keys]
+
+
+def decoder_source(spec: EncodingSpec)->str:
+    """Python source of the decoder specialized to the row."""
+    parsed = parse_fields(spec.fields)
+    fixed_bytes = [byte_fields for byte_fields in parsed if byte_fields[0][0] not in payload_fields]
+    payloads = [byte_fields[0][0] for byte_fields in parsed if byte_fields[0][0] in payload_fields]
+    n_fixed = len(fixed_bytes)
+
+    lines = [f"def decode_{spec.name}(buf, buf_off):"]
+    byte_names = ", ".join(f"b{idx}" for idx in range(n_fixed))
+    lines.append(f"    {byte_names}{',' if n_fixed == 1 else ''} = unpack_{n_fixed}B(buf, buf_off)")
+    lines.append(f"    new_offset = buf_off + {n_fixed}")
+    names = set()
+    for idx, byte_fields in enumerate(fixed_bytes):
+        for token, width, shift in byte_fields:
+            if token[0] in "01":
+                continue
+            names.add(token)
+            if shift + width == 8:
+                lines.append(f"    {token} = b{idx} >> {shift}")
+            elif shift:
+                lines.append(f"    {token} = (b{idx} >> {shift}) & {(1 << width) - 1:#b}")
+            else:
+                lines.append(f"    {token} = b{idx} & {(1 << width) - 1:#b}")
+    if "w" not in names and spec.dest != "disp8":
+        # Encodings without a W bit are word wide
+        lines.append("    w = 1")
+
+    if spec.memonic is None:
+        lines.append("    if op not in arith_opcodes:")
+        lines.append("        raise NotImplementedError(\"This arithmetic operation for immediate to register is not implemented yet.\")")
+        lines.append("    memonic = arith_opcodes[op][\"decode\"]")
+    else:
+        lines.append(f"    memonic = {spec.memonic!r}")
+
+    # DISP-LO/DISP-HI come right after the mod byte, the payload after them
+    if "mod" in names:
+        lines.append("    op_rm, new_offset = decode_mod(buf, new_offset, mod, rm, w)")
+    for payload in payloads:
+        if payload in ("data", "data_sw"):
+            is_word = "w" if payload == "data" else "w and not s"
+            lines.append(f"    if {is_word}:")
+            lines.append("        val, = unpack_h(buf, new_offset)")
+            lines.append("        new_offset += 2")
+            lines.append("    else:")
+            lines.append("        val, = unpack_b(buf, new_offset)")
+            lines.append("        new_offset += 1")
+            lines.append("    op_data = Address(val, is_wide=(w==1))")
+        elif payload == "addr":
+            lines.append("    op_addr = Address(unpack_H(buf, new_offset), is_memory=True, is_wide=(w==1))")
+            lines.append("    new_offset += 2")
+        elif payload == "disp8":
+            # +2 so NASM reads the displacement relative to the jump, it encodes it minus the 2 bytes of the jump.
+            lines.append("    val, = unpack_b(buf, new_offset)")
+            lines.append("    new_offset += 1")
+            lines.append("    op_disp8 = Address(val + 2, is_wide=False, is_displacement=True)")
+
+    lines.append(f"    dest = {operand_code[spec.dest]}")
+    if spec.src is None:
+        lines.append("    return Instruction(memonic, dest=dest), new_offset")
+    else:
+        lines.append(f"    src = {operand_code[spec.src]}")
+        if "d" in names:
+            lines.append("    if d:")
+            lines.append("        dest, src = src, dest")
+        lines.append("    return Instruction(memonic, src, dest), new_offset")
+    return "\n".join(lines) + "\n"
+
+
+# Names the generated decoders see
+decoder_namespace = dict()
+decoder_namespace["Address"] = utils_8086.Address
+decoder_namespace["Instruction"] = utils_8086.Instruction
+decoder_namespace["decode_mod"] = utils_8086.decode_mod
+decoder_namespace["reg_field"] = utils_8086.reg_field
+decoder_namespace["seg_reg_field"] = utils_8086.seg_reg_field
+decoder_namespace["arith_opcodes"] = utils_8086.arith_opcodes
+decoder_namespace["unpack_1B"] = struct.Struct("<B").unpack_from
+decoder_namespace["unpack_2B"] = struct.Struct("<2B").unpack_from
+decoder_namespace["unpack_b"] = struct.Struct("<b").unpack_from
+decoder_namespace["unpack_h"] = struct.Struct("<h").unpack_from
+decoder_namespace["unpack_H"] = struct.Struct("<H").unpack_from
+
+
+def generate_decoder(spec: EncodingSpec)->t.Callable[[bytes, int], t.Tuple[utils_8086.Instruction, int]]:
+    namespace = dict(decoder_namespace)
+    exec(decoder_source(spec), namespace)
+    return namespace[f"decode_{spec.name}"]
+
+
+def lazy_decoder(spec: EncodingSpec)->t.Callable[[bytes, int], t.Tuple[utils_8086.Instruction, int]]:
+    """Decoder generating the row's decoder on its first call."""
+    decoder = None
+    def decode(buf: bytes, buf_off: int)->t.Tuple[utils_8086.Instruction, int]:
+        nonlocal decoder
+        if decoder is None:
+            decoder = generate_decoder(spec)
+        return decoder(buf, buf_off)
+    decode.__name__ = f"decode_{spec.name}"
+    decode.__qualname__ = decode.__name__
+    return decode
+
+
+def generate_handler(spec: EncodingSpec, decoder: t.Callable)->t.Callable:
+    """Handler for op_funcs: decodes the instruction at IP with the row's decoder and sims it."""
+    def handler(buf: bytes, mem_layout: utils_8086.MemoryLayout8086)->t.Tuple[utils_8086.Instruction, str]:
+        ip_old = mem_layout.registers[utils_8086.register_lables["IP"]["pos"]]
+        output, n_bytes = decoder(buf, 0)
+        print(f"I'm doing {spec.desc}. Operation= {output.memonic}")
+        print(f"Dest={output.dest}, Source={output.src}")
+
+        sim_out = utils_8086.sim_instruction(output, ip_old, ip_old + n_bytes, mem_layout)
+        return output, sim_out
+    handler.__name__ = spec.name
+    handler.__qualname__ = spec.name
+    return handler
+
+
+# opcode prefix -> handler, merged into SG_HW8.op_funcs
+op_funcs = dict()
+for spec in encoding_specs:
+    spec_decoder = lazy_decoder(spec)
+    spec_handler = generate_handler(spec, spec_decoder)
+    utils_8086.instruction_decoders[spec_handler] = spec_decoder
+    for key in opcode_keys(spec):
+        op_funcs[key] = spec_handler
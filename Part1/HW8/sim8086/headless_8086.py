@@ -0,0 +1,105 @@
+"""Headless simulator API returning typed results instead of text.
+
+disassemble_CPU8086 builds the listing and the sim log as it goes and the op_funcs handlers
+print every instruction, which is most of the cost when a harness only wants the final
+state. simulate() runs the binary with Simulator.run() (cached ops, no log) and returns a
+SimResult8086 of the final registers, flags, instruction count and clocks. iter_steps()
+runs one instruction at a time and yields a StepRecord8086 per instruction, holding the
+decoded Instruction and the state after it. Nothing is formatted until str() or `text` is
+asked for.
+
+Author: Soumitra Goswami
+"""
+from __future__ import annotations
+import typing as t
+from dataclasses import dataclass
+
+from . import instruction_utils_8086 as utils_8086
+from . import SG_HW8
+
+
+@dataclass
+class SimResult8086():
+    registers: t.List[int]
+    flags: int
+    instruction_count: int
+    # Manual table clocks, and the prefetch queue model clocks if it was on
+    clocks: int
+    modelled_clocks: t.Optional[int] = None
+    is_halted: bool = True
+
+    @classmethod
+    def from_simulator(cls, sim: SG_HW8.Simulator)->SimResult8086:
+        # Flags a fused op skipped, in case the simulator was stopped in between
+        sim.mem_layout.apply_pending_flags()
+        modelled_clocks = sim.prefetch_model.clocks if sim.prefetch_model is not None else None
+        return cls(list(sim.mem_layout.registers), sim.mem_layout.flags, sim.instruction_count,
+                   sim.mem_layout.clocks, modelled_clocks, sim.is_halted)
+
+    def register(self, name: str)->int:
+        """Value of a 16 bit register by name, eg. "AX" or "IP"."""
+        return self.registers[utils_8086.register_lables[name]["pos"]]
+
+    def __str__(self):
+        output = SG_HW8.print_registers(self.registers)
+        output += "Flags: \n" + utils_8086.serialize_flags(self.flags) + '\n'
+        output += f"Instructions: {self.instruction_count}\n"
+        output += f"Clocks: {self.clocks}\n"
+        if self.modelled_clocks is not None:
+            output += f"Modelled clocks: {self.modelled_clocks}\n"
+        return output
+
+
+@dataclass
+class StepRecord8086():
+    # 0 based index of the instruction in the run
+    index: int
+    ip: int
+    instruction: utils_8086.Instruction
+    # State after the instruction
+    next_ip: int
+    registers: t.Tuple[int, ...]
+    flags: int
+    clocks: int
+
+    @property
+    def text(self)->str:
+        return f"{self.instruction} ; ip:{self.ip:#x}->{self.next_ip:#x} Clocks: {self.clocks}"
+
+    def __str__(self):
+        return self.text
+
+
+def simulate(bin_data: bytes, max_instructions: t.Optional[int] = None,
+             prefetch_model: bool = False)->SimResult8086:
+    """Runs the binary to the end (or max_instructions) without building any text.
+    Stopping on max_instructions gives the same registers and flags as stepping that many instructions.
+    """
+    sim = SG_HW8.Simulator(bin_data)
+    if prefetch_model:
+        sim.enable_prefetch_model()
+    sim.run(max_instructions)
+    return SimResult8086.from_simulator(sim)
+
+
+def simulate_file(bin_path: str, max_instructions: t.Optional[int] = None,
+                  prefetch_model: bool = False)->SimResult8086:
+    with open(bin_path, "rb") as f:
+        return simulate(f.read(), max_instructions, prefetch_model)
+
+
+def iter_steps(sim: SG_HW8.Simulator, max_instructions: t.Optional[int] = None)->t.Iterator[StepRecord8086]:
+    """Runs the simulator one instruction at a time, yielding a record of each.
+    SimResult8086.from_simulator(sim) gives the final state once it is exhausted.
+    """
+    mem_layout = sim.mem_layout
+    registers = mem_layout.registers
+    count = 0
+    while not sim.is_halted and (max_instructions is None or count < max_instructions):
+        index = sim.instruction_count
+        ip = registers[12]
+        instruction, _ = sim._decode(ip)
+        if not sim.run(1):
+            break
+        yield StepRecord8086(index, ip, instruction, registers[12], tuple(registers), mem_layout.flags, mem_layout.clocks)
+        count += 1
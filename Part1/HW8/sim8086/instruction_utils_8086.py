@@ -0,0 +1,1723 @@
+"""
+Supported:
+Decoding complete flavors of : MOV, conditional Jumps, ADD, ADC, SUB, SBB, CMP
+Simming of all varieties of MOVs, ADD, SUB, CMP.
+Segment registers with 20 bit physical addresses and segment override prefixes.
+Implementation of flags for Carry(C), Auxilary Overflow(A), Overflow(O), Parity (P), Sign (S), Zero (Z). 
+Implementation of JNE/NZ Jump and IP register.
+
+Author: Soumitra Goswami
+
+"""
+from __future__ import annotations
+import os
+import struct
+import typing as t
+from array import array
+from dataclasses import dataclass, replace
+
+
+
+
+# simulation
+register_lables = dict()
+register_lables['AX'] = {"pos": 0, "bytes": 2, "is_high" : 0 }
+register_lables['AL'] = {"pos": 0, "bytes": 1, "is_high" : 0 }
+register_lables['AH'] = {"pos": 0, "bytes": 1, "is_high" : 1 }
+register_lables['BX'] = {"pos": 1, "bytes": 2, "is_high" : 0 }
+register_lables['BL'] = {"pos": 1, "bytes": 1, "is_high" : 0 }
+register_lables['BH'] = {"pos": 1, "bytes": 1, "is_high" : 1 }
+register_lables['CX'] = {"pos": 2, "bytes": 2, "is_high" : 0 }
+register_lables['CL'] = {"pos": 2, "bytes": 1, "is_high" : 0 }
+register_lables['CH'] = {"pos": 2, "bytes": 1, "is_high" : 1 }
+register_lables['DX'] = {"pos": 3, "bytes": 2, "is_high" : 0 }
+register_lables['DL'] = {"pos": 3, "bytes": 1, "is_high" : 0 }
+register_lables['DH'] = {"pos": 3, "bytes": 1, "is_high" : 1 }
+register_lables['SP'] = {"pos": 4, "bytes": 2, "is_high" : 0 }
+register_lables['BP'] = {"pos": 5, "bytes": 2, "is_high" : 0 }
+register_lables['SI'] = {"pos": 6, "bytes": 2, "is_high" : 0 }
+register_lables['DI'] = {"pos": 7, "bytes": 2, "is_high" : 0 }
+# segment registers
+register_lables["ES"] = {"pos": 8, "bytes": 2, "is_high" : 0 }
+register_lables["CS"] = {"pos": 9, "bytes": 2, "is_high" : 0 }
+register_lables["SS"] = {"pos": 10,"bytes": 2, "is_high" : 0 }
+register_lables["DS"] = {"pos": 11,"bytes": 2, "is_high" : 0 }
+
+# IP register
+register_lables["IP"] = {"pos": 12,"bytes": 2, "is_high" : 0 }
+
+flag_bit_positions = dict()
+flag_bit_positions['C'] = 0
+flag_bit_positions['P'] = 2
+flag_bit_positions['A'] = 4
+flag_bit_positions['Z'] = 6
+flag_bit_positions['S'] = 7
+flag_bit_positions['T'] = 8
+flag_bit_positions['I'] = 9
+flag_bit_positions['D'] = 10
+flag_bit_positions['O'] = 11
+
+
+# Registry Tables
+reg_field = [None]*8
+reg_field[0b000] = ['AL', 'AX']
+reg_field[0b001] = ['CL', 'CX']
+reg_field[0b010] = ['DL', 'DX']
+reg_field[0b011] = ['BL', 'BX']
+reg_field[0b100] = ['AH', 'SP']
+reg_field[0b101] = ['CH', 'BP']
+reg_field[0b110] = ['DH', 'SI']
+reg_field[0b111] = ['BH', 'DI']
+
+seg_reg_field = dict()
+seg_reg_field[0b00] = 'ES'
+seg_reg_field[0b01] = 'CS'
+seg_reg_field[0b10] = 'SS'
+seg_reg_field[0b11] = 'DS'
+
+
+# Address Encoding
+encode_address = [None]*8
+encode_address[0b000] = ["BX", "SI"]
+encode_address[0b001] = ["BX", "DI"]
+encode_address[0b010] = ["BP", "SI"]
+encode_address[0b011] = ["BP", "DI"]
+encode_address[0b100] = ["SI"]
+encode_address[0b101] = ["DI"]
+encode_address[0b110] = ["BP"]
+encode_address[0b111] = ["BX"]
+
+# Paged Memory
+PAGE_SHIFT = 12
+PAGE_SIZE = 1 << PAGE_SHIFT
+PAGE_MASK = PAGE_SIZE - 1
+MEMORY_SIZE = 1024*1024
+# Physical addresses are 20 bits
+PHYSICAL_MASK = 0xfffff
+# Longest instruction fetched at once. 6 bytes of instruction plus prefixes.
+MAX_INSTRUCTION_BYTES = 8
+
+class PagedMemory8086():
+    """1 MiB of byte memory split into 4 KiB pages.
+
+    Pages are shared between a memory and its forks and only copied when one side writes
+    to them (copy on write). Forking is a copy of the page table, not of the memory.
+    """
+    def __init__(self, size: int = MEMORY_SIZE):
+        n_pages = (size + PAGE_MASK) >> PAGE_SHIFT
+        # Every page starts out pointing at a single shared zero page.
+        zero_page = bytearray(PAGE_SIZE)
+        self.pages: t.List[bytearray] = n_pages*[zero_page]
+        # 1 if this memory is the only owner of the page and can write to it in place.
+        self.owned = bytearray(n_pages)
+
+    def __len__(self):
+        return len(self.pages) << PAGE_SHIFT
+
+    def __getitem__(self, mem_loc: int)->int:
+        return self.pages[mem_loc >> PAGE_SHIFT][mem_loc & PAGE_MASK]
+
+    def __setitem__(self, mem_loc: int, val: int):
+        page_idx = mem_loc >> PAGE_SHIFT
+        if not self.owned[page_idx]:
+            self._own_page(page_idx)
+        self.pages[page_idx][mem_loc & PAGE_MASK] = val
+
+    def _own_page(self, page_idx: int):
+        self.pages[page_idx] = bytearray(self.pages[page_idx])
+        self.owned[page_idx] = 1
+
+    def read_block(self, mem_loc: int, n_bytes: int)->bytes:
+        out = bytearray()
+        end = mem_loc + n_bytes
+        while mem_loc < end:
+            page_off = mem_loc & PAGE_MASK
+            chunk = min(PAGE_SIZE - page_off, end - mem_loc)
+            out += self.pages[mem_loc >> PAGE_SHIFT][page_off:page_off + chunk]
+            mem_loc += chunk
+        return bytes(out)
+
+    def views(self, mem_loc: int, n_bytes: int)->t.List[memoryview]:
+        """Zero copy memoryviews over the pages covering mem_loc to mem_loc + n_bytes."""
+        out = []
+        end = mem_loc + n_bytes
+        while mem_loc < end:
+            page_off = mem_loc & PAGE_MASK
+            chunk = min(PAGE_SIZE - page_off, end - mem_loc)
+            out.append(memoryview(self.pages[mem_loc >> PAGE_SHIFT])[page_off:page_off + chunk])
+            mem_loc += chunk
+        return out
+
+    def write_block(self, mem_loc: int, data: bytes):
+        data = memoryview(data)
+        pos = 0
+        while pos < len(data):
+            page_idx = mem_loc >> PAGE_SHIFT
+            page_off = mem_loc & PAGE_MASK
+            chunk = min(PAGE_SIZE - page_off, len(data) - pos)
+            if not self.owned[page_idx]:
+                self._own_page(page_idx)
+            self.pages[page_idx][page_off:page_off + chunk] = data[pos:pos + chunk]
+            mem_loc += chunk
+            pos += chunk
+
+    def fork(self)->PagedMemory8086:
+        """Returns a copy of the memory sharing all pages. Both sides copy a page on their next write to it."""
+        forked = PagedMemory8086.__new__(PagedMemory8086)
+        forked.pages = list(self.pages)
+        forked.owned = bytearray(len(self.pages))
+        self.owned = bytearray(len(self.pages))
+        return forked
+
+
+class MemoryObserver8086():
+    """Base class for anything that wants to see the memory accesses of a MemoryLayout8086.
+    Observers are only called when at least one is attached, so an empty list costs a single check.
+    """
+    def on_mem_read(self, mem_loc: int, n_bytes: int):
+        pass
+
+    def on_mem_write(self, mem_loc: int, n_bytes: int, old_value: int, new_value: int):
+        pass
+
+
+@dataclass
+class MemoryLayout8086():
+    registers:t.List[int] = None
+    flags: bytes = 0b0
+    memory:PagedMemory8086 = None
+    observers:t.List[MemoryObserver8086] = None
+    # Estimated clocks simmed so far (8086 manual timings)
+    clocks: int = 0
+    # Per page: 1 if decoded instructions from it are cached. A write into such a page marks it in
+    # dirty_code_pages and sets is_code_dirty, so the cache drops the stale decodes before the next fetch.
+    code_pages: bytearray = None
+    dirty_code_pages: bytearray = None
+    is_code_dirty: bool = False
+    # segment register -> segment << 4. Only recomputed when a segment register is written.
+    segment_bases: t.Dict[str, int] = None
+    # (dest, src, is_add, n_bytes) of the last fused op that skipped writing the flags because
+    # the code after it overwrites them. Cleared by the next flags write. See apply_pending_flags.
+    pending_flags: t.Optional[t.Tuple[int, int, bool, int]] = None
+
+    def __post_init__(self):
+        if self.registers is None:
+            self.registers = 13*[0]
+        if self.memory is None:
+            self.memory = PagedMemory8086()
+        if self.observers is None:
+            self.observers = []
+        if self.code_pages is None:
+            self.code_pages = bytearray(len(self.memory.pages))
+        if self.dirty_code_pages is None:
+            self.dirty_code_pages = bytearray(len(self.memory.pages))
+        if self.segment_bases is None:
+            self.segment_bases = dict()
+        self.update_segment_bases()
+
+    def update_segment_bases(self):
+        """Recomputes the cached segment bases. Needed after writing segment registers straight into `registers`."""
+        for segment in seg_reg_field.values():
+            self.segment_bases[segment] = self.registers[register_lables[segment]["pos"]] << 4
+
+    def apply_pending_flags(self):
+        """Writes the flags a fused op skipped. Needed when a run stops before the code that overwrites them."""
+        if self.pending_flags is not None:
+            _, arith_flags = alu(*self.pending_flags)
+            self.flags = (self.flags & ~arith_flags_mask) | arith_flags
+            self.pending_flags = None
+
+    def snapshot(self)->MemoryLayout8086:
+        """Checkpoints registers, flags and memory. Memory pages are shared copy on write,
+        so the cost doesn't depend on the memory size. The snapshot is a full layout
+        and can be simmed on to fork the run.
+        """
+        return MemoryLayout8086(registers=list(self.registers), flags=self.flags, memory=self.memory.fork(), clocks=self.clocks)
+
+    def restore(self, snapshot: MemoryLayout8086):
+        """Rolls this layout back to a snapshot. The snapshot stays untouched and can be restored again."""
+        self.registers[:] = snapshot.registers
+        self.flags = snapshot.flags
+        self.pending_flags = None
+        old_pages = self.memory.pages
+        self.memory = snapshot.memory.fork()
+        self.clocks = snapshot.clocks
+        self.update_segment_bases()
+        # Code pages that differ from the snapshot hold stale decodes.
+        for page_idx, is_code in enumerate(self.code_pages):
+            if is_code and old_pages[page_idx] is not self.memory.pages[page_idx]:
+                self._mark_code_dirty(page_idx)
+
+    def fetch(self, mem_loc: int)->bytes:
+        """Instruction bytes at mem_loc, enough for the longest instruction."""
+        page_off = mem_loc & PAGE_MASK
+        if page_off + MAX_INSTRUCTION_BYTES <= PAGE_SIZE:
+            return bytes(self.memory.pages[mem_loc >> PAGE_SHIFT][page_off:page_off + MAX_INSTRUCTION_BYTES])
+        return self.memory.read_block(mem_loc, MAX_INSTRUCTION_BYTES)
+
+    def load_program(self, bin_data: bytes, mem_loc: int = 0):
+        self.write_block(mem_loc, bin_data)
+
+    def mark_code(self, mem_loc: int, n_bytes: int):
+        """Marks the pages holding the instruction bytes at mem_loc as cached code."""
+        for page_idx in range(mem_loc >> PAGE_SHIFT, ((mem_loc + n_bytes - 1) >> PAGE_SHIFT) + 1):
+            self.code_pages[page_idx] = 1
+
+    def _mark_code_dirty(self, page_idx: int):
+        self.code_pages[page_idx] = 0
+        self.dirty_code_pages[page_idx] = 1
+        self.is_code_dirty = True
+
+    def write_block(self, mem_loc: int, data: bytes):
+        """Block write for bulk operations. Observers are not called."""
+        self.memory.write_block(mem_loc, data)
+        for page_idx in range(mem_loc >> PAGE_SHIFT, ((mem_loc + len(data) - 1) >> PAGE_SHIFT) + 1):
+            if self.code_pages[page_idx]:
+                self._mark_code_dirty(page_idx)
+
+    def get_reg_value(self, address: Address):
+        val = 0
+        if not address.is_register:
+            print(f"address : {address} is not a register. Returning 0")
+            return val
+        reg = register_lables[address.val] 
+        val = self.registers[reg['pos']]
+        src_nbytes = reg["bytes"]
+        src_is_high = reg["is_high"]
+        if src_nbytes == 1:
+            val = (val)>> 8 if src_is_high else (val & 0x00ff)
+            
+        return val 
+    
+    def set_reg_value(self, address: Address, val:t.Any):
+        reg = register_lables[address.val]
+        old_reg_val = self.registers[reg['pos']]
+        dest_nbytes = reg["bytes"]
+        dest_is_high = reg["is_high"]
+        if dest_nbytes == 2: 
+            self.registers[reg['pos']] = val
+            if address.val in self.segment_bases:
+                self.segment_bases[address.val] = val << 4
+        else:
+            bit_mask = 0xff00 if dest_is_high else 0x00ff
+            val = val << 8 if dest_is_high else val
+            self.registers[reg['pos']] = (old_reg_val & ~(bit_mask))  + (val & bit_mask)
+
+        return old_reg_val
+    
+    def get_mem_location(self, address:Address)->int:
+        """Physical address of a memory operand: (segment << 4) + effective address, wrapped at 1 MiB."""
+        # Take into consideration any displacement provided
+        mem_loc = address.mem_displacement
+        segment = address.segment
+        # if memory needs to be derived from register values we first get the memory locations
+        if address.mem_from_reg:
+            for reg in address.val:
+                reg_pos = register_lables[reg]["pos"]
+                mem_loc += self.registers[reg_pos]
+            # Addressing through BP defaults to the stack segment
+            if segment is None:
+                segment = "SS" if "BP" in address.val else "DS"
+        else:    
+            mem_loc += address.val[0] # memory address that's explicity stored
+            if segment is None:
+                segment = "DS"
+        # Effective addresses wrap around at 16 bits
+        return (self.segment_bases[segment] + (mem_loc & 0xffff)) & PHYSICAL_MASK
+
+    def get_mem_value(self, address:Address):
+        val = 0 
+        if not address.is_memory:
+            print(f"Address: {address} is not a memory address. Returning 0")
+            return val
+        
+        mem_loc = self.get_mem_location(address)
+        if self.observers:
+            for observer in self.observers:
+                observer.on_mem_read(mem_loc, 2 if address.is_wide else 1)
+        if not address.is_wide:
+            val = self.memory[mem_loc]
+            return val
+        
+        # 8086 is little endian. Low byte is stored first.
+        val = self.memory[mem_loc] | (self.memory[(mem_loc + 1) & PHYSICAL_MASK] << 8)
+
+        return val
+
+
+    def set_mem_value(self, address:Address, val:t.Any):
+        if not address.is_memory:
+            print(f"Address: {address} is not a memory address. Returning None")
+            return
+        
+        mem_loc = self.get_mem_location(address)
+        old_value = 0
+        if not address.is_wide:
+            old_value = self.memory[mem_loc]
+            self.memory[mem_loc] = val & 0xff
+        else:
+            old_value = self.memory[mem_loc] | (self.memory[(mem_loc + 1) & PHYSICAL_MASK] << 8)
+            self.memory[mem_loc] = val & 0x00ff
+            self.memory[(mem_loc + 1) & PHYSICAL_MASK] = (val >> 8) & 0xff
+
+        code_pages = self.code_pages
+        if code_pages[mem_loc >> PAGE_SHIFT]:
+            self._mark_code_dirty(mem_loc >> PAGE_SHIFT)
+        if address.is_wide and code_pages[((mem_loc + 1) & PHYSICAL_MASK) >> PAGE_SHIFT]:
+            self._mark_code_dirty(((mem_loc + 1) & PHYSICAL_MASK) >> PAGE_SHIFT)
+
+        if self.observers:
+            n_bytes = 2 if address.is_wide else 1
+            new_value = val & (0xffff if address.is_wide else 0xff)
+            for observer in self.observers:
+                observer.on_mem_write(mem_loc, n_bytes, old_value, new_value)
+        return old_value
+
+
+@dataclass(frozen=True)
+class Address():
+    val: t.Any
+    mem_displacement: t.Optional[int] = 0 
+    is_register: t.Optional[bool] = False
+    is_memory: t.Optional[bool] = False
+    is_displacement: t.Optional[bool] = False 
+    is_wide: t.Optional[bool] = True
+    mem_from_reg:t.Optional[bool] = False
+    # Segment override prefix. None uses DS, or SS when addressing through BP.
+    segment:t.Optional[str] = None
+    # Far pointer immediate, val is (segment, offset)
+    is_far:t.Optional[bool] = False
+
+    def __str__(self):
+        if self.is_memory:
+            val_str = self.val[0] if (len(self.val) < 2) else f"{self.val[0]} + {self.val[1]}"
+            segment_str = f"{self.segment}:" if self.segment is not None else ""
+            if self.mem_displacement == 0:
+                return f"{segment_str}[{val_str}]"
+            return f"{segment_str}[{val_str}{self.mem_displacement:+}]"
+        if self.is_displacement:
+            return f"${self.val:+}"
+        if self.is_far:
+            return f"{self.val[0]}:{self.val[1]}"
+        
+        return f"{self.val}"
+    
+    @property
+    def flags(self):
+        f_val = 0
+        f_val |= int(self.is_register) # encode register flag
+        f_val |= (int(self.is_memory) << 1) # encode memory flag
+        f_val |= (int(self.is_displacement) << 2) # encode displacement flag 
+        return f_val
+
+    @property
+    def is_immediate(self):
+        return self.flags == 0
+    
+    
+        
+@dataclass (frozen=True)
+class Instruction():
+    memonic: str
+    src: t.Optional[Address] = None
+    dest: t.Optional[Address] = None
+
+    def __str__(self):
+        if self.src is None and self.dest is None:
+            return f"{self.memonic}"
+        
+        elif self.dest is None:
+            # String instructions only carry their source, when it has a segment override
+            return f"{self.src.segment} {self.memonic}"
+
+        elif self.src is None:
+            if self.dest.is_memory and self.memonic in ("PUSH", "POP"):
+                return f"{self.memonic} word {self.dest}"
+            return f"{self.memonic} {self.dest}"
+
+        if self.src.is_immediate and self.dest.is_memory:
+            src_dtype = "word" if self.src.is_wide else "byte"
+            return f"{self.memonic} {src_dtype} {self.dest}, {self.src}"
+        return f"{self.memonic} {self.dest}, {self.src}"
+
+
+def serialize_flags(flags: int)->str:
+    '''
+    flags 
+    bit     Description
+    0      C : Carry Flag
+    1      U : Undefined
+    2      P : Parity Flag
+    3      U : Undefined
+    4      A : Auxiliary Carry Flag
+    5      U : Undefined
+    6      Z : Zero Flag
+    7      S : Sign Flag
+    8      T : Trap Flag
+    9      I : Interupt Flag
+    10      D : Direction Flag
+    11      O : Overflow Flag
+    12-15   U : Undefined
+    '''
+    lables = dict()
+    lables[0] = 'C'
+    lables[2] = 'P'
+    lables[4] = 'A'
+    lables[6] = 'Z'
+    lables[7] = 'S'
+    lables[8] = 'T'
+    lables[9] = 'I'
+    lables[10] = 'D'
+    lables[11] = 'O'
+    output = ''
+    for flag_pos in lables.keys(): 
+        flag_val = flags>>flag_pos & 1
+        if flag_val == 1:
+            output += lables[flag_pos]
+
+    return output
+
+def decode_mod(buf:bytes, buff_off:int, mod_code:int, rm_field:int, is_wide:int)->t.Tuple[Address, Address, int]:
+    """Decoding MOD field of the instruction set. 
+       Reference Manual: Intel 8086 Family User's Manual October 1979
+       Reference page: 4-20
+    """
+    new_offset=buff_off
+    if mod_code > 3:
+            raise KeyError(f"{mod_code} incorrect. Mod code needs to be 2 bits")
+    
+    if mod_code == 0b11:
+        decode_str = Address(reg_field[rm_field][is_wide], is_register=True, is_wide=(is_wide==1))
+    elif (mod_code==0b00 and rm_field!=0b110):
+        decode_str = Address(encode_address[rm_field], is_memory=True, is_wide=(is_wide==1), mem_from_reg=True) 
+        
+    elif mod_code == 0b00 and rm_field == 0b110:
+        # Direct addresses are always 16 bit, even for byte operations
+        buffer = struct.unpack_from('H', buf, offset=new_offset)
+        new_offset += 2
+        decode_str = Address(buffer, is_memory=True, is_wide=(is_wide==1))
+    else:
+        byte_code = 'h' if mod_code==2 else 'b'
+        byte_offset = 2 if mod_code==2 else 1
+        buffer = struct.unpack_from(byte_code, buf, offset=new_offset)
+        new_offset += byte_offset
+        val = buffer[0]
+        decode_str = Address(encode_address[rm_field], mem_displacement=val, is_memory=True, is_wide=(is_wide==1), mem_from_reg= True) # This needs to change when simulating memory 
+
+
+    return decode_str, new_offset
+
+# DECODING
+# Each handler in op_funcs has a decode only counterpart. They take the buffer and the offset of the
+# instruction and return the decoded instruction and the offset of the next one, without touching
+# any simulation state. The handlers decode with these and sim the result with sim_instruction().
+# Handlers are given the instruction bytes fetched from memory at IP (MemoryLayout8086.fetch) and decode at 0.
+# The MOV, ADD/SUB/CMP and jump decoders and handlers are generated from the table in encoding_spec_8086.
+
+
+# CLOCK ESTIMATION
+# Reference Manual: Intel 8086 Family User's Manual October 1979
+# Reference page: 2-51 (Instruction timings), 2-70 (Effective address calculation time)
+def ea_clocks(address:Address)->int:
+    """Clocks to calculate the effective address of a memory operand."""
+    if not address.is_memory:
+        return 0
+    # Segment overrides take 2 more
+    override = 2 if address.segment is not None else 0
+    if not address.mem_from_reg:
+        return 6 + override # Displacement only
+    has_disp = address.mem_displacement != 0
+    if len(address.val) == 1:
+        return (9 if has_disp else 5) + override
+    # BP + DI and BX + SI are a clock faster than BP + SI and BX + DI
+    base_index = 7 if address.val in (["BP", "DI"], ["BX", "SI"]) else 8
+    return (base_index + 4 if has_disp else base_index) + override
+
+def operand_kind(address:Address)->str:
+    if address.is_register:
+        return "reg"
+    if address.is_memory:
+        return "mem"
+    return "imm"
+
+# (dest kind, src kind) -> (clocks without EA, memory transfers)
+# The segment register MOVs take as long as the general register ones.
+instruction_clocks = dict()
+instruction_clocks["MOV"] = dict()
+instruction_clocks["MOV"][("reg", "reg")] = (2, 0)
+instruction_clocks["MOV"][("reg", "mem")] = (8, 1)
+instruction_clocks["MOV"][("mem", "reg")] = (9, 1)
+instruction_clocks["MOV"][("reg", "imm")] = (4, 0)
+instruction_clocks["MOV"][("mem", "imm")] = (10, 1)
+instruction_clocks["MOV"][("acc", "mem")] = (10, 1)
+instruction_clocks["MOV"][("mem", "acc")] = (10, 1)
+instruction_clocks["ADD"] = dict()
+instruction_clocks["ADD"][("reg", "reg")] = (3, 0)
+instruction_clocks["ADD"][("reg", "mem")] = (9, 1)
+instruction_clocks["ADD"][("mem", "reg")] = (16, 2)
+instruction_clocks["ADD"][("reg", "imm")] = (4, 0)
+instruction_clocks["ADD"][("mem", "imm")] = (17, 2)
+instruction_clocks["ADC"] = instruction_clocks["ADD"]
+instruction_clocks["SUB"] = instruction_clocks["ADD"]
+instruction_clocks["SBB"] = instruction_clocks["ADD"]
+instruction_clocks["CMP"] = dict()
+instruction_clocks["CMP"][("reg", "reg")] = (3, 0)
+instruction_clocks["CMP"][("reg", "mem")] = (9, 1)
+instruction_clocks["CMP"][("mem", "reg")] = (9, 1)
+instruction_clocks["CMP"][("reg", "imm")] = (4, 0)
+instruction_clocks["CMP"][("mem", "imm")] = (10, 1)
+
+# Every word transfer to or from an odd address costs 4 more clocks.
+odd_address_clocks = 4
+
+def base_clocks(instruction:Instruction)->t.Tuple[int, int]:
+    """Clocks of a MOV/arithmetic instruction, EA included, without the odd address penalty.
+    Returns the clocks and the number of memory transfers.
+    """
+    dest_kind = operand_kind(instruction.dest)
+    src_kind = operand_kind(instruction.src)
+    mem_decode = instruction.src if src_kind == "mem" else instruction.dest
+    # MOV between the accumulator and a direct address has its own encoding without an EA.
+    if instruction.memonic == "MOV" and mem_decode.is_memory and not mem_decode.mem_from_reg:
+        other = instruction.dest if src_kind == "mem" else instruction.src
+        if other.is_register and other.val in ("AX", "AL"):
+            if src_kind == "mem":
+                return instruction_clocks["MOV"][("acc", "mem")]
+            return instruction_clocks["MOV"][("mem", "acc")]
+    clocks, transfers = instruction_clocks[instruction.memonic][(dest_kind, src_kind)]
+    return clocks + ea_clocks(mem_decode), transfers
+
+def estimate_clocks(instruction:Instruction, mem_layout:MemoryLayout8086)->int:
+    """Clocks of a MOV/arithmetic instruction on the current state (the odd address penalty depends on it)."""
+    clocks, transfers = base_clocks(instruction)
+    mem_decode = instruction.src if instruction.src.is_memory else instruction.dest
+    if transfers and mem_decode.is_wide and (mem_layout.get_mem_location(mem_decode) & 1):
+        clocks += odd_address_clocks * transfers
+    return clocks
+
+
+# Segment override prefixes (001 SR 110). The prefixed instruction is decoded by SG_HW8.decode_instruction.
+segment_override_prefixes = dict()
+segment_override_prefixes[0x26] = "ES"
+segment_override_prefixes[0x2e] = "CS"
+segment_override_prefixes[0x36] = "SS"
+segment_override_prefixes[0x3e] = "DS"
+
+def override_segment(instruction:Instruction, segment:str)->Instruction:
+    """Applies a segment override to the memory operands of a decoded instruction.
+    String instructions override their DS:SI source, the ES:DI destination can't be overridden.
+    """
+    if instruction.memonic in string_memonics:
+        is_wide = string_memonics[instruction.memonic][1]
+        return Instruction(instruction.memonic, src=replace(string_si_address[is_wide], segment=segment))
+    src = instruction.src
+    dest = instruction.dest
+    if src is not None and src.is_memory:
+        src = replace(src, segment=segment)
+    if dest is not None and dest.is_memory:
+        dest = replace(dest, segment=segment)
+    return Instruction(instruction.memonic, src=src, dest=dest)
+
+
+# SIMULATION
+def mov_sim(src_decode:Address, dest_decode:Address, mem_layout:MemoryLayout8086)->str:
+    if src_decode.is_register:
+        src_val = mem_layout.get_reg_value(src_decode)
+    elif src_decode.is_memory:
+        src_val = mem_layout.get_mem_value(src_decode)
+    else:
+        src_val = src_decode.val & (0xffff if src_decode.is_wide else 0xff)
+
+    reg_move_str = ""
+    if dest_decode.is_register:
+        old_reg_val = mem_layout.set_reg_value(dest_decode, src_val)
+        reg_move_str =f"; {dest_decode}:{old_reg_val:#06x}->{src_val:#06x}"
+    elif dest_decode.is_memory:
+        mem_layout.set_mem_value(dest_decode, src_val)
+    return reg_move_str
+
+
+def sim_instruction(instruction:Instruction, ip_old:int, new_offset:int, mem_layout:MemoryLayout8086)->str:
+    """Sims a decoded instruction whose bytes span ip_old to new_offset. Moves IP past it
+    (or to the jump target) and returns the sim log line.
+    """
+    mem_layout.registers[12] = new_offset # IP Register
+    memonic = instruction.memonic
+    if memonic in jump_conditions:
+        ip_new = jmp_sim(instruction, mem_layout)
+        mem_layout.registers[12] = ip_new
+        return f"{instruction}; {f' ip:{ip_old:#x}->{ip_new:#x}'} \n"
+
+    ip_str = f" ip:{ip_old:#x}->{new_offset:#x}"
+    if memonic == "MOV":
+        mem_layout.clocks += estimate_clocks(instruction, mem_layout)
+        reg_move_str = mov_sim(instruction.src, instruction.dest, mem_layout)
+        return f"{instruction}{reg_move_str}{ip_str} \n"
+    if memonic in arith_memonics:
+        mem_layout.clocks += estimate_clocks(instruction, mem_layout)
+        sim_out = arith_sim(instruction.src, instruction.dest, mem_layout, arith_memonics[memonic], ip_str)
+        return f"{instruction}{sim_out}"
+    if memonic in string_memonics:
+        sim_out = string_sim(instruction, mem_layout, ip_str)
+        return f"{instruction}{sim_out}"
+    if memonic in stack_memonics:
+        sim_out = stack_sim(instruction, ip_old, mem_layout)
+        return f"{instruction}{sim_out}"
+    raise NotImplementedError(f"Simulation of {memonic} is not implemented yet.")
+
+
+def calc_flags(flags: int, res: int, val_dest:int, val_src:int, arith_op:int, n_bytes: t.Optional[int] = 2)->int:
+    """Flag semantics of set_flags without the logging.
+    Operands and result are expected unsigned within n_bytes. Only shifts, masks and +/- are used,
+    so the same code computes flags for plain ints and for signed integer NumPy arrays.
+    """
+    most_significant_bit = 8 * n_bytes - 1
+    value_mask = (1 << (8 * n_bytes)) - 1
+    usgn_src = val_src & value_mask
+    usgn_dest = val_dest & value_mask
+    usgn_res = res & value_mask
+
+    flags_new = flags
+    # Parity Flag Calculation
+    mask = 1 << flag_bit_positions['P']
+    low_nibble = usgn_res & 0xff
+    parity_flag = low_nibble ^ (low_nibble >> 1)
+    parity_flag = parity_flag ^ (parity_flag >> 2)
+    parity_flag = parity_flag ^ (parity_flag >> 4)
+    parity_flag = (~parity_flag) & 1
+    flags_new = (flags_new & ~mask) | (parity_flag << flag_bit_positions['P'])
+    # setting sign flag
+    mask= 1 << flag_bit_positions['S']
+
+    sign_flag = (usgn_res >> most_significant_bit) & 1
+    flags_new = (flags_new & ~mask) | (sign_flag << flag_bit_positions['S'])
+
+    # setting zero flag
+    # (res - 1) only goes negative, setting the bits above the value, when res is 0.
+    mask= 1 << flag_bit_positions['Z']
+    zero_flag = ((usgn_res - 1) >> (most_significant_bit + 1)) & 1
+    flags_new = (flags_new & ~mask) | (zero_flag << flag_bit_positions['Z'])
+
+    # calc overflow flag
+
+    """ Truth Table Overflow flag
+    (FOR ADD)
+    src     dest    res     expected    Notes
+    0       0       0       0           (+a) + (+b) = (+c)
+    0       0       1       1           (+a) + (+b) = (-c) (OVERFLOW)
+    0       1       0       0           (+a) + (-b) = (+c) (if a > b)
+    0       1       1       0           (+a) + (-b) = (-c) (if b > a)
+    1       0       0       0           (-a) + (+b) = (+c) (if b > a)
+    1       0       1       0           (-a) + (+b) = (-c) (if a > b)
+    1       1       0       1           (-a) + (-b) = (+c) (OVERFLOW)
+    1       1       1       0           (-a) + (-b) = (-c)
+
+    (For SUB (dest - src) )
+    src     dest    res     expected    Notes
+    0       0       0       0           -(+a) + (+b) = (+c) (if b > a)
+    0       0       1       0           -(+a) + (+b) = (-c) (if a > b)
+    0       1       0       1           -(+a) + (-b) = (+c) (OVERFLOW)
+    0       1       1       0           -(+a) + (-b) = (-c)
+    1       0       0       0           -(-a) + (+b) = (+c)
+    1       0       1       1           -(-a) + (+b) = (-c) (OVERFLOW)
+    1       1       0       0           -(-a) + (-b) = (+c) (if a > b)
+    1       1       1       0           -(-a) + (-b) = (-c) (if b > a)
+    """
+    sign_bit_src = (usgn_src >> most_significant_bit) & 1
+    sign_bit_dest = (usgn_dest >> most_significant_bit) & 1
+    sign_bit_res = (usgn_res >> most_significant_bit) & 1
+
+    mask = 1 << flag_bit_positions['O']
+
+    if arith_op % 2 == 0:
+        overflow_flag = ((~sign_bit_src ^ sign_bit_dest) & (sign_bit_dest ^ sign_bit_res)) & 1
+    else:
+        overflow_flag =  ((sign_bit_src^sign_bit_dest) & ~(sign_bit_src ^ sign_bit_res)) & 1
+
+    flags_new = (flags_new & ~mask) | (overflow_flag << flag_bit_positions['O'])
+
+    """ Understanding Auxilary Flag
+    5th bit Truth Table
+    dest    src     res     AF
+    0       0       0       0
+    0       0       1       1
+    0       1       0       1
+    0       1       1       0
+    1       0       0       1
+    1       0       1       0
+    1       1       0       0
+    1       1       1       1
+
+    """
+    mask = 1 << flag_bit_positions['A']
+    auxilary_flag = ((usgn_src ^ usgn_dest ^ usgn_res) >> 4) & 1
+    flags_new = (flags_new & ~mask) | (auxilary_flag << flag_bit_positions['A'])
+
+    """ Undesrtanding Carry Flag
+    The requirement changes for additions and subtractions
+    (ADD Carry Out)
+    8th/16th bit truth table
+
+    dest(a) src(b)  res(r)  CF      Notes
+    0       0       0       0       small numbers being added not large enough for 8th/16th bit
+    0       0       1       0       small numbers added turning on the 8th/16th bit
+    0       1       0       1       CARRY. Overflow of the 8th/16th bit.
+    0       1       1       0       Numbers being added not overflowing.
+    1       0       0       0       CARRY. Overflow of the 8th/16th bit.
+    1       0       1       0       Number being added not overflowing.
+    1       1       0       1       CARRY. Numbers being added causing overflow
+    1       1       1       1       Will always overflow as two sign bit numbers added.
+
+    SUB (Carry in/Borrow)
+    Its simple. In a-b, if b > a its a borrow.
+    Both are the bit just above the value in the unmasked sum/difference.
+    """
+    mask = 1 << flag_bit_positions['C']
+    if arith_op % 2 == 0:
+        carry_flag = ((usgn_dest + usgn_src) >> (most_significant_bit + 1)) & 1
+    else:
+        carry_flag = ((usgn_dest - usgn_src) >> (most_significant_bit + 1)) & 1
+    flags_new = (flags_new & ~mask) | (carry_flag << flag_bit_positions['C'])
+
+    return flags_new
+
+
+def set_flags(flags: bytes, res: bytes, val_dest:bytes, val_src:bytes, arith_op:bytes, n_bytes: t.Optional[int] = 2)->t.Tuple[bytes,str]:
+    # Generate flags
+    flags_old = flags
+    flags_new = calc_flags(flags, res, val_dest, val_src, arith_op, n_bytes)
+
+    flags_str = ""
+    if flags_new != flags_old:
+        flags_str = f" flags: {serialize_flags(flags_old)}->{serialize_flags(flags_new)} "
+
+    return flags_new, flags_str
+
+# ALU TABLES
+# Byte ADD/SUB results and arithmetic flags for every (dest << 8) | src, and the parity flag of
+# every low byte. Flags are packed at their flag_bit_positions: C 0, P 2, A 4, Z 6, S 7, O 11.
+# The byte tables take a few hundred ms to build, so they are only built on the first byte
+# ADD/SUB/CMP, and kept in a cache file next to the bytecode for the next runs.
+arith_flags_mask = 0
+for flag in "CPAZSO":
+    arith_flags_mask |= 1 << flag_bit_positions[flag]
+
+parity_flags = array('H', [(1 - (bin(val).count("1") & 1)) << flag_bit_positions['P'] for val in range(256)])
+
+def word_alu(dest:int, src:int, is_add:bool)->t.Tuple[int, int]:
+    """Result and packed arithmetic flags of a word dest +/- src."""
+    full = dest + src if is_add else dest - src
+    res = full & 0xffff
+    flags = parity_flags[res & 0xff] | ((full >> 16) & 1) | ((dest ^ src ^ res) & 0x10) | ((res >> 8) & 0x80)
+    if res == 0:
+        flags |= 0x40
+    if is_add:
+        flags |= (((dest ^ res) & (src ^ res)) >> 4) & 0x800
+    else:
+        flags |= (((dest ^ src) & (dest ^ res)) >> 4) & 0x800
+    return res, flags
+
+def build_byte_alu_tables(is_add:bool)->t.Tuple[array, array]:
+    results = array('B', bytes(0x10000))
+    flags = array('H', bytes(0x20000))
+    for dest in range(256):
+        for src in range(256):
+            full = dest + src if is_add else dest - src
+            res = full & 0xff
+            res_flags = parity_flags[res] | ((full >> 8) & 1) | ((dest ^ src ^ res) & 0x10) | (res & 0x80)
+            if res == 0:
+                res_flags |= 0x40
+            if is_add:
+                res_flags |= (((dest ^ res) & (src ^ res)) << 4) & 0x800
+            else:
+                res_flags |= (((dest ^ src) & (dest ^ res)) << 4) & 0x800
+            results[(dest << 8) | src] = res
+            flags[(dest << 8) | src] = res_flags
+    return results, flags
+
+# Bump when build_byte_alu_tables changes, so stale cache files aren't loaded
+BYTE_ALU_TABLES_VERSION = 1
+byte_alu_cache_path = os.path.join(os.path.dirname(os.path.abspath(__file__)), "__pycache__",
+                                   f"byte_alu_tables_8086_v{BYTE_ALU_TABLES_VERSION}.bin")
+# (add results, add flags, sub results, sub flags), None until the first byte ADD/SUB
+byte_alu_tables: t.Optional[t.Tuple[array, array, array, array]] = None
+
+def load_byte_alu_tables()->t.Tuple[array, array, array, array]:
+    """Loads the byte ALU tables from the cache file, or builds them and tries to write it."""
+    global byte_alu_tables
+    if byte_alu_tables is not None:
+        return byte_alu_tables
+    tables = (array('B'), array('H'), array('B'), array('H'))
+    try:
+        with open(byte_alu_cache_path, 'rb') as f:
+            for table in tables:
+                table.fromfile(f, 0x10000)
+    except (OSError, EOFError):
+        tables = build_byte_alu_tables(True) + build_byte_alu_tables(False)
+        try:
+            os.makedirs(os.path.dirname(byte_alu_cache_path), exist_ok=True)
+            # Written aside and renamed, so a process loading it never sees half a file
+            tmp_path = f"{byte_alu_cache_path}.{os.getpid()}"
+            with open(tmp_path, 'wb') as ofh:
+                for table in tables:
+                    table.tofile(ofh)
+            os.replace(tmp_path, byte_alu_cache_path)
+        except OSError:
+            pass # Read only install, build them again next time
+    byte_alu_tables = tables
+    return tables
+
+def alu(dest:int, src:int, is_add:bool, n_bytes:int)->t.Tuple[int, int]:
+    """Result and packed arithmetic flags of dest +/- src. Operands are unsigned within n_bytes."""
+    if n_bytes == 1:
+        add_results, add_flags, sub_results, sub_flags = byte_alu_tables or load_byte_alu_tables()
+        idx = (dest << 8) | src
+        if is_add:
+            return add_results[idx], add_flags[idx]
+        return sub_results[idx], sub_flags[idx]
+    return word_alu(dest, src, is_add)
+
+
+# ARITHMETIC INSTRUCTIONS
+arith_opcodes = dict()
+arith_opcodes[0b000] = {"decode" : "ADD", "desc": "I'm doing an add. Flavor : Immediate to register/memory"}
+arith_opcodes[0b010] = {"decode" : "ADC", "desc": "I'm doing an add with carry. Flavor : Immediate to register/memory"}
+arith_opcodes[0b101] = {"decode" : "SUB", "desc": "I'm doing an sub. Flavor : Immediate from register/memory"}
+arith_opcodes[0b011] = {"decode" : "SBB", "desc": "I'm doing an subtract with borrow. Flavor : Immediate from register/memory"}
+arith_opcodes[0b111] = {"decode" : "CMP", "desc": "I'm doing a compare. Flavor : Immediate from register/memory"}
+
+# memonic -> arith opcode, so decoded instructions can be simmed without the opcode byte.
+arith_memonics = dict()
+for arith_opcode, arith_decode in arith_opcodes.items():
+    arith_memonics[arith_decode["decode"]] = arith_opcode
+
+
+def arith_sim(src_decode:Address, dest_decode:Address, mem_layout:MemoryLayout8086, arith_opcode: bytes, ip_str:str)->str:
+    # Simming
+    sim_out = ""
+    if src_decode.is_immediate:
+        src_val = src_decode.val
+    elif src_decode.is_memory:
+        src_val = mem_layout.get_mem_value(src_decode)
+    elif src_decode.is_register:
+        src_val = mem_layout.get_reg_value(src_decode)
+
+    dest_nbytes = 2 if dest_decode.is_wide else 1
+    src_val = src_val & (0xffff if dest_nbytes == 2 else 0xff)
+    old_reg_val=0
+    if dest_decode.is_memory:
+        old_reg_val = mem_layout.get_mem_value(dest_decode)
+    elif dest_decode.is_register:
+        old_reg_val = mem_layout.get_reg_value(dest_decode)
+
+    # All the add opcodes are even while sub opcodes are odd.
+    # CMP (0b111) is a sub opcode without saving the value.
+    is_add = (arith_opcode % 2) == 0
+    new_val, arith_flags = alu(old_reg_val, src_val, is_add, dest_nbytes)
+
+    # Do not set value if it's a CMP operator (0b111).
+    reg_activity=""
+    if arith_opcode != 0b111:
+        stored_val = new_val
+        if dest_decode.is_memory:
+            mem_layout.set_mem_value(dest_decode, new_val)
+        elif dest_decode.is_register:
+            mem_layout.set_reg_value(dest_decode, new_val)
+            stored_val = mem_layout.registers[register_lables[dest_decode.val]['pos']]
+        reg_activity=f"{dest_decode}:{old_reg_val:#06x}->{stored_val:#06x} "
+
+    flags_old = mem_layout.flags
+    mem_layout.flags = (flags_old & ~arith_flags_mask) | arith_flags
+    mem_layout.pending_flags = None
+    flags_str = ""
+    if mem_layout.flags != flags_old:
+        flags_str = f" flags: {serialize_flags(flags_old)}->{serialize_flags(mem_layout.flags)} "
+
+    sim_out = f"; {reg_activity}{ip_str}{flags_str} \n"
+
+    return sim_out
+
+# JUMP instructions
+jump_opcodes = dict()
+jump_opcodes[0b01110100] = "JE"
+jump_opcodes[0b01111100] = "JL"
+jump_opcodes[0b01111110] = "JLE"
+jump_opcodes[0b01110010] = "JB"
+jump_opcodes[0b01110110] = "JBE"
+jump_opcodes[0b01111010] = "JP"
+jump_opcodes[0b01110000] = "JO"
+jump_opcodes[0b01111000] = "JS"
+jump_opcodes[0b01110101] = "JNE"
+jump_opcodes[0b01111101] = "JNL"
+jump_opcodes[0b01111111] = "JNLE"
+jump_opcodes[0b01110011] = "JNB"
+jump_opcodes[0b01110111] = "JNBE"
+jump_opcodes[0b01111011] = "JNP"
+jump_opcodes[0b01110001] = "JNO"
+jump_opcodes[0b01111001] = "JNS"
+jump_opcodes[0b11100010] = "LOOP"
+jump_opcodes[0b11100001] = "LOOPZ"
+jump_opcodes[0b11100000] = "LOOPNZ"
+jump_opcodes[0b11100011] = "JCXZ"
+
+# Jump conditions. Each takes the flags and CX (after the LOOP decrement) and returns 1 if the jump is taken.
+# Only shifts and masks are used so they work on NumPy arrays of flags too.
+jump_conditions = dict()
+jump_conditions["JE"] = lambda flags, cx: (flags >> flag_bit_positions['Z']) & 1
+jump_conditions["JL"] = lambda flags, cx: ((flags >> flag_bit_positions['S']) ^ (flags >> flag_bit_positions['O'])) & 1
+jump_conditions["JLE"] = lambda flags, cx: (((flags >> flag_bit_positions['S']) ^ (flags >> flag_bit_positions['O'])) | (flags >> flag_bit_positions['Z'])) & 1
+jump_conditions["JB"] = lambda flags, cx: (flags >> flag_bit_positions['C']) & 1
+jump_conditions["JBE"] = lambda flags, cx: ((flags >> flag_bit_positions['C']) | (flags >> flag_bit_positions['Z'])) & 1
+jump_conditions["JP"] = lambda flags, cx: (flags >> flag_bit_positions['P']) & 1
+jump_conditions["JO"] = lambda flags, cx: (flags >> flag_bit_positions['O']) & 1
+jump_conditions["JS"] = lambda flags, cx: (flags >> flag_bit_positions['S']) & 1
+jump_conditions["JNE"] = lambda flags, cx: jump_conditions["JE"](flags, cx) ^ 1
+jump_conditions["JNL"] = lambda flags, cx: jump_conditions["JL"](flags, cx) ^ 1
+jump_conditions["JNLE"] = lambda flags, cx: jump_conditions["JLE"](flags, cx) ^ 1
+jump_conditions["JNB"] = lambda flags, cx: jump_conditions["JB"](flags, cx) ^ 1
+jump_conditions["JNBE"] = lambda flags, cx: jump_conditions["JBE"](flags, cx) ^ 1
+jump_conditions["JNP"] = lambda flags, cx: jump_conditions["JP"](flags, cx) ^ 1
+jump_conditions["JNO"] = lambda flags, cx: jump_conditions["JO"](flags, cx) ^ 1
+jump_conditions["JNS"] = lambda flags, cx: jump_conditions["JS"](flags, cx) ^ 1
+# (cx - 1) >> 16 is 1 only when cx is 0
+jump_conditions["LOOP"] = lambda flags, cx: (((cx - 1) >> 16) & 1) ^ 1
+jump_conditions["LOOPZ"] = lambda flags, cx: jump_conditions["LOOP"](flags, cx) & jump_conditions["JE"](flags, cx)
+jump_conditions["LOOPNZ"] = lambda flags, cx: jump_conditions["LOOP"](flags, cx) & jump_conditions["JNE"](flags, cx)
+jump_conditions["JCXZ"] = lambda flags, cx: ((cx - 1) >> 16) & 1
+
+# Jumps that decrement CX before checking their condition.
+loop_memonics = {"LOOP", "LOOPZ", "LOOPNZ"}
+
+# Clocks of every jump as (not taken, taken), indexed by the jump condition.
+jump_clocks = dict()
+for memonic in jump_conditions.keys():
+    jump_clocks[memonic] = (4, 16)
+jump_clocks["LOOP"] = (5, 17)
+jump_clocks["LOOPZ"] = (6, 18)
+jump_clocks["LOOPNZ"] = (5, 19)
+jump_clocks["JCXZ"] = (6, 18)
+
+def jmp_sim(instruction: Instruction, mem_layout:MemoryLayout8086):
+    new_ip = mem_layout.registers[12] # IP Register
+    flags = mem_layout.flags
+    cx_pos = register_lables['CX']['pos']
+    if instruction.memonic in loop_memonics:
+        mem_layout.registers[cx_pos] = (mem_layout.registers[cx_pos] - 1) & 0xffff
+    is_taken = jump_conditions[instruction.memonic](flags, mem_layout.registers[cx_pos])
+    mem_layout.clocks += jump_clocks[instruction.memonic][is_taken]
+    if is_taken:
+        displacement = int(instruction.dest.val)
+        new_ip += displacement - 2 # Fixing the +2 offset we performed earlier to guide NASM.
+    return new_ip
+
+
+# STRING INSTRUCTIONS
+# Reference Manual: Intel 8086 Family User's Manual October 1979
+# Reference page: 2-35 String instructions, 4-27 REP
+string_opcodes = dict()
+string_opcodes[0b1010010] = "MOVS"
+string_opcodes[0b1010011] = "CMPS"
+string_opcodes[0b1010101] = "STOS"
+string_opcodes[0b1010110] = "LODS"
+string_opcodes[0b1010111] = "SCAS"
+
+rep_prefixes = dict()
+rep_prefixes[0xf2] = "REPNE"
+rep_prefixes[0xf3] = "REP"
+
+# Clocks of one string instruction and of every repetition under a REP prefix. Each word
+# transfer per element through an odd SI/DI costs odd_address_clocks more.
+string_clocks = dict()
+string_clocks["MOVS"] = {"single": 18, "rep": 17}
+string_clocks["CMPS"] = {"single": 22, "rep": 22}
+string_clocks["SCAS"] = {"single": 15, "rep": 15}
+string_clocks["LODS"] = {"single": 12, "rep": 13}
+string_clocks["STOS"] = {"single": 11, "rep": 10}
+rep_clocks = 9
+
+# memonic -> (operation, is_wide, repeat prefix)
+string_memonics = dict()
+for operation in string_opcodes.values():
+    for suffix, is_wide in (("B", False), ("W", True)):
+        string_memonics[f"{operation}{suffix}"] = (operation, is_wide, None)
+        string_memonics[f"REPNE {operation}{suffix}"] = (operation, is_wide, "REPNE")
+        # CMPS and SCAS repeat while equal, the others just repeat.
+        rep = "REPE" if operation in ("CMPS", "SCAS") else "REP"
+        string_memonics[f"{rep} {operation}{suffix}"] = (operation, is_wide, rep)
+
+# Operations that read DS:SI and write/compare ES:DI.
+string_uses_si = {"MOVS", "CMPS", "LODS"}
+string_uses_di = {"MOVS", "CMPS", "STOS", "SCAS"}
+
+string_si_address = [Address(["SI"], is_memory=True, is_wide=False, mem_from_reg=True),
+                     Address(["SI"], is_memory=True, is_wide=True, mem_from_reg=True)]
+string_di_address = [Address(["DI"], is_memory=True, is_wide=False, mem_from_reg=True, segment="ES"),
+                     Address(["DI"], is_memory=True, is_wide=True, mem_from_reg=True, segment="ES")]
+string_accumulator = [Address("AL", is_register=True, is_wide=False),
+                      Address("AX", is_register=True, is_wide=True)]
+
+
+def decode_string_instruction(buf:bytes, buf_off:int)->t.Tuple[Instruction, int]:
+    '''
+    Byte 1 (optional)
+    REP prefix (1111001)                                    - 7 bits
+    Repeat while zero (Z)                                   - 1 bit
+
+    Byte 2
+    OP_CODE                                                 - 7 bits
+    is wide (W)                                             - 1 bit
+    '''
+    new_offset = buf_off
+    buffer = struct.unpack_from('B', buf, offset=new_offset)
+    new_offset += 1
+
+    prefix = None
+    if buffer[0] in rep_prefixes:
+        prefix = buffer[0]
+        buffer = struct.unpack_from('B', buf, offset=new_offset)
+        new_offset += 1
+
+    opcode = buffer[0] >> 1
+    if opcode not in string_opcodes:
+        raise NotImplementedError(f"REP prefix before {buffer[0]:#04x} is not implemented yet.")
+    operation = string_opcodes[opcode]
+    memonic = f"{operation}{'W' if buffer[0] & 1 else 'B'}"
+    if prefix is not None:
+        rep = rep_prefixes[prefix]
+        if rep == "REP" and operation in ("CMPS", "SCAS"):
+            rep = "REPE"
+        memonic = f"{rep} {memonic}"
+    return Instruction(memonic), new_offset
+
+
+def string_element_sim(operation:str, is_wide:bool, si_address:Address, mem_layout:MemoryLayout8086, delta:int)->t.Tuple[int, int]:
+    """Sims one element of a string instruction and steps SI/DI. Returns the compared (dest, src) for CMPS/SCAS."""
+    registers = mem_layout.registers
+    dest_val = src_val = 0
+    if operation == "MOVS":
+        val = mem_layout.get_mem_value(si_address)
+        mem_layout.set_mem_value(string_di_address[is_wide], val)
+    elif operation == "STOS":
+        mem_layout.set_mem_value(string_di_address[is_wide], mem_layout.get_reg_value(string_accumulator[is_wide]))
+    elif operation == "LODS":
+        mem_layout.set_reg_value(string_accumulator[is_wide], mem_layout.get_mem_value(si_address))
+    elif operation == "CMPS":
+        dest_val = mem_layout.get_mem_value(si_address)
+        src_val = mem_layout.get_mem_value(string_di_address[is_wide])
+    else: # SCAS
+        dest_val = mem_layout.get_reg_value(string_accumulator[is_wide])
+        src_val = mem_layout.get_mem_value(string_di_address[is_wide])
+
+    if operation in string_uses_si:
+        registers[6] = (registers[6] + delta) & 0xffff
+    if operation in string_uses_di:
+        registers[7] = (registers[7] + delta) & 0xffff
+    return dest_val, src_val
+
+
+def string_bulk_sim(operation:str, is_wide:bool, rep:str, mem_layout:MemoryLayout8086, count:int,
+                    si_segment:str = "DS")->t.Optional[t.Tuple[int, int, int]]:
+    """Sims `count` forward repetitions as block operations on the paged memory.
+    Returns (repetitions done, dest, src) of the last compare, or None when the block can't be
+    done at once and has to go element by element.
+    """
+    registers = mem_layout.registers
+    size = 2 if is_wide else 1
+    n_bytes = count * size
+    # SI/DI wrapping around mid block goes element by element.
+    if (operation in string_uses_si and registers[6] + n_bytes > 0x10000) or (operation in string_uses_di and registers[7] + n_bytes > 0x10000):
+        return None
+    si = mem_layout.segment_bases[si_segment] + registers[6]
+    di = mem_layout.segment_bases["ES"] + registers[7]
+    if si + n_bytes > PHYSICAL_MASK + 1 or di + n_bytes > PHYSICAL_MASK + 1:
+        return None
+    memory = mem_layout.memory
+    accumulator = string_accumulator[is_wide]
+
+    if operation == "MOVS":
+        # A destination inside the source block reads back bytes the copy just wrote.
+        if si < di < si + n_bytes:
+            return None
+        mem_layout.write_block(di, memory.read_block(si, n_bytes))
+        return count, 0, 0
+    if operation == "STOS":
+        val = mem_layout.get_reg_value(accumulator)
+        mem_layout.write_block(di, val.to_bytes(size, "little") * count)
+        return count, 0, 0
+    if operation == "LODS":
+        # Only the last element loaded stays in the accumulator.
+        last = si + n_bytes - size
+        mem_layout.set_reg_value(accumulator, int.from_bytes(memory.read_block(last, size), "little"))
+        return count, 0, 0
+    if is_wide:
+        return None
+
+    if operation == "SCAS":
+        al = mem_layout.get_reg_value(accumulator)
+        data = memory.read_block(di, n_bytes)
+        if rep == "REPNE":
+            idx = data.find(al)
+        else:
+            idx = n_bytes - len(data.lstrip(bytes([al])))
+        if idx < 0 or idx >= n_bytes:
+            return count, al, data[-1]
+        return idx + 1, al, data[idx]
+
+    # CMPS
+    if rep != "REPE":
+        return None
+    si_block = memoryview(memory.read_block(si, n_bytes))
+    di_block = memoryview(memory.read_block(di, n_bytes))
+    if si_block == di_block:
+        return count, si_block[-1], di_block[-1]
+    # Binary search for the first byte that differs.
+    lo, hi = 0, n_bytes - 1
+    while lo < hi:
+        mid = (lo + hi) // 2
+        if si_block[lo:mid + 1] == di_block[lo:mid + 1]:
+            lo = mid + 1
+        else:
+            hi = mid
+    return lo + 1, si_block[lo], di_block[lo]
+
+
+def string_sim(instruction:Instruction, mem_layout:MemoryLayout8086, ip_str:str)->str:
+    operation, is_wide, rep = string_memonics[instruction.memonic]
+    # A segment override prefix leaves its DS:SI replacement in src
+    si_address = string_si_address[is_wide] if instruction.src is None else instruction.src
+    registers = mem_layout.registers
+    cx_old, si_old, di_old = registers[2], registers[6], registers[7]
+    delta = -1 if (mem_layout.flags >> flag_bit_positions['D']) & 1 else 1
+    if is_wide:
+        delta *= 2
+    timing = string_clocks[operation]
+    # SI/DI only move by even amounts on words, so an odd address stays odd for the whole run.
+    n_odd = 0
+    if is_wide:
+        n_odd += (operation in string_uses_si) and (si_old & 1)
+        n_odd += (operation in string_uses_di) and (di_old & 1)
+    is_compare = operation in ("CMPS", "SCAS")
+    n_bytes = 2 if is_wide else 1
+    last_compare = None
+
+    if rep is None:
+        last_compare = string_element_sim(operation, is_wide, si_address, mem_layout, delta)
+        n_reps = 1
+        mem_layout.clocks += timing["single"]
+    else:
+        n_reps = 0
+        count = cx_old
+        bulk = None
+        if count > 0 and delta > 0 and not mem_layout.observers:
+            bulk = string_bulk_sim(operation, is_wide, rep, mem_layout, count, si_address.segment or "DS")
+        if bulk is not None:
+            n_reps, dest_val, src_val = bulk
+            if is_compare:
+                last_compare = (dest_val, src_val)
+            step = n_reps * delta
+            if operation in string_uses_si:
+                registers[6] = (si_old + step) & 0xffff
+            if operation in string_uses_di:
+                registers[7] = (di_old + step) & 0xffff
+        else:
+            while n_reps < count:
+                last_compare = string_element_sim(operation, is_wide, si_address, mem_layout, delta)
+                n_reps += 1
+                if is_compare:
+                    is_equal = ((last_compare[0] - last_compare[1]) & (0xffff if is_wide else 0xff)) == 0
+                    if is_equal != (rep == "REPE"):
+                        break
+        registers[2] = (cx_old - n_reps) & 0xffff
+        mem_layout.clocks += rep_clocks + timing["rep"] * n_reps
+    mem_layout.clocks += odd_address_clocks * n_odd * n_reps
+    # Segment override prefix, as in estimate_clocks
+    if si_address.segment is not None:
+        mem_layout.clocks += 2
+
+    flags_str = ""
+    if is_compare and last_compare is not None:
+        dest_val, src_val = last_compare
+        res = (dest_val - src_val) & (0xffff if is_wide else 0xff)
+        mem_layout.flags, flags_str = set_flags(mem_layout.flags, res, dest_val, src_val, 0b111, n_bytes)
+
+    reg_activity = ""
+    for name, pos, old in (("CX", 2, cx_old), ("SI", 6, si_old), ("DI", 7, di_old)):
+        if registers[pos] != old:
+            reg_activity += f"{name}:{old:#06x}->{registers[pos]:#06x} "
+    return f"; {reg_activity}{ip_str}{flags_str} \n"
+
+
+def string_instruction(buf:bytes, mem_layout:MemoryLayout8086)->t.Tuple[Instruction, str]:
+    """Reference Manual: Intel 8086 Family User's Manual October 1979
+       Reference page: 4-22 MOVS/CMPS/SCAS/LODS/STOS, REP
+    """
+    print("I'm doing a string instruction")
+    ip_old = mem_layout.registers[register_lables["IP"]["pos"]]
+    output, n_bytes = decode_string_instruction(buf, 0)
+    print(f"string operation: {output.memonic}")
+
+    sim_out = sim_instruction(output, ip_old, ip_old + n_bytes, mem_layout)
+    return output, sim_out
+
+
+# STACK INSTRUCTIONS
+# Reference Manual: Intel 8086 Family User's Manual October 1979
+# Reference page: 4-22 PUSH, POP, PUSHF, POPF, CALL, RET
+stack_memonics = {"PUSH", "POP", "PUSHF", "POPF", "CALL", "CALL FAR", "RET", "RETF"}
+
+# Clocks by operand kind (see stack_operand_kind), EA not included.
+stack_clocks = dict()
+stack_clocks["PUSH"] = {"reg": 11, "seg": 10, "mem": 16}
+stack_clocks["POP"] = {"reg": 8, "seg": 8, "mem": 17}
+stack_clocks["PUSHF"] = {None: 10}
+stack_clocks["POPF"] = {None: 8}
+stack_clocks["CALL"] = {"disp": 19, "reg": 16, "mem": 21}
+stack_clocks["CALL FAR"] = {"far": 28, "mem": 37}
+stack_clocks["RET"] = {None: 8, "imm": 12}
+stack_clocks["RETF"] = {None: 18, "imm": 17}
+
+# Flag bits that exist on the 8086. POPF leaves the others clear.
+flags_mask = 0
+for flag_pos in flag_bit_positions.values():
+    flags_mask |= 1 << flag_pos
+
+stack_top_address = Address(["SP"], is_memory=True, is_wide=True, mem_from_reg=True, segment="SS")
+
+def stack_operand_kind(address:t.Optional[Address])->t.Optional[str]:
+    if address is None:
+        return None
+    if address.is_far:
+        return "far"
+    if address.is_displacement:
+        return "disp"
+    if address.is_register:
+        return "seg" if address.val in seg_reg_field.values() else "reg"
+    if address.is_memory:
+        return "mem"
+    return "imm"
+
+def stack_word_clocks(mem_layout:MemoryLayout8086, address:Address)->int:
+    """Odd address penalty of a word transfer."""
+    return odd_address_clocks if mem_layout.get_mem_location(address) & 1 else 0
+
+def stack_push(mem_layout:MemoryLayout8086, val:int):
+    mem_layout.registers[4] = (mem_layout.registers[4] - 2) & 0xffff # SP
+    mem_layout.clocks += stack_word_clocks(mem_layout, stack_top_address)
+    mem_layout.set_mem_value(stack_top_address, val)
+
+def stack_pop(mem_layout:MemoryLayout8086)->int:
+    mem_layout.clocks += stack_word_clocks(mem_layout, stack_top_address)
+    val = mem_layout.get_mem_value(stack_top_address)
+    mem_layout.registers[4] = (mem_layout.registers[4] + 2) & 0xffff # SP
+    return val
+
+def get_operand_value(address:Address, mem_layout:MemoryLayout8086)->int:
+    if address.is_register:
+        return mem_layout.get_reg_value(address)
+    mem_layout.clocks += stack_word_clocks(mem_layout, address)
+    return mem_layout.get_mem_value(address)
+
+
+def decode_push_pop_register(buf:bytes, buf_off:int)->t.Tuple[Instruction, int]:
+    '''
+    Byte 1
+    OP_CODE (0101)                                          - 4 bits
+    is POP                                                  - 1 bit
+    REG                                                     - 3 bits
+    '''
+    buffer = struct.unpack_from('B', buf, offset=buf_off)
+    memonic = "POP" if (buffer[0] >> 3) & 1 else "PUSH"
+    dest_decode = Address(reg_field[buffer[0] & 0b111][1], is_register=True)
+    return Instruction(memonic, dest=dest_decode), buf_off + 1
+
+def decode_push_pop_segment_register(buf:bytes, buf_off:int)->t.Tuple[Instruction, int]:
+    '''
+    Byte 1
+    OP_CODE (000)                                           - 3 bits
+    SEG REG (SR)                                            - 2 bits
+    OP_CODE (11)                                            - 2 bits
+    is POP                                                  - 1 bit
+    '''
+    buffer = struct.unpack_from('B', buf, offset=buf_off)
+    memonic = "POP" if buffer[0] & 1 else "PUSH"
+    dest_decode = Address(seg_reg_field[(buffer[0] >> 3) & 0b11], is_register=True)
+    return Instruction(memonic, dest=dest_decode), buf_off + 1
+
+def decode_pop_register_memory(buf:bytes, buf_off:int)->t.Tuple[Instruction, int]:
+    '''
+    Byte 1
+    OP_CODE (10001111)                                      - 8 bits
+
+    Byte 2
+    MOD                                                     - 2 bits
+    000                                                     - 3 bits
+    R/M                                                     - 3 bits
+    '''
+    buffer = struct.unpack_from('2B', buf, offset=buf_off)
+    dest_decode, new_offset = decode_mod(buf, buf_off + 2, buffer[1] >> 6, buffer[1] & 0b111, 1)
+    return Instruction("POP", dest=dest_decode), new_offset
+
+# 11111111 group. The REG field picks the operation.
+group_ff_memonics = dict()
+group_ff_memonics[0b010] = "CALL"
+group_ff_memonics[0b011] = "CALL FAR"
+group_ff_memonics[0b110] = "PUSH"
+
+def decode_call_push_register_memory(buf:bytes, buf_off:int)->t.Tuple[Instruction, int]:
+    '''
+    Byte 1
+    OP_CODE (11111111)                                      - 8 bits
+
+    Byte 2
+    MOD                                                     - 2 bits
+    010 CALL, 011 CALL FAR, 110 PUSH                        - 3 bits
+    R/M                                                     - 3 bits
+    '''
+    buffer = struct.unpack_from('2B', buf, offset=buf_off)
+    op_code = (buffer[1] >> 3) & 0b111
+    if op_code not in group_ff_memonics:
+        raise NotImplementedError(f"Operation {op_code:#05b} of opcode 0xff is not implemented yet.")
+    dest_decode, new_offset = decode_mod(buf, buf_off + 2, buffer[1] >> 6, buffer[1] & 0b111, 1)
+    return Instruction(group_ff_memonics[op_code], dest=dest_decode), new_offset
+
+def decode_call_within_segment(buf:bytes, buf_off:int)->t.Tuple[Instruction, int]:
+    '''
+    Byte 1
+    OP_CODE (11101000)                                      - 8 bits
+
+    Byte 2/3
+    IP-INC                                                  - 16 bits
+    '''
+    buffer = struct.unpack_from('<h', buf, offset=buf_off + 1)
+    # +3 so NASM reads the displacement relative to the CALL like the jumps (see the disp8 field in encoding_spec_8086).
+    dest_decode = Address(buffer[0] + 3, is_displacement=True)
+    return Instruction("CALL", dest=dest_decode), buf_off + 3
+
+def decode_call_intersegment(buf:bytes, buf_off:int)->t.Tuple[Instruction, int]:
+    '''
+    Byte 1
+    OP_CODE (10011010)                                      - 8 bits
+
+    Byte 2/3
+    offset                                                  - 16 bits
+
+    Byte 4/5
+    segment                                                 - 16 bits
+    '''
+    offset, segment = struct.unpack_from('<HH', buf, offset=buf_off + 1)
+    dest_decode = Address((segment, offset), is_far=True)
+    return Instruction("CALL FAR", dest=dest_decode), buf_off + 5
+
+def decode_return_from_call(buf:bytes, buf_off:int)->t.Tuple[Instruction, int]:
+    '''
+    Byte 1
+    OP_CODE (1100)                                          - 4 bits
+    is intersegment                                         - 1 bit
+    OP_CODE (01)                                            - 2 bits
+    no immediate                                            - 1 bit
+
+    Byte 2/3 (if immediate)
+    data added to SP                                        - 16 bits
+    '''
+    buffer = struct.unpack_from('B', buf, offset=buf_off)
+    memonic = "RETF" if (buffer[0] >> 3) & 1 else "RET"
+    if buffer[0] & 1:
+        return Instruction(memonic), buf_off + 1
+    data = struct.unpack_from('<H', buf, offset=buf_off + 1)
+    return Instruction(memonic, dest=Address(data[0])), buf_off + 3
+
+def decode_push_pop_flags(buf:bytes, buf_off:int)->t.Tuple[Instruction, int]:
+    buffer = struct.unpack_from('B', buf, offset=buf_off)
+    return Instruction("POPF" if buffer[0] & 1 else "PUSHF"), buf_off + 1
+
+
+def stack_sim(instruction:Instruction, ip_old:int, mem_layout:MemoryLayout8086)->str:
+    """Sims the stack instructions. IP is already past the instruction, CALL/RET move it again."""
+    memonic = instruction.memonic
+    operand = instruction.dest
+    registers = mem_layout.registers
+    sp_old = registers[4]
+    ip = registers[12]
+    cs_old = registers[9]
+    flags_old = mem_layout.flags
+
+    mem_layout.clocks += stack_clocks[memonic][stack_operand_kind(operand)]
+    if operand is not None and operand.is_memory:
+        mem_layout.clocks += ea_clocks(operand)
+
+    reg_activity = ""
+    if memonic == "PUSH":
+        if operand.is_register and operand.val == "SP":
+            # The 8086 pushes SP after decrementing it
+            val = (sp_old - 2) & 0xffff
+        else:
+            val = get_operand_value(operand, mem_layout)
+        stack_push(mem_layout, val)
+    elif memonic == "POP":
+        val = stack_pop(mem_layout)
+        if operand.is_register:
+            old_val = mem_layout.set_reg_value(operand, val)
+            reg_activity = f"{operand}:{old_val:#06x}->{val:#06x} "
+        else:
+            mem_layout.clocks += stack_word_clocks(mem_layout, operand)
+            mem_layout.set_mem_value(operand, val)
+    elif memonic == "PUSHF":
+        stack_push(mem_layout, mem_layout.flags)
+    elif memonic == "POPF":
+        mem_layout.flags = stack_pop(mem_layout) & flags_mask
+        mem_layout.pending_flags = None
+    elif memonic == "CALL":
+        if operand.is_displacement:
+            target = ip + operand.val - 3 # Fixing the +3 offset we performed earlier to guide NASM.
+        else:
+            target = get_operand_value(operand, mem_layout)
+        stack_push(mem_layout, ip)
+        registers[12] = target & 0xffff
+    elif memonic == "CALL FAR":
+        if operand.is_far:
+            segment, offset = operand.val
+        else:
+            offset = get_operand_value(operand, mem_layout)
+            segment = get_operand_value(replace(operand, mem_displacement=operand.mem_displacement + 2), mem_layout)
+        stack_push(mem_layout, cs_old)
+        stack_push(mem_layout, ip)
+        mem_layout.set_reg_value(Address("CS", is_register=True), segment)
+        registers[12] = offset
+    else: # RET, RETF
+        registers[12] = stack_pop(mem_layout)
+        if memonic == "RETF":
+            mem_layout.set_reg_value(Address("CS", is_register=True), stack_pop(mem_layout))
+        if operand is not None:
+            registers[4] = (registers[4] + operand.val) & 0xffff
+
+    if registers[9] != cs_old:
+        reg_activity += f"CS:{cs_old:#06x}->{registers[9]:#06x} "
+    reg_activity += f"SP:{sp_old:#06x}->{registers[4]:#06x} "
+    flags_str = ""
+    if mem_layout.flags != flags_old:
+        flags_str = f" flags: {serialize_flags(flags_old)}->{serialize_flags(mem_layout.flags)}"
+    return f"; {reg_activity} ip:{ip_old:#x}->{registers[12]:#x}{flags_str} \n"
+
+
+def push_pop_register(buf:bytes, mem_layout:MemoryLayout8086)->t.Tuple[Instruction, str]:
+    """Reference Manual: Intel 8086 Family User's Manual October 1979
+       Reference page: 4-22 PUSH/POP register
+    """
+    ip_old = mem_layout.registers[register_lables["IP"]["pos"]]
+    output, n_bytes = decode_push_pop_register(buf, 0)
+    print(f"I'm doing a {output.memonic} of a register")
+    print(f"Dest={output.dest}")
+
+    sim_out = sim_instruction(output, ip_old, ip_old + n_bytes, mem_layout)
+    return output, sim_out
+
+def push_pop_segment_register(buf:bytes, mem_layout:MemoryLayout8086)->t.Tuple[Instruction, str]:
+    """Reference Manual: Intel 8086 Family User's Manual October 1979
+       Reference page: 4-22 PUSH/POP segment register
+    """
+    ip_old = mem_layout.registers[register_lables["IP"]["pos"]]
+    output, n_bytes = decode_push_pop_segment_register(buf, 0)
+    print(f"I'm doing a {output.memonic} of a segment register")
+    print(f"Dest={output.dest}")
+
+    sim_out = sim_instruction(output, ip_old, ip_old + n_bytes, mem_layout)
+    return output, sim_out
+
+def pop_register_memory(buf:bytes, mem_layout:MemoryLayout8086)->t.Tuple[Instruction, str]:
+    """Reference Manual: Intel 8086 Family User's Manual October 1979
+       Reference page: 4-22 POP register/memory
+    """
+    print("I'm doing a POP to register/memory")
+    ip_old = mem_layout.registers[register_lables["IP"]["pos"]]
+    output, n_bytes = decode_pop_register_memory(buf, 0)
+    print(f"Dest={output.dest}")
+
+    sim_out = sim_instruction(output, ip_old, ip_old + n_bytes, mem_layout)
+    return output, sim_out
+
+def call_push_register_memory(buf:bytes, mem_layout:MemoryLayout8086)->t.Tuple[Instruction, str]:
+    """Reference Manual: Intel 8086 Family User's Manual October 1979
+       Reference page: 4-22 CALL indirect, PUSH register/memory
+    """
+    ip_old = mem_layout.registers[register_lables["IP"]["pos"]]
+    output, n_bytes = decode_call_push_register_memory(buf, 0)
+    print(f"I'm doing a {output.memonic} through register/memory")
+    print(f"Dest={output.dest}")
+
+    sim_out = sim_instruction(output, ip_old, ip_old + n_bytes, mem_layout)
+    return output, sim_out
+
+def call_within_segment(buf:bytes, mem_layout:MemoryLayout8086)->t.Tuple[Instruction, str]:
+    """Reference Manual: Intel 8086 Family User's Manual October 1979
+       Reference page: 4-22 CALL direct within segment
+    """
+    print("I'm doing a call within the segment")
+    ip_old = mem_layout.registers[register_lables["IP"]["pos"]]
+    output, n_bytes = decode_call_within_segment(buf, 0)
+    print(f"displacement={output.dest}")
+
+    sim_out = sim_instruction(output, ip_old, ip_old + n_bytes, mem_layout)
+    return output, sim_out
+
+def call_intersegment(buf:bytes, mem_layout:MemoryLayout8086)->t.Tuple[Instruction, str]:
+    """Reference Manual: Intel 8086 Family User's Manual October 1979
+       Reference page: 4-22 CALL direct intersegment
+    """
+    print("I'm doing an intersegment call")
+    ip_old = mem_layout.registers[register_lables["IP"]["pos"]]
+    output, n_bytes = decode_call_intersegment(buf, 0)
+    print(f"target={output.dest}")
+
+    sim_out = sim_instruction(output, ip_old, ip_old + n_bytes, mem_layout)
+    return output, sim_out
+
+def return_from_call(buf:bytes, mem_layout:MemoryLayout8086)->t.Tuple[Instruction, str]:
+    """Reference Manual: Intel 8086 Family User's Manual October 1979
+       Reference page: 4-22 RET
+    """
+    print("I'm doing a return from call")
+    ip_old = mem_layout.registers[register_lables["IP"]["pos"]]
+    output, n_bytes = decode_return_from_call(buf, 0)
+    print(f"return operation: {output.memonic}, data={output.dest}")
+
+    sim_out = sim_instruction(output, ip_old, ip_old + n_bytes, mem_layout)
+    return output, sim_out
+
+def push_pop_flags(buf:bytes, mem_layout:MemoryLayout8086)->t.Tuple[Instruction, str]:
+    """Reference Manual: Intel 8086 Family User's Manual October 1979
+       Reference page: 4-22 PUSHF/POPF
+    """
+    ip_old = mem_layout.registers[register_lables["IP"]["pos"]]
+    output, n_bytes = decode_push_pop_flags(buf, 0)
+    print(f"I'm doing a {output.memonic}")
+
+    sim_out = sim_instruction(output, ip_old, ip_old + n_bytes, mem_layout)
+    return output, sim_out
+
+
+# Decode only counterpart of every handler, used to decode without simming.
+instruction_decoders = dict()
+instruction_decoders[string_instruction] = decode_string_instruction
+instruction_decoders[push_pop_register] = decode_push_pop_register
+instruction_decoders[push_pop_segment_register] = decode_push_pop_segment_register
+instruction_decoders[pop_register_memory] = decode_pop_register_memory
+instruction_decoders[call_push_register_memory] = decode_call_push_register_memory
+instruction_decoders[call_within_segment] = decode_call_within_segment
+instruction_decoders[call_intersegment] = decode_call_intersegment
+instruction_decoders[return_from_call] = decode_return_from_call
+instruction_decoders[push_pop_flags] = decode_push_pop_flags
+
+
+# COMPILED OPS
+# The Simulator's run loop caches one op per instruction address: a function that sims the
+# decoded instruction on a layout and moves IP, so decoding only happens once per address.
+SimOp = t.Callable[[MemoryLayout8086], None]
+
+def compile_instruction(instruction:Instruction, ip:int, next_ip:int)->SimOp:
+    def sim_op(mem_layout:MemoryLayout8086):
+        sim_instruction(instruction, ip, next_ip, mem_layout)
+    return sim_op
+
+
+# Superinstructions: ADD/SUB/CMP immediately followed by a conditional jump are fused into one op.
+fusable_arith_memonics = {"ADD", "SUB", "CMP"}
+fusable_jump_memonics = set(jump_conditions.keys()) - loop_memonics - {"JCXZ"}
+
+# Jump conditions read straight from the operands and result of the fused ADD/SUB/CMP,
+# so the flags don't need to be computed when nothing reads them afterwards.
+fused_jump_conditions = dict()
+fused_jump_conditions["JE"] = lambda dest, src, res, is_add, msb: res == 0
+fused_jump_conditions["JNE"] = lambda dest, src, res, is_add, msb: res != 0
+fused_jump_conditions["JS"] = lambda dest, src, res, is_add, msb: (res >> msb) == 1
+fused_jump_conditions["JNS"] = lambda dest, src, res, is_add, msb: (res >> msb) == 0
+fused_jump_conditions["JB"] = lambda dest, src, res, is_add, msb: (dest + src >> (msb + 1)) == 1 if is_add else src > dest
+fused_jump_conditions["JNB"] = lambda dest, src, res, is_add, msb: not fused_jump_conditions["JB"](dest, src, res, is_add, msb)
+fused_jump_conditions["JBE"] = lambda dest, src, res, is_add, msb: res == 0 or fused_jump_conditions["JB"](dest, src, res, is_add, msb)
+fused_jump_conditions["JNBE"] = lambda dest, src, res, is_add, msb: not fused_jump_conditions["JBE"](dest, src, res, is_add, msb)
+
+def to_signed(val:int, msb:int)->int:
+    return val - ((val >> msb) << (msb + 1))
+
+# Signed compares only hold for SUB/CMP. For ADD they go through the flags.
+fused_signed_jump_conditions = dict()
+fused_signed_jump_conditions["JL"] = lambda dest, src, msb: to_signed(dest, msb) < to_signed(src, msb)
+fused_signed_jump_conditions["JNL"] = lambda dest, src, msb: to_signed(dest, msb) >= to_signed(src, msb)
+fused_signed_jump_conditions["JLE"] = lambda dest, src, msb: to_signed(dest, msb) <= to_signed(src, msb)
+fused_signed_jump_conditions["JNLE"] = lambda dest, src, msb: to_signed(dest, msb) > to_signed(src, msb)
+
+
+def compile_fused_arith_jump(arith:Instruction, jump:Instruction, jump_next_ip:int, is_flags_live:bool = True)->SimOp:
+    """Fuses an ADD/SUB/CMP and the conditional jump right after it into one op.
+    If is_flags_live is False the caller has proven every later path overwrites the arithmetic
+    flags before reading them, so only the condition the jump needs is computed. The operands
+    are left in mem_layout.pending_flags for a run stopping before the flags are overwritten.
+    """
+    dest_decode = arith.dest
+    src_decode = arith.src
+    arith_opcode = arith_memonics[arith.memonic]
+    is_add = (arith_opcode % 2) == 0
+    is_cmp = arith_opcode == 0b111
+    n_bytes = 2 if dest_decode.is_wide else 1
+    value_mask = 0xffff if n_bytes == 2 else 0xff
+    most_significant_bit = 8 * n_bytes - 1
+    # Fixing the +2 offset we performed earlier to guide NASM.
+    jump_target = jump_next_ip + int(jump.dest.val) - 2
+    jump_memonic = jump.memonic
+
+    condition = None
+    signed_condition = None
+    if not is_flags_live:
+        condition = fused_jump_conditions.get(jump_memonic)
+        if not is_add:
+            signed_condition = fused_signed_jump_conditions.get(jump_memonic)
+    jump_condition = jump_conditions[jump_memonic]
+    jump_not_taken_clocks, jump_taken_clocks = jump_clocks[jump_memonic]
+    arith_clocks, arith_transfers = base_clocks(arith)
+    mem_decode = src_decode if src_decode.is_memory else dest_decode
+    is_odd_penalty_possible = arith_transfers > 0 and mem_decode.is_wide
+
+    def fused_op(mem_layout:MemoryLayout8086):
+        mem_layout.clocks += arith_clocks
+        if is_odd_penalty_possible and (mem_layout.get_mem_location(mem_decode) & 1):
+            mem_layout.clocks += odd_address_clocks * arith_transfers
+        if src_decode.is_immediate:
+            src_val = src_decode.val & value_mask
+        elif src_decode.is_register:
+            src_val = mem_layout.get_reg_value(src_decode)
+        else:
+            src_val = mem_layout.get_mem_value(src_decode)
+        if dest_decode.is_register:
+            dest_val = mem_layout.get_reg_value(dest_decode)
+        else:
+            dest_val = mem_layout.get_mem_value(dest_decode)
+
+        if condition is None and signed_condition is None:
+            res, arith_flags = alu(dest_val, src_val, is_add, n_bytes)
+        else:
+            mem_layout.pending_flags = (dest_val, src_val, is_add, n_bytes)
+            if is_add:
+                res = (dest_val + src_val) & value_mask
+            else:
+                res = (dest_val - src_val) & value_mask
+        if not is_cmp:
+            if dest_decode.is_register:
+                mem_layout.set_reg_value(dest_decode, res)
+            else:
+                mem_layout.set_mem_value(dest_decode, res)
+
+        if condition is not None:
+            is_taken = condition(dest_val, src_val, res, is_add, most_significant_bit)
+        elif signed_condition is not None:
+            is_taken = signed_condition(dest_val, src_val, most_significant_bit)
+        else:
+            mem_layout.flags = (mem_layout.flags & ~arith_flags_mask) | arith_flags
+            mem_layout.pending_flags = None
+            is_taken = jump_condition(mem_layout.flags, mem_layout.registers[2])
+        if is_taken:
+            mem_layout.clocks += jump_taken_clocks
+            mem_layout.registers[12] = jump_target
+        else:
+            mem_layout.clocks += jump_not_taken_clocks
+            mem_layout.registers[12] = jump_next_ip
+
+    return fused_op
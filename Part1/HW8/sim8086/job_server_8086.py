@@ -0,0 +1,226 @@
+"""Local simulation job server for the 8086 simulator.
+
+A small asyncio server on a Unix socket or localhost TCP. Clients send one JSON job per line
+and get one JSON result per line back, in the order the jobs finish (results carry the job id):
+
+    job:    {"id": 1, "binary": "<base64>", "max_instructions": 100000, "timeout": 1.0, "prefetch_model": false}
+    result: {"id": 1, "status": "halted", "registers": {"AX": 0, ...}, "flags": 68, "flags_text": "PZ",
+             "instruction_count": 27, "clocks": 229, "modelled_clocks": null, "instructions_ran": 17,
+             "wall_time": 0.0004}
+
+status is "halted" when the program ran off its end, "budget" or "timeout" when it hit the
+instruction or wall clock budget of the job, and "error" (with "error") when it couldn't be
+simmed. Jobs run in a pool of worker processes started and warmed up (modules imported, one
+Simulator built) before the server accepts connections, so a job costs neither the Python
+startup nor the imports. Each worker keeps its Simulator and load()s every job into it, or
+just reset()s it when the same binary comes again. The wall clock budget is checked between
+slices of `SLICE_INSTRUCTIONS` instructions, so a job stops within one slice of its timeout.
+
+Author: Soumitra Goswami
+"""
+from __future__ import annotations
+import asyncio
+import base64
+import json
+import os
+import socket
+import time
+import typing as t
+from concurrent.futures import ProcessPoolExecutor
+
+from . import instruction_utils_8086 as utils_8086
+from . import headless_8086
+from . import SG_HW8
+
+
+SLICE_INSTRUCTIONS = 10000
+# Longest job line accepted, base64 binaries included
+MAX_LINE_BYTES = 16 * 1024 * 1024
+register_names = [name for name, reg in utils_8086.register_lables.items() if reg["bytes"] == 2]
+
+# Per worker process: prefetch_model -> Simulator reused across jobs
+_simulators: t.Dict[bool, SG_HW8.Simulator] = dict()
+
+
+def _warm_worker():
+    """Pool initializer. Builds the worker's Simulator so the first job doesn't pay for it."""
+    _simulators[False] = SG_HW8.Simulator(b"")
+
+
+def _ping()->int:
+    return os.getpid()
+
+
+def run_job(job: t.Dict[str, t.Any])->t.Dict[str, t.Any]:
+    """Runs one job in a worker process. Returns the result to send back."""
+    start = time.perf_counter()
+    result: t.Dict[str, t.Any] = {"id": job.get("id")}
+    try:
+        bin_data = base64.b64decode(job["binary"])
+        max_instructions = job.get("max_instructions")
+        timeout = job.get("timeout")
+        is_prefetch_model = bool(job.get("prefetch_model", False))
+
+        sim = _simulators.get(is_prefetch_model)
+        if sim is None:
+            sim = _simulators[is_prefetch_model] = SG_HW8.Simulator(bin_data)
+            if is_prefetch_model:
+                sim.enable_prefetch_model()
+        elif sim.bin_data == bin_data:
+            # Same binary again, keeps its cached ops
+            sim.reset()
+        else:
+            sim.load(bin_data)
+
+        status = "halted"
+        while not sim.is_halted:
+            batch = SLICE_INSTRUCTIONS
+            if max_instructions is not None:
+                batch = min(batch, max_instructions - sim.instruction_count)
+                if batch <= 0:
+                    status = "budget"
+                    break
+            if timeout is not None and time.perf_counter() - start >= timeout:
+                status = "timeout"
+                break
+            sim.run(batch)
+    except Exception as e:
+        # Any failure is the job's result. A job without one would leave its client waiting forever.
+        result["status"] = "error"
+        result["error"] = f"{type(e).__name__}: {e}"
+        result["wall_time"] = time.perf_counter() - start
+        return result
+
+    sim_result = headless_8086.SimResult8086.from_simulator(sim)
+    result["status"] = status
+    result["registers"] = {name: sim_result.register(name) for name in register_names}
+    result["flags"] = sim_result.flags
+    result["flags_text"] = utils_8086.serialize_flags(sim_result.flags)
+    result["instruction_count"] = sim_result.instruction_count
+    result["clocks"] = sim_result.clocks
+    result["modelled_clocks"] = sim_result.modelled_clocks
+    result["instructions_ran"] = sim.coverage.n_executed()
+    result["wall_time"] = time.perf_counter() - start
+    return result
+
+
+class JobServer8086():
+    """Accepts jobs over a stream socket and runs them on a pool of `n_workers` warm worker processes.
+    max_instructions and timeout are the budgets of jobs that don't set their own, and caps on the ones that do.
+    """
+    def __init__(self, n_workers: t.Optional[int] = None, max_instructions: t.Optional[int] = 10_000_000,
+                 timeout: t.Optional[float] = 10.0):
+        self.n_workers = n_workers or os.cpu_count()
+        self.max_instructions = max_instructions
+        self.timeout = timeout
+        self.executor: t.Optional[ProcessPoolExecutor] = None
+
+    async def start_workers(self):
+        self.executor = ProcessPoolExecutor(max_workers=self.n_workers, initializer=_warm_worker)
+        loop = asyncio.get_running_loop()
+        # The pool only starts its processes on demand. One ping per worker starts and warms all of them.
+        await asyncio.gather(*(loop.run_in_executor(self.executor, _ping) for _ in range(self.n_workers)))
+
+    def shutdown(self):
+        if self.executor is not None:
+            self.executor.shutdown()
+            self.executor = None
+
+    def _budgeted(self, job: t.Dict[str, t.Any])->t.Dict[str, t.Any]:
+        for key, server_budget in (("max_instructions", self.max_instructions), ("timeout", self.timeout)):
+            job_budget = job.get(key)
+            if job_budget is None:
+                job[key] = server_budget
+            elif server_budget is not None:
+                job[key] = min(job_budget, server_budget)
+        return job
+
+    async def _run(self, line: bytes, writer: asyncio.StreamWriter, write_lock: asyncio.Lock):
+        try:
+            job = json.loads(line)
+            if not isinstance(job, dict):
+                raise ValueError("A job is a JSON object")
+        except ValueError as e:
+            result = {"id": None, "status": "error", "error": f"Bad job: {e}"}
+        else:
+            loop = asyncio.get_running_loop()
+            try:
+                result = await loop.run_in_executor(self.executor, run_job, self._budgeted(job))
+            except Exception as e:
+                # The job never got a result from a worker, eg. the worker process died
+                result = {"id": job.get("id"), "status": "error", "error": f"{type(e).__name__}: {e}"}
+        async with write_lock:
+            writer.write(json.dumps(result).encode() + b"\n")
+            await writer.drain()
+
+    async def handle_client(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        """Runs the jobs of a connection concurrently, writing each result as it finishes."""
+        write_lock = asyncio.Lock()
+        tasks = set()
+        try:
+            while True:
+                line = await reader.readline()
+                if not line:
+                    break
+                if line.strip():
+                    task = asyncio.ensure_future(self._run(line, writer, write_lock))
+                    tasks.add(task)
+                    task.add_done_callback(tasks.discard)
+            if tasks:
+                await asyncio.gather(*tasks)
+        except (ConnectionError, ValueError) as e:
+            # ValueError: line over MAX_LINE_BYTES
+            print(f"Dropping connection: {e}")
+        finally:
+            writer.close()
+
+    async def serve(self, unix_path: t.Optional[str] = None, host: str = "127.0.0.1", port: int = 8086):
+        """Serves on unix_path if given, localhost TCP otherwise, until cancelled."""
+        await self.start_workers()
+        try:
+            if unix_path is not None:
+                server = await asyncio.start_unix_server(self.handle_client, path=unix_path, limit=MAX_LINE_BYTES)
+            else:
+                server = await asyncio.start_server(self.handle_client, host, port, limit=MAX_LINE_BYTES)
+            address = unix_path or f"{host}:{port}"
+            print(f"Serving 8086 jobs on {address} with {self.n_workers} workers")
+            async with server:
+                await server.serve_forever()
+        finally:
+            self.shutdown()
+
+
+def submit_jobs(jobs: t.List[t.Dict[str, t.Any]], unix_path: t.Optional[str] = None,
+                host: str = "127.0.0.1", port: int = 8086)->t.List[t.Dict[str, t.Any]]:
+    """Blocking client. Sends the jobs ("binary" given as bytes) and returns their results in job order."""
+    if unix_path is not None:
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        sock.connect(unix_path)
+    else:
+        sock = socket.create_connection((host, port))
+    with sock, sock.makefile("rwb") as stream:
+        for idx, job in enumerate(jobs):
+            job = dict(job, id=idx, binary=base64.b64encode(job["binary"]).decode())
+            stream.write(json.dumps(job).encode() + b"\n")
+        stream.flush()
+        results = [json.loads(stream.readline()) for _ in jobs]
+    return sorted(results, key=lambda result: result["id"])
+
+
+if __name__ == '__main__':
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Serves 8086 simulation jobs as JSON lines")
+    parser.add_argument("--unix", help="Unix socket path. Localhost TCP if not given")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8086)
+    parser.add_argument("-j", "--workers", type=int, default=os.cpu_count())
+    parser.add_argument("--max-instructions", type=int, default=10_000_000, help="instruction budget per job")
+    parser.add_argument("--timeout", type=float, default=10.0, help="wall clock budget per job in seconds")
+    args = parser.parse_args()
+
+    job_server = JobServer8086(args.workers, args.max_instructions, args.timeout)
+    try:
+        asyncio.run(job_server.serve(args.unix, args.host, args.port))
+    except KeyboardInterrupt:
+        pass
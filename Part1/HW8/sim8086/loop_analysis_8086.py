@@ -0,0 +1,185 @@
+"""Loop analysis for the 8086 simulator.
+
+InfiniteLoopDetector8086 proves that a run will never end: the machine is deterministic, so if
+the full state (registers, flags and memory) at a backward jump is ever seen again, the run
+cycles forever.
+
+Memory is folded into a running hash that is only updated on memory writes, so checking a
+state is a tuple of the 13 registers, the flags and that hash. States are only checked at
+taken backward jumps, and compared with Brent's cycle finding algorithm: a single saved state
+is kept and re-saved at power of two intervals, so memory use stays constant on long runs.
+A hash match is confirmed against a copy on write snapshot of the saved state before an
+infinite loop is reported.
+
+LoopStats8086 finds the natural loops of a run from its taken backward jumps: the target of
+the jump is the loop header and the jump closes an iteration. Loops are keyed by header, so
+several jumps back to the same header are one loop. Reaching a known header any other way
+enters the loop again. Each loop keeps its entries, iterations and the instructions and
+clocks of the iterations closed by a backward jump, for the average trip count and cost
+per iteration. The iteration leaving the loop (and the first one, run before its header was
+known) isn't timed.
+
+Author: Soumitra Goswami
+"""
+from __future__ import annotations
+import struct
+import typing as t
+from dataclasses import dataclass
+
+from . import instruction_utils_8086 as utils_8086
+
+
+class InfiniteLoopError(Exception):
+    """Raised when a run is proven to loop forever. ip_start/ip_end bound the code of the cycle."""
+    def __init__(self, ip_start: int, ip_end: int, n_backward_jumps: int):
+        self.ip_start = ip_start
+        self.ip_end = ip_end
+        self.n_backward_jumps = n_backward_jumps
+        super().__init__(f"Infinite loop between ip:{ip_start:#x} and ip:{ip_end:#x} "
+                         f"({n_backward_jumps} backward jumps per cycle)")
+
+
+class InfiniteLoopDetector8086(utils_8086.MemoryObserver8086):
+    """Opt in infinite loop detection. Attach to a layout and call on_backward_jump() for every taken backward jump."""
+    def __init__(self, mem_layout: utils_8086.MemoryLayout8086):
+        self.mem_layout = mem_layout
+        self.mem_hash = 0
+        # Brent's cycle detection
+        self._power = 1
+        self._lam = 1
+        self._saved_key = None
+        self._saved_state: t.Optional[utils_8086.MemoryLayout8086] = None
+        # IP range covered since the saved state
+        self._ip_min = 0
+        self._ip_max = 0
+
+    def attach(self):
+        self.mem_layout.observers.append(self)
+
+    def detach(self):
+        self.mem_layout.observers.remove(self)
+
+    def on_mem_write(self, mem_loc: int, n_bytes: int, old_value: int, new_value: int):
+        # XOR the old byte out of the hash and the new byte in.
+        self.mem_hash ^= hash((mem_loc, old_value & 0xff)) ^ hash((mem_loc, new_value & 0xff))
+        if n_bytes == 2:
+            self.mem_hash ^= hash((mem_loc + 1, old_value >> 8)) ^ hash((mem_loc + 1, new_value >> 8))
+
+    def on_backward_jump(self, ip_jump: int, ip_target: int):
+        """Checks the state after a taken jump from ip_jump back to ip_target. Raises InfiniteLoopError on a proven cycle."""
+        layout = self.mem_layout
+        if ip_target < self._ip_min:
+            self._ip_min = ip_target
+        if ip_jump > self._ip_max:
+            self._ip_max = ip_jump
+
+        key = (tuple(layout.registers), layout.flags, self.mem_hash)
+        if key == self._saved_key and self._is_saved_state(layout):
+            raise InfiniteLoopError(self._ip_min, self._ip_max, self._lam)
+
+        if self._lam == self._power:
+            self._saved_key = key
+            self._saved_state = layout.snapshot()
+            self._ip_min = ip_target
+            self._ip_max = ip_jump
+            self._power *= 2
+            self._lam = 0
+        self._lam += 1
+
+    def _is_saved_state(self, layout: utils_8086.MemoryLayout8086)->bool:
+        saved = self._saved_state
+        if saved.registers != layout.registers or saved.flags != layout.flags:
+            return False
+        # Pages untouched since the snapshot are still shared, so most compare by identity.
+        for saved_page, page in zip(saved.memory.pages, layout.memory.pages):
+            if saved_page is not page and saved_page != page:
+                return False
+        return True
+
+
+@dataclass
+class LoopRecord8086():
+    header: int
+    # ip after the furthest backward jump to the header
+    end: int
+    n_entries: int = 0
+    n_back_edges: int = 0
+    # Iterations closed by a backward jump since a known start, and their instructions and clocks
+    n_timed: int = 0
+    instructions: int = 0
+    clocks: int = 0
+    # (instruction count, clocks) where the current iteration started. None until known.
+    iteration_start: t.Optional[t.Tuple[int, int]] = None
+
+    @property
+    def n_iterations(self)->int:
+        # Every entry and every backward jump starts an iteration
+        return self.n_entries + self.n_back_edges
+
+    @property
+    def trips_per_entry(self)->float:
+        return self.n_iterations / self.n_entries
+
+    @property
+    def instructions_per_iteration(self)->float:
+        return self.instructions / self.n_timed if self.n_timed else 0.0
+
+    @property
+    def clocks_per_iteration(self)->float:
+        return self.clocks / self.n_timed if self.n_timed else 0.0
+
+
+class LoopStats8086():
+    """Trip counts and cost per iteration of the loops of a run.
+    The simulator calls on_arrival() after every backward jump and on arriving at a known header.
+    decode returns the instruction at an ip and the ip after it.
+    """
+    def __init__(self, decode: t.Callable[[int], t.Tuple[utils_8086.Instruction, int]]):
+        self.decode = decode
+        # header ip -> loop
+        self.loops: t.Dict[int, LoopRecord8086] = dict()
+        # ip of a backward going instruction -> ip after it, None if it isn't a jump (RET)
+        self._latch_ends: t.Dict[int, t.Optional[int]] = dict()
+
+    def _latch_end(self, ip: int)->t.Optional[int]:
+        if ip not in self._latch_ends:
+            try:
+                instruction, next_ip = self.decode(ip)
+                is_jump = instruction.memonic in utils_8086.jump_conditions
+            except (NotImplementedError, KeyError, struct.error):
+                is_jump = False
+            self._latch_ends[ip] = next_ip if is_jump else None
+        return self._latch_ends[ip]
+
+    def on_arrival(self, ip_from: int, ip_to: int, instruction_count: int, clocks: int):
+        """Execution went from the instruction at ip_from to ip_to. instruction_count and clocks are after it."""
+        loop = self.loops.get(ip_to)
+        if ip_to <= ip_from:
+            latch_end = self._latch_end(ip_from)
+            if latch_end is not None:
+                if loop is None:
+                    loop = self.loops[ip_to] = LoopRecord8086(ip_to, latch_end, n_entries=1)
+                loop.end = max(loop.end, latch_end)
+                loop.n_back_edges += 1
+                if loop.iteration_start is not None:
+                    start_count, start_clocks = loop.iteration_start
+                    loop.n_timed += 1
+                    loop.instructions += instruction_count - start_count
+                    loop.clocks += clocks - start_clocks
+                loop.iteration_start = (instruction_count, clocks)
+                return
+        if loop is not None:
+            loop.n_entries += 1
+            loop.iteration_start = (instruction_count, clocks)
+
+    def report(self, n_loops: t.Optional[int] = None)->str:
+        """One line per loop, the most clocks spent first, as assembly comments."""
+        loops = sorted(self.loops.values(), key=lambda loop: (-loop.clocks_per_iteration * loop.n_iterations, loop.header))
+        output = f"; Loops: {len(loops)}\n"
+        for loop in loops[:n_loops]:
+            output += (f";   ip {loop.header:#06x}-{loop.end:#06x} ({loop.end - loop.header} bytes): "
+                       f"{loop.n_entries} entries, {loop.n_iterations} iterations, "
+                       f"{loop.trips_per_entry:.1f} trips per entry, "
+                       f"{loop.instructions_per_iteration:.1f} instructions and "
+                       f"{loop.clocks_per_iteration:.1f} clocks per iteration\n")
+        return output
@@ -0,0 +1,75 @@
+"""Memory dumps and framebuffer images of the simulated 8086 memory.
+
+Both write straight from the memory pages: PagedMemory8086.views() hands out memoryviews
+over the pages and they go to the file in a single gathered write (os.writev where the OS
+has it), so nothing is copied or converted on the way. This keeps dumping cheap enough to
+do after every frame of the animation style programs of the course.
+
+Images are 32 bit pixels as the course programs draw them (R, G, B, A bytes). PAM (P7,
+RGB_ALPHA) and raw RGBA are written as is. PPM (P6) has no alpha channel, so it is the one
+format that needs a conversion.
+
+Author: Soumitra Goswami
+"""
+from __future__ import annotations
+import os
+import typing as t
+from pathlib import Path
+
+from . import instruction_utils_8086 as utils_8086
+
+
+def write_views(out_path: str, views: t.List[memoryview], header: bytes = b""):
+    """Writes the header and the views with one gathered write."""
+    buffers = [memoryview(header)] + views if header else list(views)
+    with open(out_path, 'wb', buffering=0) as ofh:
+        if not hasattr(os, "writev"):
+            ofh.writelines(buffers)
+            return
+        fd = ofh.fileno()
+        while buffers:
+            n_written = os.writev(fd, buffers)
+            # Short writes leave the rest of the buffers for the next call
+            while buffers and n_written >= len(buffers[0]):
+                n_written -= len(buffers[0])
+                buffers.pop(0)
+            if buffers and n_written:
+                buffers[0] = buffers[0][n_written:]
+
+
+def dump_memory(memory: utils_8086.PagedMemory8086, out_path: str, mem_loc: int = 0, n_bytes: t.Optional[int] = None):
+    """Writes the memory (the whole 1 MiB by default) to out_path byte for byte."""
+    if n_bytes is None:
+        n_bytes = len(memory) - mem_loc
+    if mem_loc < 0 or n_bytes < 0 or mem_loc + n_bytes > len(memory):
+        raise ValueError(f"Range {mem_loc:#x} + {n_bytes:#x} is outside of the {len(memory):#x} bytes of memory")
+    write_views(out_path, memory.views(mem_loc, n_bytes))
+
+
+def export_framebuffer(memory: utils_8086.PagedMemory8086, out_path: str, mem_loc: int, width: int, height: int,
+                       image_format: t.Optional[str] = None):
+    """Writes width x height RGBA pixels at mem_loc as an image.
+    image_format is "pam", "rgba" or "ppm". By default it comes from the extension of out_path.
+    """
+    if image_format is None:
+        image_format = Path(out_path).suffix.lstrip(".").lower()
+    n_bytes = 4 * width * height
+    if mem_loc < 0 or mem_loc + n_bytes > len(memory):
+        raise ValueError(f"Framebuffer {mem_loc:#x} + {n_bytes:#x} is outside of the {len(memory):#x} bytes of memory")
+    views = memory.views(mem_loc, n_bytes)
+
+    if image_format == "rgba":
+        write_views(out_path, views)
+    elif image_format == "pam":
+        header = f"P7\nWIDTH {width}\nHEIGHT {height}\nDEPTH 4\nMAXVAL 255\nTUPLTYPE RGB_ALPHA\nENDHDR\n"
+        write_views(out_path, views, header.encode("ascii"))
+    elif image_format == "ppm":
+        rgba = b"".join(views)
+        rgb = bytearray(3 * width * height)
+        # Dropping the alpha bytes
+        rgb[0::3] = rgba[0::4]
+        rgb[1::3] = rgba[1::4]
+        rgb[2::3] = rgba[2::4]
+        write_views(out_path, [memoryview(rgb)], f"P6\n{width} {height}\n255\n".encode("ascii"))
+    else:
+        raise ValueError(f"Image format '{image_format}' is not supported. Use pam, rgba or ppm")
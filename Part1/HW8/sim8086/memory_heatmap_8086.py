@@ -0,0 +1,92 @@
+"""Memory access heatmap for the 8086 simulator.
+
+MemoryHeatmap8086 counts the reads and writes of every 16 byte line of the simulated memory,
+to reason about the cache behavior of the algorithms run on the simulator. The counts are
+two flat arrays with one entry per line (64K lines for the 1 MiB memory), and the distance
+between consecutive accesses is kept as a stride histogram.
+
+Like the loop detector it is a MemoryObserver8086, so it costs nothing unless attached.
+Attaching it also turns off the block fast path of the REP string instructions, so every
+element they touch is counted.
+
+Author: Soumitra Goswami
+"""
+from __future__ import annotations
+import math
+import typing as t
+from array import array
+from collections import Counter
+
+from . import instruction_utils_8086 as utils_8086
+
+
+LINE_SHIFT = 4
+LINE_SIZE = 1 << LINE_SHIFT
+
+
+class MemoryHeatmap8086(utils_8086.MemoryObserver8086):
+    """Counts reads and writes per 16 byte line. Attach to a layout and call report() at the end of the run."""
+    def __init__(self, mem_layout: utils_8086.MemoryLayout8086):
+        self.mem_layout = mem_layout
+        n_lines = len(mem_layout.memory) >> LINE_SHIFT
+        self.reads = array('I', bytes(4 * n_lines))
+        self.writes = array('I', bytes(4 * n_lines))
+        self.strides: t.Counter[int] = Counter()
+        self._last_mem_loc: t.Optional[int] = None
+
+    def attach(self):
+        self.mem_layout.observers.append(self)
+
+    def detach(self):
+        self.mem_layout.observers.remove(self)
+
+    def _count(self, counts: array, mem_loc: int, n_bytes: int):
+        line = mem_loc >> LINE_SHIFT
+        counts[line] += 1
+        # A word straddling two lines touches both
+        last_line = ((mem_loc + n_bytes - 1) & utils_8086.PHYSICAL_MASK) >> LINE_SHIFT
+        if last_line != line:
+            counts[last_line] += 1
+        if self._last_mem_loc is not None:
+            self.strides[mem_loc - self._last_mem_loc] += 1
+        self._last_mem_loc = mem_loc
+
+    def on_mem_read(self, mem_loc: int, n_bytes: int):
+        self._count(self.reads, mem_loc, n_bytes)
+
+    def on_mem_write(self, mem_loc: int, n_bytes: int, old_value: int, new_value: int):
+        self._count(self.writes, mem_loc, n_bytes)
+
+    def working_set(self)->int:
+        """Number of lines read or written at least once."""
+        return sum(1 for n_reads, n_writes in zip(self.reads, self.writes) if n_reads or n_writes)
+
+    def report(self, n_hottest: int = 8, n_strides: int = 8)->str:
+        """Working set size, the hottest lines and the most common strides as assembly comments."""
+        touched = [(n_reads + n_writes, line) for line, (n_reads, n_writes) in enumerate(zip(self.reads, self.writes))
+                   if n_reads or n_writes]
+        output = "; Memory heatmap\n"
+        output += (f"; Working set: {len(touched)} lines ({len(touched) * LINE_SIZE} bytes), "
+                   f"{sum(self.reads)} reads, {sum(self.writes)} writes\n")
+        if touched:
+            output += "; Hottest lines:\n"
+            for n_accesses, line in sorted(touched, key=lambda entry: (-entry[0], entry[1]))[:n_hottest]:
+                output += f";   {line << LINE_SHIFT:#07x}: {self.reads[line]} reads, {self.writes[line]} writes\n"
+        if self.strides:
+            output += "; Strides:\n"
+            for stride, count in self.strides.most_common(n_strides):
+                output += f";   {stride:+}: {count}\n"
+        return output
+
+    def write_pgm(self, pgm_path: str, width: int = 256):
+        """Writes the accesses per line as a binary PGM, one pixel per line, log scaled to 0-255."""
+        totals = [n_reads + n_writes for n_reads, n_writes in zip(self.reads, self.writes)]
+        height = (len(totals) + width - 1) // width
+        scale = 255 / math.log1p(max(totals)) if any(totals) else 0
+        pixels = bytearray(width * height)
+        for line, total in enumerate(totals):
+            if total:
+                pixels[line] = max(1, int(math.log1p(total) * scale))
+        with open(pgm_path, 'wb') as ofh:
+            ofh.write(f"P5\n{width} {height}\n255\n".encode("ascii"))
+            ofh.write(pixels)
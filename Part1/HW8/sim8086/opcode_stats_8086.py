@@ -0,0 +1,83 @@
+"""Opcode and addressing mode execution statistics for the 8086 simulator.
+
+OpcodeStats8086 counts how often each op_funcs handler runs with each ModRM addressing
+form, to find the decode and execute paths worth specializing. The counts are one flat
+array indexed by handler id * N_FORMS + form, so counting an instruction is a single
+increment. The Simulator works out the index of each cached op when it compiles it, so
+run() doesn't decode anything to count.
+
+Forms: no memory operand, the 8 register based addresses of encode_address, and direct
+addresses.
+
+Author: Soumitra Goswami
+"""
+from __future__ import annotations
+import typing as t
+from array import array
+
+from . import instruction_utils_8086 as utils_8086
+
+
+FORM_NO_MEMORY = 0
+FORM_DIRECT = 1 + len(utils_8086.encode_address)
+N_FORMS = FORM_DIRECT + 1
+form_names = ["-"] + [f"[{' + '.join(regs)}]" for regs in utils_8086.encode_address] + ["[direct]"]
+HISTOGRAM_WIDTH = 40
+
+
+def address_form(instruction: utils_8086.Instruction)->int:
+    """ModRM addressing form of the memory operand of the instruction."""
+    for operand in (instruction.dest, instruction.src):
+        if operand is None or not operand.is_memory:
+            continue
+        if not operand.mem_from_reg:
+            return FORM_DIRECT
+        regs = list(operand.val)
+        # Implicit operands (SI/DI of the string instructions, SP of the stack) aren't ModRM forms
+        if regs in utils_8086.encode_address:
+            return 1 + utils_8086.encode_address.index(regs)
+    return FORM_NO_MEMORY
+
+
+class OpcodeStats8086():
+    """Execution counts per (handler, addressing form). Handlers are numbered in op_funcs order."""
+    def __init__(self, op_funcs: t.Dict[str, t.Callable]):
+        self.handler_ids: t.Dict[t.Callable, int] = dict()
+        for handler in op_funcs.values():
+            self.handler_ids.setdefault(handler, len(self.handler_ids))
+        self.handlers = list(self.handler_ids.keys())
+        self.counts = array('Q', bytes(8 * N_FORMS * len(self.handlers)))
+        # Cached op key -> (index of its instruction, index of the fused jump or None), filled when ops compile
+        self.op_indices: t.Dict[int, t.Tuple[int, t.Optional[int]]] = dict()
+
+    def index(self, handler: t.Callable, instruction: utils_8086.Instruction)->int:
+        return self.handler_ids[handler] * N_FORMS + address_form(instruction)
+
+    def count(self, handler: t.Callable, instruction: utils_8086.Instruction):
+        self.counts[self.index(handler, instruction)] += 1
+
+    def clear(self):
+        """Zeroes the counts. The op indices stay valid."""
+        self.counts = array('Q', bytes(8 * len(self.counts)))
+
+    def histogram(self, n_rows: t.Optional[int] = None)->str:
+        """Counts per handler and addressing form, most run first, as assembly comments."""
+        rows = [(count, idx) for idx, count in enumerate(self.counts) if count]
+        rows.sort(key=lambda row: (-row[0], row[1]))
+        total = sum(self.counts)
+        output = f"; Opcode statistics: {total} instructions\n"
+        if not total:
+            return output
+        name_width = max(len(self.handlers[idx // N_FORMS].__name__) for _, idx in rows)
+        max_count = rows[0][0]
+        for count, idx in rows[:n_rows]:
+            handler = self.handlers[idx // N_FORMS]
+            bar = "#" * max(1, count * HISTOGRAM_WIDTH // max_count)
+            output += (f";   {handler.__name__:<{name_width}} {form_names[idx % N_FORMS]:<9} "
+                       f"{count:>10} {count / total:6.1%} {bar}\n")
+        output += "; Addressing forms:\n"
+        for form, form_name in enumerate(form_names):
+            form_count = sum(self.counts[form::N_FORMS])
+            if form_count:
+                output += f";   {form_name:<9} {form_count:>10} {form_count / total:6.1%}\n"
+        return output
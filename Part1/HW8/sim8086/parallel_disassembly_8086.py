@@ -0,0 +1,120 @@
+"""Speculative parallel linear sweep disassembly of large 8086 binaries.
+
+A linear sweep decodes one instruction after another from the start of the binary, so on its
+own it can't be split: where an instruction starts depends on every instruction before it.
+8086 code resynchronizes quickly though. Decoding streams started from different offsets
+usually land on a common instruction boundary within a few instructions, and from there
+on they decode the same instructions.
+
+So the binary is cut into chunks and every chunk is decoded in its own process from a few
+candidate offsets at its start. Streams after the first stop as soon as they reach a boundary
+an earlier stream already decoded. Stitching then walks the chunks in order from the true
+boundary the previous chunk ended on. Once that boundary is in a chunk's decodes the rest
+of the chunk is looked up, and only the few instructions before the streams resynchronize
+are decoded again. The result is the same as a single linear sweep.
+
+Bytes that don't decode are listed as db and the sweep moves on by one byte, as in the
+coverage listing (coverage_8086).
+
+Author: Soumitra Goswami
+"""
+from __future__ import annotations
+import os
+import struct
+import typing as t
+from concurrent.futures import ProcessPoolExecutor
+
+from . import instruction_utils_8086 as utils_8086
+from . import SG_HW8
+
+
+# offset -> (offset of the next instruction, instruction text)
+ChunkDecodes = t.Dict[int, t.Tuple[int, str]]
+
+
+def decode_at(buf: bytes, buf_off: int)->t.Tuple[int, str]:
+    """Decodes one instruction for the sweep. Returns the next offset and the instruction text."""
+    try:
+        instruction, next_off = SG_HW8.decode_instruction(buf, buf_off)
+        return next_off, str(instruction)
+    except (NotImplementedError, KeyError, IndexError, struct.error):
+        return buf_off + 1, f"db {buf[buf_off]:#04x}"
+
+
+def decode_chunk(buf: bytes, buf_start: int, chunk_start: int, chunk_end: int, n_candidates: int)->ChunkDecodes:
+    """Decodes the streams starting at the first n_candidates offsets of a chunk.
+    buf holds the binary from buf_start, up to the chunk end plus the longest instruction.
+    """
+    decodes: ChunkDecodes = dict()
+    for candidate in range(chunk_start, min(chunk_start + n_candidates, chunk_end)):
+        offset = candidate
+        # A stream is done once it joins one decoded before it
+        while offset < chunk_end and offset not in decodes:
+            next_off, text = decode_at(buf, offset - buf_start)
+            next_off += buf_start
+            decodes[offset] = (next_off, text)
+            offset = next_off
+    return decodes
+
+
+def _decode_chunk_job(job: t.Tuple[bytes, int, int, int, int])->ChunkDecodes:
+    return decode_chunk(*job)
+
+
+def disassemble_parallel(bin_data: bytes, n_workers: t.Optional[int] = None, chunk_size: int = 1 << 16,
+                         n_candidates: int = 4)->t.List[t.Tuple[int, str]]:
+    """Linear sweep of the binary, chunks decoded across n_workers processes (all cores by default).
+    Returns (offset, instruction text) of every instruction in order.
+    """
+    if chunk_size < 1 or n_candidates < 1:
+        raise ValueError(f"chunk_size and n_candidates need to be at least 1. Got {chunk_size}, {n_candidates}")
+    jobs = []
+    for chunk_start in range(0, len(bin_data), chunk_size):
+        chunk_end = min(chunk_start + chunk_size, len(bin_data))
+        buf = bin_data[chunk_start:chunk_end + utils_8086.MAX_INSTRUCTION_BYTES]
+        jobs.append((buf, chunk_start, chunk_start, chunk_end, n_candidates))
+
+    chunk_ends = [job[3] for job in jobs]
+    if n_workers == 1 or len(jobs) == 1:
+        return _stitch(bin_data, chunk_ends, map(_decode_chunk_job, jobs))
+    with ProcessPoolExecutor(max_workers=n_workers) as executor:
+        return _stitch(bin_data, chunk_ends, executor.map(_decode_chunk_job, jobs))
+
+
+def _stitch(bin_data: bytes, chunk_ends: t.List[int],
+            chunk_decodes: t.Iterable[ChunkDecodes])->t.List[t.Tuple[int, str]]:
+    """Follows the true instruction boundaries through the chunks in order."""
+    out = []
+    offset = 0
+    for chunk_end, decodes in zip(chunk_ends, chunk_decodes):
+        # Decoded again until the true stream meets one of the speculative ones
+        while offset < chunk_end and offset not in decodes:
+            next_off, text = decode_at(bin_data, offset)
+            out.append((offset, text))
+            offset = next_off
+        while offset in decodes:
+            next_off, text = decodes[offset]
+            out.append((offset, text))
+            offset = next_off
+    return out
+
+
+if __name__ == '__main__':
+    import argparse
+    from pathlib import Path
+
+    parser = argparse.ArgumentParser(description="Linear sweep disassembly of a 8086 binary across processes")
+    parser.add_argument("bin_path")
+    parser.add_argument("-j", "--workers", type=int, default=os.cpu_count())
+    parser.add_argument("--chunk-size", type=int, default=1 << 16)
+    parser.add_argument("-o", "--out", help="listing path, <bin_path>_sweep.asm by default")
+    args = parser.parse_args()
+
+    with open(args.bin_path, "rb") as f:
+        bin_data = f.read()
+    instructions = disassemble_parallel(bin_data, args.workers, args.chunk_size)
+    out_path = args.out or str(args.bin_path) + "_sweep.asm"
+    output = f"; {Path(args.bin_path).stem}\nbits 16\n"
+    output += "".join(f"{text} ; {offset:#08x}\n" for offset, text in instructions)
+    SG_HW8.write_file(out_path, output)
+    print(f"{len(instructions)} instructions written to {out_path}")
@@ -0,0 +1,164 @@
+"""Prefetch queue and bus cycle timing model for the 8086 simulator.
+
+The clock tables of the 8086 manual time every instruction on its own, as if its bytes were
+already in the prefetch queue and the bus was free whenever it touches memory. On the real
+chip the Bus Interface Unit (BIU) fills a 6 byte queue with 4 clock bus cycles while the
+Execution Unit (EU) runs, and both share the one bus:
+
+    - the EU waits when the next instruction bytes aren't in the queue yet,
+    - an EU memory access waits for a prefetch bus cycle already under way to finish,
+    - a jump flushes the queue, so the code after it waits on the fetches at the target.
+
+PrefetchQueueModel8086 keeps a timeline of the BIU next to the simulator. The EU time of an
+instruction is its manual table time, its memory accesses are taken at the end of it, and
+the BIU prefetches a word whenever the bus is idle and 2 bytes of the queue are free. The
+modelled clocks are the manual ones plus the waits. Memory accesses come in as a
+MemoryObserver8086, so like the heatmap it turns off the block fast path of the REP string
+instructions while attached.
+
+Author: Soumitra Goswami
+"""
+from __future__ import annotations
+import typing as t
+
+from . import instruction_utils_8086 as utils_8086
+
+
+QUEUE_SIZE = 6
+BUS_CYCLE_CLOCKS = 4
+# Free queue bytes the BIU needs before fetching the next word
+FETCH_ROOM = 2
+
+
+class PrefetchQueueModel8086(utils_8086.MemoryObserver8086):
+    """Modelled clocks of the simmed instructions. begin_instruction() and end_instruction() wrap every instruction."""
+    def __init__(self, mem_layout: utils_8086.MemoryLayout8086):
+        self.mem_layout = mem_layout
+        # Modelled clocks so far and of the last instruction
+        self.clocks = 0
+        self.last_clocks = 0
+        self.queue_bytes = 0
+        # Physical address of the next prefetch. None until the first instruction.
+        self.fetch_loc: t.Optional[int] = None
+        # End of the last bus cycle started, and the bytes of a prefetch that ends there
+        self.bus_free_at = 0
+        self.in_flight = 0
+        # Physical address the straight line code continues at. Anything else flushes the queue.
+        self.next_pc: t.Optional[int] = None
+        self._n_bytes = 0
+        self._manual_start = 0
+        self._eu_bus_cycles = 0
+        # Totals for the report
+        self.n_instructions = 0
+        self.manual_clocks = 0
+        self.prefetch_bus_cycles = 0
+        self.eu_bus_cycles = 0
+        self.queue_wait_clocks = 0
+        self.bus_wait_clocks = 0
+        self.n_flushes = 0
+        self.n_discarded_bytes = 0
+
+    def attach(self):
+        self.mem_layout.observers.append(self)
+
+    def detach(self):
+        self.mem_layout.observers.remove(self)
+
+    def on_mem_read(self, mem_loc: int, n_bytes: int):
+        # A word at an odd address takes two bus cycles
+        self._eu_bus_cycles += 2 if n_bytes == 2 and mem_loc & 1 else 1
+
+    def on_mem_write(self, mem_loc: int, n_bytes: int, old_value: int, new_value: int):
+        self._eu_bus_cycles += 2 if n_bytes == 2 and mem_loc & 1 else 1
+
+    def _prefetch(self, until: int):
+        """Runs the BIU up to `until`: completes the prefetches ending by then and starts the ones that fit before it."""
+        while True:
+            if self.in_flight:
+                if self.bus_free_at > until:
+                    return
+                self.queue_bytes += self.in_flight
+                self.in_flight = 0
+            if QUEUE_SIZE - self.queue_bytes < FETCH_ROOM or self.bus_free_at >= until:
+                return
+            # An odd address fetches the one byte up to the next word
+            self.in_flight = 1 if self.fetch_loc & 1 else 2
+            self.fetch_loc = (self.fetch_loc + self.in_flight) & utils_8086.PHYSICAL_MASK
+            self.bus_free_at += BUS_CYCLE_CLOCKS
+            self.prefetch_bus_cycles += 1
+
+    def _flush(self, pc: int):
+        self.n_discarded_bytes += self.queue_bytes + self.in_flight
+        # A prefetch under way still holds the bus until it ends
+        self.queue_bytes = 0
+        self.in_flight = 0
+        self.fetch_loc = pc
+        self.bus_free_at = max(self.bus_free_at, self.clocks)
+
+    def begin_instruction(self, pc: int, n_bytes: int):
+        """Called before the instruction of n_bytes at physical address pc is simmed."""
+        if pc != self.next_pc:
+            if self.next_pc is not None:
+                self.n_flushes += 1
+            self._flush(pc)
+        self._n_bytes = n_bytes
+        self.next_pc = (pc + n_bytes) & utils_8086.PHYSICAL_MASK
+        self._manual_start = self.mem_layout.clocks
+        self._eu_bus_cycles = 0
+
+    def end_instruction(self)->int:
+        """Called after the instruction is simmed. Returns its modelled clocks."""
+        start = now = self.clocks
+        # The EU takes the instruction bytes from the queue, waiting on the BIU when it runs dry
+        needed = self._n_bytes
+        self._prefetch(now)
+        while needed:
+            while not self.queue_bytes:
+                if not self.in_flight:
+                    self.bus_free_at = max(self.bus_free_at, now)
+                    now = self.bus_free_at + BUS_CYCLE_CLOCKS
+                else:
+                    now = self.bus_free_at
+                self._prefetch(now)
+            taken = min(self.queue_bytes, needed)
+            self.queue_bytes -= taken
+            needed -= taken
+            if not self.in_flight:
+                # The BIU may have been idle on a full queue
+                self.bus_free_at = max(self.bus_free_at, now)
+        self.queue_wait_clocks += now - start
+
+        eu_clocks = self.mem_layout.clocks - self._manual_start
+        end = now + eu_clocks
+        if self._eu_bus_cycles:
+            eu_bus_clocks = self._eu_bus_cycles * BUS_CYCLE_CLOCKS
+            request = max(now, end - eu_bus_clocks)
+            self._prefetch(request)
+            if self.in_flight:
+                # The EU waits for the prefetch holding the bus
+                wait = self.bus_free_at - request
+                self.queue_bytes += self.in_flight
+                self.in_flight = 0
+                self.bus_wait_clocks += wait
+                end += wait
+            self.bus_free_at = end
+            self.eu_bus_cycles += self._eu_bus_cycles
+
+        self.last_clocks = end - start
+        self.clocks = end
+        self.n_instructions += 1
+        self.manual_clocks += eu_clocks
+        return self.last_clocks
+
+    def report(self)->str:
+        """Manual and modelled clocks of the run with the bus usage, as assembly comments."""
+        output = "; Prefetch queue model\n"
+        output += f"; Clocks: {self.manual_clocks} manual, {self.clocks} modelled"
+        if self.manual_clocks:
+            output += f" ({(self.clocks - self.manual_clocks) / self.manual_clocks:+.1%})"
+        output += f" over {self.n_instructions} instructions\n"
+        output += f"; Bus cycles: {self.prefetch_bus_cycles} prefetch, {self.eu_bus_cycles} EU memory\n"
+        output += (f"; EU waits: {self.queue_wait_clocks} clocks on the queue, "
+                   f"{self.bus_wait_clocks} clocks on prefetches holding the bus\n")
+        output += f"; Queue flushes: {self.n_flushes} ({self.n_discarded_bytes} prefetched bytes discarded)\n"
+        return output
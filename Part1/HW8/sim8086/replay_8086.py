@@ -0,0 +1,160 @@
+"""Deterministic record and replay of 8086 simulator runs.
+
+The simulator is deterministic: the same binary from the same initial state always runs the
+same way. So a recording doesn't keep a trace, only what can't be recomputed (the initial
+memory image, the only input the simulator has until port I/O is simmed) and a checkpoint of
+the state every `checkpoint_every` instructions. Replaying to instruction N restores the
+nearest checkpoint at or before N and runs forward from it, so looking at instruction
+5,000,000 of a long run costs at most `checkpoint_every` instructions of simming. Both run
+with exact flags, so the state at every instruction matches stepping the run from the start.
+
+Checkpoints are MemoryLayout8086 snapshots, so in memory they share every page that didn't
+change between them. On disk each checkpoint only stores the pages that changed since the
+previous one, and the file is zlib compressed.
+
+Author: Soumitra Goswami
+"""
+from __future__ import annotations
+import bisect
+import struct
+import typing as t
+import zlib
+from dataclasses import dataclass
+
+from . import instruction_utils_8086 as utils_8086
+from . import SG_HW8
+
+
+RECORDING_MAGIC = b"SG86REC1"
+# magic, checkpoint_every, code_start, n_instructions, n_checkpoints, binary size
+header_format = struct.Struct("<8sIIQII")
+# instruction count, flags, clocks, number of pages stored, then the 13 registers
+checkpoint_format = struct.Struct("<QHQI13H")
+page_index_format = struct.Struct("<I")
+
+
+@dataclass
+class Recording8086():
+    bin_data: bytes
+    checkpoint_every: int
+    # Physical address the binary was loaded at
+    code_start: int
+    # (instruction count, state before that instruction) in increasing count. The first is the initial state.
+    checkpoints: t.List[t.Tuple[int, utils_8086.MemoryLayout8086]]
+    # Instructions simmed by the recorded run
+    n_instructions: int = 0
+
+    def save(self, out_path: str):
+        out = bytearray(header_format.pack(RECORDING_MAGIC, self.checkpoint_every, self.code_start,
+                                           self.n_instructions, len(self.checkpoints), len(self.bin_data)))
+        out += self.bin_data
+        # Unchanged pages are the same objects as in the previous checkpoint.
+        prev_pages = utils_8086.PagedMemory8086().pages
+        for count, state in self.checkpoints:
+            pages = state.memory.pages
+            changed = [page_idx for page_idx, page in enumerate(pages)
+                       if page is not prev_pages[page_idx] and page != prev_pages[page_idx]]
+            out += checkpoint_format.pack(count, state.flags, state.clocks, len(changed), *state.registers)
+            for page_idx in changed:
+                out += page_index_format.pack(page_idx)
+                out += pages[page_idx]
+            prev_pages = pages
+        with open(out_path, 'wb') as ofh:
+            ofh.write(zlib.compress(out))
+
+    @classmethod
+    def from_file(cls, recording_path: str)->Recording8086:
+        with open(recording_path, 'rb') as f:
+            data = memoryview(zlib.decompress(f.read()))
+        magic, checkpoint_every, code_start, n_instructions, n_checkpoints, bin_size = header_format.unpack_from(data, 0)
+        if magic != RECORDING_MAGIC:
+            raise ValueError(f"{recording_path} is not a 8086 recording")
+        pos = header_format.size
+        bin_data = bytes(data[pos:pos + bin_size])
+        pos += bin_size
+
+        checkpoints = []
+        pages = utils_8086.PagedMemory8086().pages
+        for _ in range(n_checkpoints):
+            count, flags, clocks, n_pages, *registers = checkpoint_format.unpack_from(data, pos)
+            pos += checkpoint_format.size
+            pages = list(pages)
+            for _ in range(n_pages):
+                page_idx, = page_index_format.unpack_from(data, pos)
+                pos += page_index_format.size
+                pages[page_idx] = bytearray(data[pos:pos + utils_8086.PAGE_SIZE])
+                pos += utils_8086.PAGE_SIZE
+            memory = utils_8086.PagedMemory8086()
+            memory.pages = pages
+            state = utils_8086.MemoryLayout8086(registers=registers, flags=flags, memory=memory, clocks=clocks)
+            checkpoints.append((count, state))
+        return cls(bin_data, checkpoint_every, code_start, checkpoints, n_instructions)
+
+
+def record(sim: SG_HW8.Simulator, checkpoint_every: int = 100000,
+           max_instructions: t.Optional[int] = None)->Recording8086:
+    """Runs the simulator to the end (or max_instructions) keeping a checkpoint every checkpoint_every instructions."""
+    if checkpoint_every < 1:
+        raise ValueError(f"checkpoint_every needs to be at least 1. Got {checkpoint_every}")
+    sim.enable_exact_flags()
+    recording = Recording8086(sim.bin_data, checkpoint_every, sim.code_start,
+                              [(sim.instruction_count, sim.mem_layout.snapshot())])
+    count = 0
+    while not sim.is_halted:
+        batch = checkpoint_every
+        if max_instructions is not None:
+            batch = min(batch, max_instructions - count)
+            if batch <= 0:
+                break
+        count += sim.run(batch)
+        if not sim.is_halted:
+            recording.checkpoints.append((sim.instruction_count, sim.mem_layout.snapshot()))
+    recording.n_instructions = sim.instruction_count
+    return recording
+
+
+def replay_to(recording: Recording8086, index: int)->SG_HW8.Simulator:
+    """Returns a simulator about to run instruction `index` (0 based) of the recorded run."""
+    if not 0 <= index <= recording.n_instructions:
+        raise ValueError(f"Instruction {index} is outside of the {recording.n_instructions} recorded instructions")
+    counts = [count for count, _ in recording.checkpoints]
+    count, state = recording.checkpoints[bisect.bisect_right(counts, index) - 1]
+
+    sim = SG_HW8.Simulator(recording.bin_data, state.snapshot(), load_program=False)
+    # CS may have moved since the binary was loaded
+    sim.code_start = recording.code_start
+    sim.code_end = recording.code_start + len(recording.bin_data)
+    sim.is_halted = not sim._is_in_code()
+    sim.instruction_count = count
+    sim.enable_exact_flags()
+    sim.run(index - count)
+    return sim
+
+
+if __name__ == '__main__':
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Records a 8086 run or replays it to an instruction")
+    parser.add_argument("path", help="binary to record, or recording to replay with --at")
+    parser.add_argument("--record", help="write the recording of the binary's run to this file")
+    parser.add_argument("--every", type=int, default=100000, help="instructions between checkpoints")
+    parser.add_argument("--max-instructions", type=int, default=None)
+    parser.add_argument("--at", type=int, help="replay the recording to this instruction index")
+    parser.add_argument("--count", type=int, default=1, help="instructions to sim and print from --at")
+    args = parser.parse_args()
+
+    if args.record is not None:
+        recording = record(SG_HW8.Simulator.from_file(args.path), args.every, args.max_instructions)
+        recording.save(args.record)
+        print(f"Recorded {recording.n_instructions} instructions with {len(recording.checkpoints)} checkpoints")
+    elif args.at is not None:
+        sim = replay_to(Recording8086.from_file(args.path), args.at)
+        for _ in range(args.count):
+            if sim.is_halted:
+                break
+            index = sim.instruction_count
+            instruction, sim_out = sim.step()
+            print(f"; {index}: {instruction}\n{sim_out}")
+        print(SG_HW8.print_registers(sim.mem_layout.registers))
+    else:
+        parser.error("Either --record or --at is needed")
@@ -0,0 +1,108 @@
+"""Undo log for stepping the 8086 simulator backwards.
+
+UndoLog8086 keeps the old values of everything an instruction overwrites, so the last
+instructions can be undone one at a time (Simulator.step_back). Everything is kept in
+fixed size ring buffers of packed array entries, so a long run only keeps its last
+`max_steps` instructions and `max_mem_writes` memory writes and never grows:
+
+    step log:   13 registers and the flags (14 'H' words) plus the clocks, taken before each
+                instruction, and the index of its first memory write
+    memory log: one 'Q' per memory write: mem_loc << 17 | (n_bytes - 1) << 16 | old value
+
+Registers and flags are saved whole before each instruction instead of per write: many
+instructions update IP, SP, SI/DI and CX straight in `registers`, and 28 bytes per
+instruction is as cheap as logging the writes one by one. Memory writes come in as a
+MemoryObserver8086, so the log costs nothing unless attached.
+
+Author: Soumitra Goswami
+"""
+from __future__ import annotations
+from array import array
+
+from . import instruction_utils_8086 as utils_8086
+
+
+N_STEP_WORDS = 14 # 13 registers and the flags
+FLAGS_WORD = 13
+
+
+class UndoLog8086(utils_8086.MemoryObserver8086):
+    """Ring buffer of the state overwritten by the last `max_steps` instructions.
+    begin_instruction() is called before every instruction, undo() rolls the last ones back.
+    """
+    def __init__(self, mem_layout: utils_8086.MemoryLayout8086, max_steps: int = 4096, max_mem_writes: int = 65536):
+        if max_steps < 1 or max_mem_writes < 1:
+            raise ValueError(f"The undo log needs room for at least one entry. Got {max_steps} steps, {max_mem_writes} writes")
+        self.mem_layout = mem_layout
+        self.max_steps = max_steps
+        self.max_mem_writes = max_mem_writes
+        self.step_words = array('H', bytes(2 * N_STEP_WORDS * max_steps))
+        self.step_clocks = array('Q', bytes(8 * max_steps))
+        self.step_mem_starts = array('Q', bytes(8 * max_steps))
+        self.mem_writes = array('Q', bytes(8 * max_mem_writes))
+        # Running counts. Entry i is in slot i % size, and entries below the floor were overwritten.
+        self.n_steps = 0
+        self.step_floor = 0
+        self.n_mem_writes = 0
+        self.mem_floor = 0
+
+    def attach(self):
+        self.mem_layout.observers.append(self)
+
+    def detach(self):
+        self.mem_layout.observers.remove(self)
+
+    def begin_instruction(self):
+        """Saves the registers, flags and clocks before an instruction runs."""
+        layout = self.mem_layout
+        slot = self.n_steps % self.max_steps
+        base = slot * N_STEP_WORDS
+        self.step_words[base:base + FLAGS_WORD] = array('H', layout.registers)
+        self.step_words[base + FLAGS_WORD] = layout.flags
+        self.step_clocks[slot] = layout.clocks
+        self.step_mem_starts[slot] = self.n_mem_writes
+        self.n_steps += 1
+        if self.n_steps - self.step_floor > self.max_steps:
+            self.step_floor = self.n_steps - self.max_steps
+
+    def on_mem_write(self, mem_loc: int, n_bytes: int, old_value: int, new_value: int):
+        self.mem_writes[self.n_mem_writes % self.max_mem_writes] = (mem_loc << 17) | ((n_bytes - 1) << 16) | old_value
+        self.n_mem_writes += 1
+        if self.n_mem_writes - self.mem_floor > self.max_mem_writes:
+            self.mem_floor = self.n_mem_writes - self.max_mem_writes
+
+    def n_undoable(self)->int:
+        """Number of instructions that can still be undone. Older ones were pushed out of the ring buffers."""
+        count = 0
+        for step in range(self.n_steps - 1, self.step_floor - 1, -1):
+            if self.step_mem_starts[step % self.max_steps] < self.mem_floor:
+                break
+            count += 1
+        return count
+
+    def undo(self, n: int = 1)->int:
+        """Rolls the last n instructions back. Returns how many were undone, fewer if the log ran out."""
+        layout = self.mem_layout
+        n = min(n, self.n_undoable())
+        for _ in range(n):
+            slot = (self.n_steps - 1) % self.max_steps
+            mem_start = self.step_mem_starts[slot]
+            # Newest write first, so a location written twice ends up with its oldest value
+            for write in range(self.n_mem_writes - 1, mem_start - 1, -1):
+                entry = self.mem_writes[write % self.max_mem_writes]
+                mem_loc = entry >> 17
+                old_value = entry & 0xffff
+                # Not through set_mem_value, the undo isn't a write to log. write_block still drops stale decodes.
+                layout.write_block(mem_loc, bytes((old_value & 0xff,)))
+                if (entry >> 16) & 1:
+                    layout.write_block((mem_loc + 1) & utils_8086.PHYSICAL_MASK, bytes((old_value >> 8,)))
+            self.n_mem_writes = mem_start
+
+            base = slot * N_STEP_WORDS
+            layout.registers[:] = self.step_words[base:base + FLAGS_WORD].tolist()
+            layout.flags = self.step_words[base + FLAGS_WORD]
+            layout.clocks = self.step_clocks[slot]
+            self.n_steps -= 1
+        if n:
+            layout.update_segment_bases()
+        return n
@@ -0,0 +1,44 @@
+"""Batch simulator tests: every instance must end like its own Simulator run.
+
+Author: Soumitra Goswami
+"""
+import pytest
+
+np = pytest.importorskip("numpy")
+
+from sim8086 import SG_HW8
+from sim8086 import batch_sim_8086
+from sim8086 import instruction_utils_8086 as utils_8086
+
+# mov dx,[0] ; add dx,1 (4 times)
+# 0x10: l: add ax,bx ; sub cx,1 ; jne l ; cmp ax,10 ; jl +3 ; mov bx,1 ; mov [0x100],ax
+# Reads its own first bytes, loops CX times and branches on the sum
+DIVERGING_BIN = bytes.fromhex("8B160000" "83C201" "83C201" "83C201" "83C201"
+                              "01D8" "83E901" "75F9" "83F80A" "7C03" "BB0100" "A30001")
+# Per instance initial registers. 1:0 is the same physical address as 0:0x10
+INPUTS = {"CX": [1, 2, 3, 5, 8, 1], "BX": [1, 3, 0, 2, 4, 20],
+          "CS": [0, 1, 0, 1, 0, 0], "IP": [0, 0, 0x10, 0, 0, 0x10]}
+
+
+def scalar_run(bin_data, lane):
+    sim = SG_HW8.Simulator(bin_data)
+    for reg_name, values in INPUTS.items():
+        sim.mem_layout.set_reg_value(utils_8086.Address(reg_name, is_register=True), values[lane])
+    sim.run()
+    return sim
+
+
+def test_diverging_instances_match_scalar_runs():
+    n_instances = len(INPUTS["CX"])
+    batch = batch_sim_8086.BatchSimulator8086(DIVERGING_BIN, n_instances)
+    for reg_name, values in INPUTS.items():
+        batch.set_register(reg_name, values)
+    batch.run()
+    assert not batch.active.any()
+    for lane in range(n_instances):
+        sim = scalar_run(DIVERGING_BIN, lane)
+        layout = sim.mem_layout
+        assert batch.registers[:, lane].tolist() == list(layout.registers), f"instance {lane}"
+        assert int(batch.flags[lane]) == layout.flags, f"instance {lane}"
+        assert int(batch.instruction_count[lane]) == sim.instruction_count, f"instance {lane}"
+        assert batch.memory[lane, :0x200].tobytes() == layout.memory.read_block(0, 0x200), f"instance {lane}"
@@ -0,0 +1,73 @@
+"""Execution coverage tests: only the instructions that ran are marked.
+
+Author: Soumitra Goswami
+"""
+import pytest
+
+from sim8086 import SG_HW8
+from sim8086 import coverage_8086
+
+
+# mov ax,1 ; mov bx,2 ; mov cx,3
+THREE_MOVS_BIN = bytes.fromhex("B80100" "BB0200" "B90300")
+# mov cx,1 ; l: sub cx,1 ; jne l ; add ax,1
+FUSED_BIN = bytes.fromhex("B90100" "83E901" "75FB" "83C001")
+# mov ax,1 ; cmp ax,1 ; je +3 ; mov bx,2 ; mov cx,3   (the mov bx never runs)
+BRANCH_BIN = bytes.fromhex("B80100" "83F801" "7403" "BB0200" "B90300")
+
+
+def executed(coverage):
+    return [offset for offset in range(coverage.n_bytes) if coverage.is_executed(offset)]
+
+
+def test_run_marks_only_what_ran():
+    sim = SG_HW8.Simulator(THREE_MOVS_BIN)
+    sim.run(1)
+    assert executed(sim.coverage) == [0]
+    sim.run()
+    assert executed(sim.coverage) == [0, 3, 6]
+    assert sim.coverage.n_executed() == 3
+
+
+def test_fused_op_split_marks_only_its_first_instruction():
+    sim = SG_HW8.Simulator(FUSED_BIN)
+    sim.run(2)
+    assert executed(sim.coverage) == [0, 3]
+    sim.run()
+    assert executed(sim.coverage) == [0, 3, 6, 8]
+
+
+@pytest.mark.parametrize("bin_data", [THREE_MOVS_BIN, FUSED_BIN, BRANCH_BIN])
+def test_run_and_step_mark_the_same(bin_data):
+    ran = SG_HW8.Simulator(bin_data)
+    ran.run()
+    stepped = SG_HW8.Simulator(bin_data)
+    while not stepped.is_halted:
+        stepped.step()
+    assert ran.coverage.bitmap == stepped.coverage.bitmap
+
+
+def test_listing_marks_never_ran():
+    sim = SG_HW8.Simulator(BRANCH_BIN)
+    sim.run()
+    listing = sim.coverage.listing(BRANCH_BIN, SG_HW8.decode_instruction)
+    assert listing.startswith("; Coverage: 4/5 instructions ran (80.0%)")
+    never_ran = [line for line in listing.splitlines() if line.endswith("never ran")]
+    assert never_ran == ["MOV BX, 2 ; 0x0008 never ran"]
+
+
+def test_merge_and_file_round_trip(tmp_path):
+    first = coverage_8086.ExecutionCoverage8086(20)
+    first.mark(0)
+    second = coverage_8086.ExecutionCoverage8086(20)
+    second.mark(19)
+    first.write(str(tmp_path / "first.bin"))
+    second.write(str(tmp_path / "second.bin"))
+    merged = coverage_8086.merge_coverage_files([str(tmp_path / "first.bin"), str(tmp_path / "second.bin")],
+                                                str(tmp_path / "merged.bin"), 20)
+    assert executed(merged) == [0, 19]
+    assert coverage_8086.ExecutionCoverage8086.from_file(str(tmp_path / "merged.bin"), 20).bitmap == merged.bitmap
+    with pytest.raises(ValueError):
+        coverage_8086.ExecutionCoverage8086(20, bytearray(2))
+    with pytest.raises(ValueError):
+        first |= coverage_8086.ExecutionCoverage8086(8)
@@ -0,0 +1,80 @@
+"""Debugger tests: run() must stop where stepping says a breakpoint or watched access is.
+
+Author: Soumitra Goswami
+"""
+import pytest
+
+from sim8086 import SG_HW8
+
+# mov cx,3 ; l: add ax,1 ; sub cx,1 ; jne l ; add bx,1 ; add bx,1
+DEAD_FLAGS_LOOP_BIN = bytes.fromhex("B90300" "83C001" "83E901" "75F8" "83C301" "83C301")
+# mov word [0x100],5 ; add word [0x100],3 ; mov bx,[0x100] ; cmp bx,8 ; je +3 ; mov cx,1 ; mov dx,[0x100]
+MEMORY_BIN = bytes.fromhex("C70600010500" "8306000103" "8B1E0001" "83FB08" "7403" "B90100" "8B160001")
+
+
+def state(sim):
+    layout = sim.mem_layout
+    return list(layout.registers), layout.flags, layout.clocks, sim.instruction_count
+
+
+def stepped(bin_data, n):
+    sim = SG_HW8.Simulator(bin_data)
+    for _ in range(n):
+        sim.step()
+    return sim
+
+
+def stops(sim):
+    """Instruction counts run() stops at, and the events of each stop."""
+    out = []
+    while not sim.is_halted:
+        sim.run()
+        out.append((sim.instruction_count, [str(event) for event in sim.debug_events]))
+        sim.debug_events.clear()
+    return out
+
+
+@pytest.mark.parametrize("ip, counts", [(3, [1, 4, 7]), (9, [3, 6, 9])])
+def test_breakpoint_stops_on_every_arrival(ip, counts):
+    # ip 9 is the JNE of the fused SUB/JNE
+    sim = SG_HW8.Simulator(DEAD_FLAGS_LOOP_BIN)
+    sim.add_breakpoint(ip)
+    for count in counts:
+        sim.run()
+        assert sim.mem_layout.registers[12] == ip
+        assert state(sim) == state(stepped(DEAD_FLAGS_LOOP_BIN, count))
+        assert [str(event) for event in sim.debug_events] == [f"Breakpoint at ip:{ip:#x}"]
+        sim.debug_events.clear()
+    assert stops(sim) == [(12, [])]
+
+
+def test_removed_breakpoint():
+    sim = SG_HW8.Simulator(DEAD_FLAGS_LOOP_BIN)
+    sim.add_breakpoint(3)
+    sim.remove_breakpoint(3)
+    assert stops(sim) == [(12, [])]
+
+
+def test_write_watch():
+    sim = SG_HW8.Simulator(MEMORY_BIN)
+    sim.add_watchpoint(0x100, 0x102)
+    assert stops(sim) == [(1, ["Watchpoint: write of 2 bytes at 0x00100 (0x0->0x5) by ip:0x0"]),
+                          (2, ["Watchpoint: write of 2 bytes at 0x00100 (0x5->0x8) by ip:0x6"]),
+                          (6, [])]
+
+
+def test_read_watch_on_the_second_byte():
+    sim = SG_HW8.Simulator(MEMORY_BIN)
+    sim.add_watchpoint(0x101, 0x102, on_read=True, on_write=False)
+    assert [count for count, _ in stops(sim)] == [2, 3, 6]
+    assert state(sim) == state(stepped(MEMORY_BIN, 6))
+
+
+def test_removed_watch_detaches():
+    sim = SG_HW8.Simulator(MEMORY_BIN)
+    sim.add_watchpoint(0x100, 0x102)
+    sim.remove_watchpoint(0x100, 0x102)
+    assert sim.mem_layout.observers == []
+    assert stops(sim) == [(6, [])]
+    with pytest.raises(ValueError):
+        sim.add_watchpoint(0x100, 0x100)
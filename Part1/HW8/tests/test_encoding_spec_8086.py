@@ -0,0 +1,100 @@
+"""Encoding spec tests: the generated decoders must decode what the 8086 manual encodes.
+
+Author: Soumitra Goswami
+"""
+import pytest
+
+from sim8086 import SG_HW8
+from sim8086 import encoding_spec_8086
+
+# Hand assembled encodings of every row, and their listing
+ENCODINGS = [
+    ("89D9", "MOV CX, BX"),
+    ("8A00", "MOV AL, [BX + SI]"),
+    ("8B5604", "MOV DX, [BP+4]"),
+    ("8B8E3412", "MOV CX, [BP+4660]"),
+    ("884600", "MOV [BP], AL"),
+    ("C606000105", "MOV byte [256], 5"),
+    ("C78710003412", "MOV word [BX+16], 4660"),
+    ("B90C00", "MOV CX, 12"),
+    ("B0FF", "MOV AL, -1"),
+    ("A10020", "MOV AX, [8192]"),
+    ("A23412", "MOV [4660], AL"),
+    ("A30020", "MOV [8192], AX"),
+    ("8ED8", "MOV DS, AX"),
+    ("8CC0", "MOV AX, ES"),
+    ("8E1E0001", "MOV DS, [256]"),
+    ("01D8", "ADD AX, BX"),
+    ("0046FF", "ADD [BP-1], AL"),
+    ("03060001", "ADD AX, [256]"),
+    ("0405", "ADD AL, 5"),
+    ("05E803", "ADD AX, 1000"),
+    ("29D8", "SUB AX, BX"),
+    ("2A07", "SUB AL, [BX]"),
+    ("2C05", "SUB AL, 5"),
+    ("2D0010", "SUB AX, 4096"),
+    ("39D8", "CMP AX, BX"),
+    ("3B4602", "CMP AX, [BP+2]"),
+    ("3C05", "CMP AL, 5"),
+    ("3D0001", "CMP AX, 256"),
+    ("83C001", "ADD AX, 1"),
+    ("83E9FF", "SUB CX, -1"),
+    ("81C33412", "ADD BX, 4660"),
+    ("80C701", "ADD BH, 1"),
+    ("8306000103", "ADD word [256], 3"),
+    ("83F80A", "CMP AX, 10"),
+    ("80FF09", "CMP BH, 9"),
+    ("7502", "JNE $+4"),
+    ("74FE", "JE $+0"),
+    ("7C03", "JL $+5"),
+    ("E2F8", "LOOP $-6"),
+]
+
+
+@pytest.mark.parametrize("encoding, listing", ENCODINGS)
+def test_decodes_manual_encodings(encoding, listing):
+    code = bytes.fromhex(encoding)
+    # Bytes after the instruction must not be read into it
+    instruction, n_bytes = SG_HW8.decode_instruction(code + bytes.fromhex("FFFFFFFFFFFF"), 0)
+    assert (str(instruction), n_bytes) == (listing, len(code))
+
+
+def test_every_row_is_covered():
+    names = {SG_HW8.decode_opcode(bytes.fromhex(encoding)[0]).__name__ for encoding, _ in ENCODINGS}
+    assert names >= {spec.name for spec in encoding_spec_8086.encoding_specs if not spec.name.startswith("jmp_")}
+
+
+@pytest.mark.parametrize("spec", encoding_spec_8086.encoding_specs, ids=lambda spec: spec.name)
+def test_opcodes_reach_their_row(spec):
+    handler = encoding_spec_8086.op_funcs[encoding_spec_8086.opcode_keys(spec)[0]]
+    for key in encoding_spec_8086.opcode_keys(spec):
+        n_free = 10 - len(key)
+        for low_bits in range(1 << n_free):
+            first_byte = (int(key, 2) << n_free) | low_bits
+            assert SG_HW8.decode_opcode(first_byte) is handler, f"{first_byte:#04x}"
+
+
+def disp_bytes(mod, rm):
+    if mod == 0b01:
+        return 1
+    if mod == 0b10 or (mod == 0b00 and rm == 0b110):
+        return 2
+    return 0
+
+
+@pytest.mark.parametrize("opcode, n_data", [(0x8B, 0), (0x88, 0), (0x03, 0), (0x3A, 0), (0x8E, 0), (0x83, 1), (0x81, 2),
+                                            (0xC6, 1), (0xC7, 2)])
+def test_mod_rm_lengths(opcode, n_data):
+    for mod_rm in range(256):
+        mod, reg, rm = mod_rm >> 6, (mod_rm >> 3) & 0b111, mod_rm & 0b111
+        if opcode in (0x83, 0x81) and reg not in (0b000, 0b101, 0b111):
+            continue # Only ADD, SUB and CMP are simmed
+        if opcode == 0x8E and reg & 0b100:
+            continue # Not a segment register
+        _, n_bytes = SG_HW8.decode_instruction(bytes((opcode, mod_rm)) + bytes(6), 0)
+        assert n_bytes == 2 + disp_bytes(mod, rm) + n_data, f"{opcode:#04x} {mod_rm:#04x}"
+
+
+def test_bytes_need_8_bits():
+    with pytest.raises(ValueError):
+        encoding_spec_8086.parse_fields("1011 w reg | mod rm")
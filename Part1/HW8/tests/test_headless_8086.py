@@ -0,0 +1,74 @@
+"""Headless API tests: the typed results must match the state of a stepped simulator.
+
+Author: Soumitra Goswami
+"""
+import pytest
+
+from sim8086 import SG_HW8
+from sim8086 import headless_8086
+
+# mov cx,3 ; l: add ax,1 ; sub cx,1 ; jne l ; add bx,1 ; add bx,1
+LOOP_BIN = bytes.fromhex("B90300" "83C001" "83E901" "75F8" "83C301" "83C301")
+# mov sp,0x200 ; mov ax,0x100 ; mov es,ax ; mov cx,3 ; rep stosw ; push ax
+STACK_STRING_BIN = bytes.fromhex("BC0002" "B80001" "8EC0" "B90300" "F3AB" "50")
+PROGRAMS = [LOOP_BIN, STACK_STRING_BIN]
+
+
+def stepped_states(bin_data):
+    sim = SG_HW8.Simulator(bin_data)
+    states = []
+    while not sim.is_halted:
+        ip = sim.mem_layout.registers[12]
+        sim.step()
+        states.append((ip, tuple(sim.mem_layout.registers), sim.mem_layout.flags, sim.mem_layout.clocks))
+    return states
+
+
+@pytest.mark.parametrize("bin_data", PROGRAMS)
+def test_simulate_stops_like_stepping(bin_data):
+    states = stepped_states(bin_data)
+    for n, (_, registers, flags, clocks) in enumerate(states, 1):
+        result = headless_8086.simulate(bin_data, n)
+        assert (result.instruction_count, tuple(result.registers), result.flags, result.clocks) == (n, registers, flags, clocks)
+    result = headless_8086.simulate(bin_data)
+    assert result.is_halted
+    assert result.instruction_count == len(states)
+
+
+@pytest.mark.parametrize("bin_data", PROGRAMS)
+def test_iter_steps_matches_stepping(bin_data):
+    sim = SG_HW8.Simulator(bin_data)
+    records = list(headless_8086.iter_steps(sim))
+    states = stepped_states(bin_data)
+    assert [record.index for record in records] == list(range(len(states)))
+    assert [(record.ip, record.registers, record.flags, record.clocks) for record in records] == states
+    assert all(record.next_ip == record.registers[12] for record in records)
+    assert headless_8086.SimResult8086.from_simulator(sim) == headless_8086.simulate(bin_data)
+
+
+def test_iter_steps_resumes():
+    sim = SG_HW8.Simulator(LOOP_BIN)
+    first = list(headless_8086.iter_steps(sim, 4))
+    rest = list(headless_8086.iter_steps(sim))
+    assert len(first) == 4
+    assert [record.index for record in first + rest] == list(range(len(stepped_states(LOOP_BIN))))
+
+
+def test_step_record_text():
+    record = next(headless_8086.iter_steps(SG_HW8.Simulator(LOOP_BIN)))
+    assert str(record) == record.text == "MOV CX, 3 ; ip:0x0->0x3 Clocks: 4"
+
+
+def test_result(tmp_path):
+    bin_path = tmp_path / "loop.bin"
+    bin_path.write_bytes(LOOP_BIN)
+    result = headless_8086.simulate_file(str(bin_path))
+    assert result == headless_8086.simulate(LOOP_BIN)
+    assert (result.register("AX"), result.register("BX"), result.register("CX")) == (3, 2, 0)
+    assert result.modelled_clocks is None
+    assert "Modelled clocks" not in str(result)
+
+    modelled = headless_8086.simulate(LOOP_BIN, prefetch_model=True)
+    assert modelled.clocks == result.clocks
+    assert modelled.modelled_clocks >= modelled.clocks
+    assert f"Modelled clocks: {modelled.modelled_clocks}\n" in str(modelled)
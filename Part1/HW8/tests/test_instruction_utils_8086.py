@@ -0,0 +1,190 @@
+"""Instruction tests: block and fused sims must match the plain one instruction sims.
+
+Author: Soumitra Goswami
+"""
+import pytest
+
+from sim8086 import SG_HW8
+from sim8086 import instruction_utils_8086 as utils_8086
+
+# mov ax,0x100 ; mov es,ax ; mov word [0x200],0x4241 ; mov word [0x202],0x4443
+# ; mov word es:[0],0x4241 ; mov word es:[2],0x5843      DS:0x200 = "ABCD", ES:0 = "ABCX"
+STRING_SETUP = "B80001" "8EC0" "C70600024142" "C70602024344" "26C70600004142" "26C70602004358"
+STRING_BINS = {
+    # mov al,0x41 ; mov di,0x10 ; mov cx,5 ; rep stosb
+    "STOSB": bytes.fromhex(STRING_SETUP + "B041" "BF1000" "B90500" "F3AA"),
+    # mov si,0x200 ; mov di,0x10 ; mov cx,2 ; rep movsw
+    "MOVSW": bytes.fromhex(STRING_SETUP + "BE0002" "BF1000" "B90200" "F3A5"),
+    # mov si,0x200 ; mov cx,2 ; rep lodsw
+    "LODSW": bytes.fromhex(STRING_SETUP + "BE0002" "B90200" "F3AD"),
+    # mov si,0x200 ; mov di,0 ; mov cx,6 ; repe cmpsb       stops on the 4th byte
+    "CMPSB": bytes.fromhex(STRING_SETUP + "BE0002" "BF0000" "B90600" "F3A6"),
+    # mov al,0x43 ; mov di,0 ; mov cx,6 ; repne scasb       stops on the 3rd byte
+    "SCASB": bytes.fromhex(STRING_SETUP + "B043" "BF0000" "B90600" "F2AE"),
+    # mov ax,0x300 ; mov ds,ax ; mov si,0x200 ; mov di,0x10 ; mov cx,4 ; ss rep movsb
+    "SS MOVSB": bytes.fromhex(STRING_SETUP + "B80003" "8ED8" "BE0002" "BF1000" "B90400" "36F3A4"),
+}
+
+
+def state(sim):
+    layout = sim.mem_layout
+    return (list(layout.registers), layout.flags, layout.clocks,
+            layout.memory.read_block(0, 0x400), layout.memory.read_block(0x1000, 0x100))
+
+
+def ran(bin_data, per_element=False):
+    sim = SG_HW8.Simulator(bin_data)
+    if per_element:
+        # Memory observers make REP go element by element
+        sim.enable_undo_log()
+    sim.run()
+    return sim
+
+
+@pytest.mark.parametrize("name", STRING_BINS)
+def test_rep_block_matches_per_element(name):
+    bin_data = STRING_BINS[name]
+    assert state(ran(bin_data)) == state(ran(bin_data, per_element=True))
+
+
+def test_rep_stops_on_compare():
+    registers = ran(STRING_BINS["CMPSB"]).mem_layout.registers
+    assert (registers[2], registers[6], registers[7]) == (2, 0x204, 4)
+    registers = ran(STRING_BINS["SCASB"]).mem_layout.registers
+    assert (registers[2], registers[7]) == (3, 3)
+
+
+def test_string_source_segment_override():
+    # DS now points past the data, so only the SS override reads "ABCD"
+    sim = ran(STRING_BINS["SS MOVSB"])
+    assert sim.mem_layout.memory.read_block(0x1010, 4) == b"ABCD"
+    instruction, n_bytes = SG_HW8.decode_instruction(bytes.fromhex("36F3A4"), 0)
+    assert (str(instruction), n_bytes) == ("SS REP MOVSB", 3)
+
+
+# mov ax,0x100 ; mov ds,ax ; mov ax,0x200 ; mov ss,ax ; mov word [0x10],0x1234 ; mov bp,0x20
+# ; mov word [bp],0x5678 ; mov ax,0xffff ; mov es,ax ; mov word es:[0x1010],0xabcd
+SEGMENT_BIN = bytes.fromhex("B80001" "8ED8" "B80002" "8ED0" "C70610003412" "BD2000" "C746007856"
+                            "B8FFFF" "8EC0" "26C7061010CDAB")
+
+
+def test_segment_physical_addresses():
+    sim = SG_HW8.Simulator(SEGMENT_BIN)
+    sim.run()
+    layout = sim.mem_layout
+    assert (layout.segment_bases["DS"], layout.segment_bases["SS"], layout.segment_bases["ES"]) == (0x1000, 0x2000, 0xffff0)
+    # DS, SS through BP, and ES wrapping at 1 MiB
+    assert layout.memory.read_block(0x1010, 2) == bytes.fromhex("3412")
+    assert layout.memory.read_block(0x2020, 2) == bytes.fromhex("7856")
+    assert layout.memory.read_block(0x1000, 2) == bytes.fromhex("CDAB")
+
+
+def test_memory_fork_copies_pages_on_write():
+    memory = utils_8086.PagedMemory8086()
+    memory.write_block(0x0ffe, b"ABCD")
+    forked = memory.fork()
+    assert forked.pages[0] is memory.pages[0]
+    forked[0x0fff] = 0x58
+    memory[0x1000] = 0x59
+    assert memory.read_block(0x0ffe, 4) == b"ABYD"
+    assert forked.read_block(0x0ffe, 4) == b"AXCD"
+    # Pages neither side wrote to stay shared
+    assert forked.pages[2] is memory.pages[2]
+
+
+def test_snapshot_restores_again_and_again():
+    sim = SG_HW8.Simulator(SEGMENT_BIN)
+    sim.run(3)
+    layout = sim.mem_layout
+    snapshot = layout.snapshot()
+    sim.run()
+    finished = (list(layout.registers), layout.flags, layout.clocks, dict(layout.segment_bases),
+                layout.memory.read_block(0x1000, 0x1100))
+    for _ in range(2):
+        layout.restore(snapshot)
+        assert layout.segment_bases["SS"] == 0 and layout.memory[0x2020] == 0
+        SG_HW8.Simulator(SEGMENT_BIN, layout, load_program=False).run()
+        assert (list(layout.registers), layout.flags, layout.clocks, dict(layout.segment_bases),
+                layout.memory.read_block(0x1000, 0x1100)) == finished
+    assert snapshot.memory[0x2020] == 0
+
+
+STACK_BINS = {
+    # cmp ax,ax ; je main ; sub: add ax,ax ; pushf ; pop dx ; ret 2
+    # main: mov sp,0x200 ; mov ax,5 ; push ax ; call sub ; push ax ; pop bx
+    "near": bytes.fromhex("39C0" "7407" "01C0" "9C" "5A" "C20200" "BC0002" "B80500" "50" "E8EFFF" "50" "5B"),
+    # cmp ax,ax ; je main ; 0x10: mov ax,cs ; retf ; main: call 0x1:0
+    "far": bytes.fromhex("39C0" "740F").ljust(0x10, b"\x00") + bytes.fromhex("8CC8" "CB" "9A00000100"),
+    # mov sp,0x200 ; push sp ; pop word [0x100] ; mov ax,0xffff ; push ax ; popf
+    "push pop": bytes.fromhex("BC0002" "54" "8F060001" "B8FFFF" "50" "9D"),
+}
+
+
+def stepped(bin_data):
+    sim = SG_HW8.Simulator(bin_data)
+    while not sim.is_halted:
+        sim.step()
+    return sim
+
+
+@pytest.mark.parametrize("name", STACK_BINS)
+def test_stack_run_matches_step(name):
+    assert state(ran(STACK_BINS[name])) == state(stepped(STACK_BINS[name]))
+
+
+def test_near_call_and_ret_with_pop():
+    layout = ran(STACK_BINS["near"]).mem_layout
+    # AX doubled by the subroutine and copied to BX, DX its flags (PF), the argument popped by RET 2
+    assert (layout.registers[0], layout.registers[1], layout.registers[3], layout.registers[4]) == (10, 10, 4, 0x200)
+    assert layout.memory.read_block(0x1fc, 2) == bytes.fromhex("1500")
+
+
+def test_far_call_and_retf():
+    layout = ran(STACK_BINS["far"]).mem_layout
+    # The subroutine ran with CS 1, RETF went back to CS 0 after the call
+    assert (layout.registers[0], layout.registers[9], layout.registers[12], layout.registers[4]) == (1, 0, 0x18, 0)
+    assert layout.memory.read_block(0xfffc, 4) == bytes.fromhex("18000000")
+
+
+def test_push_sp_and_popf():
+    layout = ran(STACK_BINS["push pop"]).mem_layout
+    # PUSH SP pushes SP after the decrement, POPF only keeps the flags the 8086 has
+    assert layout.memory.read_block(0x100, 2) == bytes.fromhex("FE01")
+    assert layout.flags == 0xfd5
+    assert layout.registers[4] == 0x200
+
+
+def reference_alu(dest, src, is_add, n_bytes):
+    value_mask = 0xffff if n_bytes == 2 else 0xff
+    res = (dest + src if is_add else dest - src) & value_mask
+    flags = utils_8086.calc_flags(0, res, dest, src, 0b000 if is_add else 0b101, n_bytes)
+    return res, flags & utils_8086.arith_flags_mask
+
+
+@pytest.mark.parametrize("is_add", [True, False])
+def test_byte_alu_tables_match_calc_flags(is_add):
+    for dest in range(256):
+        for src in range(256):
+            assert utils_8086.alu(dest, src, is_add, 1) == reference_alu(dest, src, is_add, 1), (dest, src)
+
+
+@pytest.mark.parametrize("is_add", [True, False])
+def test_word_alu_matches_calc_flags(is_add):
+    edges = [0, 1, 0x7f, 0x80, 0xff, 0x100, 0x7fff, 0x8000, 0x8001, 0xfffe, 0xffff]
+    for dest in edges:
+        for src in edges:
+            assert utils_8086.alu(dest, src, is_add, 2) == reference_alu(dest, src, is_add, 2), (dest, src)
+
+
+def test_byte_alu_cache_file(tmp_path, monkeypatch):
+    cache_path = tmp_path / "tables.bin"
+    monkeypatch.setattr(utils_8086, "byte_alu_cache_path", str(cache_path))
+    monkeypatch.setattr(utils_8086, "byte_alu_tables", None)
+    built = utils_8086.load_byte_alu_tables()
+    assert cache_path.stat().st_size == 6 * 0x10000
+    monkeypatch.setattr(utils_8086, "byte_alu_tables", None)
+    assert utils_8086.load_byte_alu_tables() == built
+    # A cut off file is built again
+    cache_path.write_bytes(cache_path.read_bytes()[:100])
+    monkeypatch.setattr(utils_8086, "byte_alu_tables", None)
+    assert utils_8086.load_byte_alu_tables() == built
@@ -0,0 +1,130 @@
+"""Job server tests: jobs reusing one worker's Simulator must match fresh runs.
+
+Author: Soumitra Goswami
+"""
+import asyncio
+import base64
+import contextlib
+import os
+import socket
+import threading
+import time
+
+from sim8086 import headless_8086
+from sim8086 import instruction_utils_8086 as utils_8086
+from sim8086 import job_server_8086
+
+
+# cmp ax,bx ; jne +2 ; add al,0 ; add al,0
+# The fused CMP/JNE skips its flags because both exits overwrite them
+FLAGS_DEAD_BIN = bytes.fromhex("39D8750204000400")
+# Same CMP/JNE, but the code after it pushes the flags
+FLAGS_READ_BIN = bytes.fromhex("39D875029C9C9C9C")
+# mov cx,1 ; sub cx,1 ; jne -5 ; add ax,1
+BUDGET_BIN = bytes.fromhex("B9010083E90175FB83C001")
+
+
+def job(bin_data, **kwargs):
+    return dict(kwargs, id=0, binary=base64.b64encode(bin_data).decode())
+
+
+def expected(bin_data, max_instructions=None):
+    sim_result = headless_8086.simulate(bin_data, max_instructions)
+    return ({name: sim_result.register(name) for name in job_server_8086.register_names},
+            utils_8086.serialize_flags(sim_result.flags))
+
+
+def test_jobs_in_a_row_match_fresh_runs():
+    # run_job keeps one Simulator per process, like a pool worker
+    for bin_data in (FLAGS_DEAD_BIN, FLAGS_READ_BIN, FLAGS_DEAD_BIN, BUDGET_BIN):
+        result = job_server_8086.run_job(job(bin_data))
+        assert result["status"] == "halted"
+        assert (result["registers"], result["flags_text"]) == expected(bin_data)
+
+
+def test_budget_stop_flags():
+    result = job_server_8086.run_job(job(BUDGET_BIN, max_instructions=3))
+    assert result["status"] == "budget"
+    assert result["instruction_count"] == 3
+    assert result["flags_text"] == "PZ"
+    assert (result["registers"], result["flags_text"]) == expected(BUDGET_BIN, 3)
+
+
+@contextlib.contextmanager
+def running_server(unix_path):
+    """Serves on unix_path with one worker in a thread. Yields once the server accepts connections."""
+    job_server = job_server_8086.JobServer8086(n_workers=1)
+    loop = asyncio.new_event_loop()
+    serve_task = loop.create_task(job_server.serve(unix_path))
+
+    def serve():
+        try:
+            loop.run_until_complete(serve_task)
+        except asyncio.CancelledError:
+            pass
+
+    thread = threading.Thread(target=serve)
+    thread.start()
+    # submit_jobs blocks on the results. A missing result fails the test instead of hanging it.
+    default_timeout = socket.getdefaulttimeout()
+    socket.setdefaulttimeout(30)
+    try:
+        deadline = time.monotonic() + 30
+        while not os.path.exists(unix_path):
+            assert time.monotonic() < deadline and thread.is_alive(), "Job server didn't start"
+            time.sleep(0.01)
+        yield
+    finally:
+        socket.setdefaulttimeout(default_timeout)
+        loop.call_soon_threadsafe(serve_task.cancel)
+        thread.join()
+        loop.close()
+
+
+def test_two_jobs_on_one_worker(tmp_path):
+    unix_path = str(tmp_path / "sim8086.sock")
+    with running_server(unix_path):
+        # One connection at a time, so the second job runs after the first on the one worker
+        first, = job_server_8086.submit_jobs([{"binary": FLAGS_DEAD_BIN}], unix_path)
+        second, = job_server_8086.submit_jobs([{"binary": FLAGS_READ_BIN}], unix_path)
+    assert (first["registers"], first["flags_text"]) == expected(FLAGS_DEAD_BIN)
+    assert (second["registers"], second["flags_text"]) == expected(FLAGS_READ_BIN)
+    assert second["flags_text"] == "PZ"
+
+
+def failing_run(self, max_instructions=None):
+    raise RuntimeError("simulator bug")
+
+
+def failing_run_job(job):
+    raise ZeroDivisionError("worker bug")
+
+
+def test_unexpected_simulator_error_is_a_result(monkeypatch):
+    monkeypatch.setattr(job_server_8086.SG_HW8.Simulator, "run", failing_run)
+    result = job_server_8086.run_job(job(BUDGET_BIN))
+    assert result["status"] == "error"
+    assert result["error"] == "RuntimeError: simulator bug"
+
+
+def test_unexpected_errors_reach_the_client(tmp_path, monkeypatch):
+    unix_path = str(tmp_path / "sim8086.sock")
+    # The worker is forked after the patch, so it fails inside run_job
+    monkeypatch.setattr(job_server_8086.SG_HW8.Simulator, "run", failing_run)
+    with running_server(unix_path):
+        in_worker, = job_server_8086.submit_jobs([{"binary": BUDGET_BIN}], unix_path)
+        # Fails outside of run_job, so no worker catches it
+        monkeypatch.setattr(job_server_8086, "run_job", failing_run_job)
+        in_server, = job_server_8086.submit_jobs([{"binary": BUDGET_BIN}], unix_path)
+    assert (in_worker["status"], in_worker["error"]) == ("error", "RuntimeError: simulator bug")
+    assert in_server["status"] == "error"
+    assert in_server["error"] == "ZeroDivisionError: worker bug"
+
+
+def test_same_job_twice_reports_the_same():
+    # The second run reset()s the worker's Simulator and reuses its cached ops
+    first = job_server_8086.run_job(job(BUDGET_BIN))
+    second = job_server_8086.run_job(job(BUDGET_BIN))
+    for key in ("status", "registers", "flags", "instruction_count", "clocks", "instructions_ran"):
+        assert second[key] == first[key], key
+    assert first["instructions_ran"] == 4
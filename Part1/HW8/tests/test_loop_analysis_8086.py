@@ -0,0 +1,101 @@
+"""Loop analysis tests: infinite loops are only reported once the whole state repeats, and loop stats count
+every entry and iteration.
+
+Author: Soumitra Goswami
+"""
+import pytest
+
+from sim8086 import SG_HW8
+from sim8086 import loop_analysis_8086
+
+# mov cx,3 ; l: add ax,1 ; sub cx,1 ; jne l ; add bx,1 ; add bx,1
+COUNTED_LOOP_BIN = bytes.fromhex("B90300" "83C001" "83E901" "75F8" "83C301" "83C301")
+# l: add byte [0x100],1 ; cmp ax,bx ; je l        Registers repeat every iteration, memory every 256
+MEMORY_CYCLE_BIN = bytes.fromhex("8006000101" "39D8" "74F7")
+# mov dx,2 ; o: mov cx,3 ; i: add ax,1 ; sub cx,1 ; jne i ; sub dx,1 ; jne o
+NESTED_LOOP_BIN = bytes.fromhex("BA0200" "B90300" "83C001" "83E901" "75F8" "83EA01" "75F0")
+
+
+def detecting(bin_data):
+    sim = SG_HW8.Simulator(bin_data)
+    sim.enable_loop_detection()
+    return sim
+
+
+def test_memory_is_part_of_the_state():
+    sim = detecting(MEMORY_CYCLE_BIN)
+    with pytest.raises(loop_analysis_8086.InfiniteLoopError) as error:
+        sim.run(100000)
+    assert (error.value.ip_start, error.value.ip_end, error.value.n_backward_jumps) == (0, 7, 256)
+    # Brent's algorithm finds the cycle within its second lap
+    assert sim.instruction_count <= 3 * 256 * 2
+
+
+def test_step_finds_the_same_cycle():
+    sim = detecting(MEMORY_CYCLE_BIN)
+    with pytest.raises(loop_analysis_8086.InfiniteLoopError):
+        while True:
+            sim.step()
+    ran = detecting(MEMORY_CYCLE_BIN)
+    with pytest.raises(loop_analysis_8086.InfiniteLoopError):
+        ran.run()
+    assert sim.instruction_count == ran.instruction_count
+
+
+def test_ending_loop_runs_as_without_detection():
+    sim = detecting(COUNTED_LOOP_BIN)
+    sim.run()
+    plain = SG_HW8.Simulator(COUNTED_LOOP_BIN)
+    plain.run()
+    assert sim.mem_layout.registers == plain.mem_layout.registers
+    assert sim.instruction_count == plain.instruction_count
+
+
+def loop_stats(bin_data, use_run):
+    sim = SG_HW8.Simulator(bin_data)
+    sim.enable_loop_stats()
+    if use_run:
+        sim.run()
+    else:
+        while not sim.is_halted:
+            sim.step()
+    return sim
+
+
+def test_loop_stats_run_matches_step():
+    for bin_data in (COUNTED_LOOP_BIN, NESTED_LOOP_BIN):
+        ran = loop_stats(bin_data, use_run=True)
+        stepped = loop_stats(bin_data, use_run=False)
+        assert ran.loop_stats.loops == stepped.loop_stats.loops
+        assert ran.loop_stats.report() == stepped.loop_stats.report()
+
+
+def test_counted_loop_stats():
+    loop = loop_stats(COUNTED_LOOP_BIN, use_run=True).loop_stats.loops[3]
+    assert (loop.header, loop.end, loop.n_entries, loop.n_iterations) == (3, 0xb, 1, 3)
+    # The first iteration started before the loop was known, so only the second is timed
+    assert loop.n_timed == 1
+    # add 4 + sub 4 + taken jne 16
+    assert (loop.instructions_per_iteration, loop.clocks_per_iteration) == (3.0, 24.0)
+
+
+def test_nested_loop_stats():
+    loops = loop_stats(NESTED_LOOP_BIN, use_run=True).loop_stats.loops
+    inner, outer = loops[6], loops[3]
+    assert (inner.n_entries, inner.n_iterations, inner.trips_per_entry) == (2, 6, 3.0)
+    assert (inner.n_timed, inner.instructions_per_iteration) == (3, 3.0)
+    assert (outer.end, outer.n_entries, outer.n_iterations, outer.n_timed) == (0x13, 1, 2, 0)
+
+
+def test_loop_stats_reset_and_report():
+    sim = loop_stats(NESTED_LOOP_BIN, use_run=True)
+    report = sim.loop_stats.report()
+    sim.reset()
+    assert not sim.loop_stats.loops
+    sim.run()
+    assert sim.loop_stats.report() == report
+    lines = report.splitlines()
+    assert lines[0] == "; Loops: 2"
+    # Most clocks first
+    assert lines[1].startswith(";   ip 0x0006-0x000e (8 bytes): 2 entries, 6 iterations, 3.0 trips per entry")
+    assert len(sim.loop_stats.report(1).splitlines()) == 2
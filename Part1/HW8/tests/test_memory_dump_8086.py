@@ -0,0 +1,76 @@
+"""Dump tests: files must hold the memory bytes as read_block() sees them.
+
+Author: Soumitra Goswami
+"""
+import os
+
+import pytest
+
+from sim8086 import instruction_utils_8086 as utils_8086
+from sim8086 import memory_dump_8086
+
+PIXELS = bytes(range(4 * 3 * 2))
+
+
+def memory_with_pixels(mem_loc):
+    memory = utils_8086.PagedMemory8086()
+    memory.write_block(mem_loc, PIXELS)
+    return memory
+
+
+def test_dump_across_pages(tmp_path):
+    # The range starts and ends inside a page and spans three
+    memory = memory_with_pixels(0x1ff0)
+    memory.write_block(0x2ff8, b"end")
+    out_path = tmp_path / "dump.bin"
+    memory_dump_8086.dump_memory(memory, str(out_path), 0x1ff0, 0x1010)
+    assert out_path.read_bytes() == memory.read_block(0x1ff0, 0x1010)
+
+
+def test_full_dump(tmp_path):
+    out_path = tmp_path / "dump.bin"
+    memory_dump_8086.dump_memory(memory_with_pixels(0xfffe8), str(out_path))
+    data = out_path.read_bytes()
+    assert len(data) == 0x100000 and data[0xfffe8:] == PIXELS
+
+
+def test_short_writes(tmp_path, monkeypatch):
+    real_writev = os.writev
+    monkeypatch.setattr(os, "writev", lambda fd, buffers: real_writev(fd, [bytes(buffers[0][:3])]))
+    memory = memory_with_pixels(0xffc)
+    out_path = tmp_path / "dump.bin"
+    memory_dump_8086.dump_memory(memory, str(out_path), 0xffc, len(PIXELS))
+    assert out_path.read_bytes() == PIXELS
+
+
+def test_dump_without_writev(tmp_path, monkeypatch):
+    monkeypatch.delattr(os, "writev", raising=False)
+    out_path = tmp_path / "dump.bin"
+    memory_dump_8086.dump_memory(memory_with_pixels(0xffc), str(out_path), 0xffc, len(PIXELS))
+    assert out_path.read_bytes() == PIXELS
+
+
+def test_framebuffer_formats(tmp_path):
+    memory = memory_with_pixels(0xff8)
+    memory_dump_8086.export_framebuffer(memory, str(tmp_path / "f.rgba"), 0xff8, 3, 2)
+    assert (tmp_path / "f.rgba").read_bytes() == PIXELS
+    memory_dump_8086.export_framebuffer(memory, str(tmp_path / "f.pam"), 0xff8, 3, 2)
+    header = b"P7\nWIDTH 3\nHEIGHT 2\nDEPTH 4\nMAXVAL 255\nTUPLTYPE RGB_ALPHA\nENDHDR\n"
+    assert (tmp_path / "f.pam").read_bytes() == header + PIXELS
+    memory_dump_8086.export_framebuffer(memory, str(tmp_path / "f.ppm"), 0xff8, 3, 2)
+    rgb = bytes(val for i, val in enumerate(PIXELS) if i % 4 != 3)
+    assert (tmp_path / "f.ppm").read_bytes() == b"P6\n3 2\n255\n" + rgb
+    # The format given wins over the extension
+    memory_dump_8086.export_framebuffer(memory, str(tmp_path / "f.img"), 0xff8, 3, 2, "rgba")
+    assert (tmp_path / "f.img").read_bytes() == PIXELS
+
+
+def test_ranges_outside_memory(tmp_path):
+    memory = utils_8086.PagedMemory8086()
+    out_path = str(tmp_path / "out")
+    with pytest.raises(ValueError):
+        memory_dump_8086.dump_memory(memory, out_path, 0xfffff, 2)
+    with pytest.raises(ValueError):
+        memory_dump_8086.export_framebuffer(memory, out_path + ".pam", 0xffff0, 4, 2)
+    with pytest.raises(ValueError):
+        memory_dump_8086.export_framebuffer(memory, out_path + ".bmp", 0, 4, 2)
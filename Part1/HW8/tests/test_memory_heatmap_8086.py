@@ -0,0 +1,56 @@
+"""Heatmap tests: run() must count the same accesses as step().
+
+Author: Soumitra Goswami
+"""
+import pytest
+
+from sim8086 import SG_HW8
+
+# mov word [0x100],5 ; add word [0x100],3 ; mov bx,[0x100] ; cmp bx,8 ; je +3 ; mov cx,1 ; mov dx,[0x100]
+MEMORY_BIN = bytes.fromhex("C70600010500" "8306000103" "8B1E0001" "83FB08" "7403" "B90100" "8B160001")
+# mov ax,0x100 ; mov es,ax ; mov di,0x10 ; mov cx,5 ; rep stosb ; mov word [0x10f],ax
+STORES_BIN = bytes.fromhex("B80001" "8EC0" "BF1000" "B90500" "F3AA" "A30F01")
+
+
+def heatmap(bin_data, use_step=False):
+    sim = SG_HW8.Simulator(bin_data)
+    sim.enable_memory_heatmap()
+    if use_step:
+        while not sim.is_halted:
+            sim.step()
+    else:
+        sim.run()
+    return sim.memory_heatmap
+
+
+@pytest.mark.parametrize("bin_data", [MEMORY_BIN, STORES_BIN])
+def test_run_counts_like_step(bin_data):
+    ran = heatmap(bin_data)
+    stepped = heatmap(bin_data, use_step=True)
+    assert (ran.reads, ran.writes, ran.strides) == (stepped.reads, stepped.writes, stepped.strides)
+
+
+def test_counts_per_line():
+    counts = heatmap(MEMORY_BIN)
+    # The ADD reads and writes, the three other loads read
+    assert (counts.reads[0x10], counts.writes[0x10]) == (3, 2)
+    counts = heatmap(STORES_BIN)
+    # Every REP element is counted, and the word at 0x10f touches two lines
+    assert counts.writes[0x101] == 5
+    assert (counts.writes[0x10], counts.writes[0x11]) == (1, 1)
+    assert counts.strides[1] == 4
+    assert counts.working_set() == 3
+
+
+def test_report_and_pgm(tmp_path):
+    counts = heatmap(STORES_BIN)
+    report = counts.report()
+    assert "; Working set: 3 lines (48 bytes), 0 reads, 7 writes" in report
+    assert ";   0x01010: 0 reads, 5 writes" in report
+    pgm_path = tmp_path / "heat.pgm"
+    counts.write_pgm(str(pgm_path))
+    data = pgm_path.read_bytes()
+    header = b"P5\n256 256\n255\n"
+    assert data.startswith(header) and len(data) == len(header) + 0x10000
+    # The hottest line is the brightest
+    assert data[len(header) + 0x101] == 255
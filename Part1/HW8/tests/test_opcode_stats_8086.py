@@ -0,0 +1,94 @@
+"""Opcode statistics tests: counts taken from the compiled ops must match decoding every instruction run.
+
+Author: Soumitra Goswami
+"""
+import collections
+
+import pytest
+
+from sim8086 import SG_HW8
+from sim8086 import opcode_stats_8086
+
+# mov bx,0x100 ; mov si,2 ; mov cx,2 ; mov word [bx+si],5 ;
+# l: add ax,[bx+si] ; mov [0x200],ax ; mov ax,[bx+1] ; sub cx,1 ; jne l
+ADDRESSING_BIN = bytes.fromhex("BB0001" "BE0200" "B90200" "C7000500" "0300" "A30002" "8B870100" "83E901" "75F2")
+# mov sp,0x200 ; mov ax,0x100 ; mov es,ax ; mov cx,3 ; rep stosw ; push ax
+STACK_STRING_BIN = bytes.fromhex("BC0002" "B80001" "8EC0" "B90300" "F3AB" "50")
+PROGRAMS = [ADDRESSING_BIN, STACK_STRING_BIN]
+
+
+def decoded_counts(bin_data):
+    """Counts by decoding each instruction before stepping it."""
+    sim = SG_HW8.Simulator(bin_data)
+    stats = opcode_stats_8086.OpcodeStats8086(SG_HW8.op_funcs)
+    counts = collections.Counter()
+    while not sim.is_halted:
+        pc = sim.mem_layout.segment_bases["CS"] + sim.mem_layout.registers[12]
+        instruction, _ = sim._decode(sim.mem_layout.registers[12])
+        counts[stats.index(SG_HW8.decode_opcode(sim.mem_layout.memory[pc]), instruction)] += 1
+        sim.step()
+    return counts
+
+
+def counted(stats):
+    return collections.Counter({idx: count for idx, count in enumerate(stats.counts) if count})
+
+
+@pytest.mark.parametrize("bin_data", PROGRAMS)
+@pytest.mark.parametrize("use_run", [True, False])
+def test_counts_match_decoding(bin_data, use_run):
+    sim = SG_HW8.Simulator(bin_data)
+    sim.enable_opcode_stats()
+    if use_run:
+        sim.run()
+    else:
+        while not sim.is_halted:
+            sim.step()
+    assert counted(sim.opcode_stats) == decoded_counts(bin_data)
+    assert sum(sim.opcode_stats.counts) == sim.instruction_count
+
+
+def test_address_forms():
+    sim = SG_HW8.Simulator(ADDRESSING_BIN)
+    sim.enable_opcode_stats()
+    sim.run()
+    counts = sim.opcode_stats.counts
+    n_forms = opcode_stats_8086.N_FORMS
+    form_counts = [sum(counts[form::n_forms]) for form in range(n_forms)]
+    assert form_counts[opcode_stats_8086.FORM_NO_MEMORY] == 7
+    assert form_counts[1 + opcode_stats_8086.utils_8086.encode_address.index(["BX", "SI"])] == 3
+    assert form_counts[1 + opcode_stats_8086.utils_8086.encode_address.index(["BX"])] == 2
+    assert form_counts[opcode_stats_8086.FORM_DIRECT] == 2
+
+
+def test_string_operands_arent_modrm_forms():
+    sim = SG_HW8.Simulator(STACK_STRING_BIN)
+    sim.enable_opcode_stats()
+    sim.run()
+    counts = sim.opcode_stats.counts
+    assert sum(counts[opcode_stats_8086.FORM_NO_MEMORY::opcode_stats_8086.N_FORMS]) == sim.instruction_count
+
+
+def test_reset_clears_counts():
+    sim = SG_HW8.Simulator(ADDRESSING_BIN)
+    sim.enable_opcode_stats()
+    sim.run()
+    first = counted(sim.opcode_stats)
+    sim.reset()
+    assert not any(sim.opcode_stats.counts)
+    sim.run()
+    assert counted(sim.opcode_stats) == first
+
+
+def test_histogram():
+    sim = SG_HW8.Simulator(ADDRESSING_BIN)
+    sim.enable_opcode_stats()
+    assert sim.opcode_stats.histogram() == "; Opcode statistics: 0 instructions\n"
+    sim.run()
+    histogram = sim.opcode_stats.histogram()
+    lines = histogram.splitlines()
+    assert lines[0] == "; Opcode statistics: 14 instructions"
+    # Most run first
+    assert lines[1].split()[1:5] == ["mov_immediate_to_reg", "-", "3", "21.4%"]
+    assert "; Addressing forms:" in lines
+    assert len(sim.opcode_stats.histogram(2).splitlines()) == len(lines) - 5
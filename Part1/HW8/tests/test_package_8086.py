@@ -0,0 +1,42 @@
+"""Package tests: importing the simulator loads only the decoder and the core.
+
+Author: Soumitra Goswami
+"""
+import os
+import subprocess
+import sys
+
+import sim8086
+from sim8086 import SG_HW8
+
+# Modules that should stay unloaded until their enable_x() or the command line needs them
+OPT_IN_MODULES = ("loop_analysis_8086", "memory_heatmap_8086", "undo_log_8086", "debugger_8086",
+                  "prefetch_queue_8086", "opcode_stats_8086", "memory_dump_8086", "headless_8086",
+                  "job_server_8086", "replay_8086", "parallel_disassembly_8086", "batch_sim_8086")
+
+PACKAGE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(sim8086.__file__)))
+
+
+def loaded_after(code: str) -> set:
+    out = subprocess.run([sys.executable, "-c", code + "\nimport sys\n"
+                          "print(' '.join(m for m in sys.modules if m.startswith('sim8086.')))"],
+                         cwd=PACKAGE_DIR, capture_output=True, text=True, check=True)
+    return {m.split(".", 1)[1] for m in out.stdout.split()}
+
+
+def test_import_loads_only_the_core():
+    loaded = loaded_after("import sim8086.SG_HW8")
+    assert loaded.isdisjoint(OPT_IN_MODULES), loaded
+
+
+def test_enable_loads_its_module():
+    loaded = loaded_after("from sim8086 import SG_HW8\nSG_HW8.Simulator(bytes([0x90])).enable_undo_log()")
+    assert "undo_log_8086" in loaded
+    assert "debugger_8086" not in loaded
+
+
+def test_watchpoint_without_import():
+    sim = SG_HW8.Simulator(bytes.fromhex("90"))
+    sim.add_watchpoint(0x100, 0x102)
+    sim.remove_watchpoint(0x100, 0x102)
+    assert not sim.watchpoints.watches
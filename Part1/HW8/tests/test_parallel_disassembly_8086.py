@@ -0,0 +1,54 @@
+"""Parallel disassembly tests: the stitched chunks must list what one linear sweep does.
+
+Author: Soumitra Goswami
+"""
+import random
+
+import pytest
+
+from sim8086 import parallel_disassembly_8086
+
+CODE = bytes.fromhex("B90300" "83C001" "83E901" "75F8" "83C301" "C70600010500" "8306000103" "8B1E0001"
+                     "BC0002" "54" "8F060001" "39C0" "7407" "01C0" "9C" "5A" "C20200" "26C7061010CDAB")
+
+
+def mixed_binary(n_pieces=300, seed=8086):
+    # Code with random bytes between it, so the sweep has to resynchronize
+    rng = random.Random(seed)
+    pieces = [CODE if rng.random() < 0.5 else bytes(rng.randrange(256) for _ in range(rng.randint(1, 40)))
+              for _ in range(n_pieces)]
+    return b"".join(pieces)
+
+
+def linear_sweep(bin_data):
+    out = []
+    offset = 0
+    while offset < len(bin_data):
+        next_off, text = parallel_disassembly_8086.decode_at(bin_data, offset)
+        out.append((offset, text))
+        offset = next_off
+    return out
+
+
+@pytest.mark.parametrize("chunk_size, n_candidates", [(7, 3), (333, 1), (997, 2), (1000, 4), (1 << 16, 4)])
+def test_chunks_match_linear_sweep(chunk_size, n_candidates):
+    bin_data = mixed_binary()
+    assert parallel_disassembly_8086.disassemble_parallel(bin_data, 1, chunk_size, n_candidates) == linear_sweep(bin_data)
+
+
+def test_worker_processes_match_linear_sweep():
+    bin_data = mixed_binary(60)
+    assert parallel_disassembly_8086.disassemble_parallel(bin_data, 2, 256) == linear_sweep(bin_data)
+
+
+def test_undecodable_and_cut_off_bytes():
+    # An opcode the decoder doesn't know, then a MOV cut off by the end of the binary
+    instructions = parallel_disassembly_8086.disassemble_parallel(bytes.fromhex("10" "B90300" "B9"), 1)
+    assert instructions == [(0, "db 0x10"), (1, "MOV CX, 3"), (4, "db 0xb9")]
+
+
+def test_bad_sizes():
+    with pytest.raises(ValueError):
+        parallel_disassembly_8086.disassemble_parallel(CODE, 1, chunk_size=0)
+    with pytest.raises(ValueError):
+        parallel_disassembly_8086.disassemble_parallel(CODE, 1, n_candidates=0)
@@ -0,0 +1,84 @@
+"""Prefetch queue model tests: the modelled clocks must add up, whichever way the simulator is driven.
+
+Author: Soumitra Goswami
+"""
+import pytest
+
+from sim8086 import SG_HW8
+
+# mov cx,3
+MOV_IMMEDIATE_BIN = bytes.fromhex("B90300")
+# mov ax,[0x100]
+EVEN_LOAD_BIN = bytes.fromhex("A10001")
+# mov ax,[0x101]
+ODD_LOAD_BIN = bytes.fromhex("A10101")
+# mov cx,3 ; l: add ax,1 ; sub cx,1 ; jne l ; add bx,1 ; add bx,1
+LOOP_BIN = bytes.fromhex("B90300" "83C001" "83E901" "75F8" "83C301" "83C301")
+# mov sp,0x200 ; mov ax,0x100 ; mov es,ax ; mov cx,3 ; rep stosw ; push ax
+STACK_STRING_BIN = bytes.fromhex("BC0002" "B80001" "8EC0" "B90300" "F3AB" "50")
+PROGRAMS = [MOV_IMMEDIATE_BIN, EVEN_LOAD_BIN, ODD_LOAD_BIN, LOOP_BIN, STACK_STRING_BIN]
+
+
+def modelled(bin_data, use_run):
+    sim = SG_HW8.Simulator(bin_data)
+    sim.enable_prefetch_model()
+    if use_run:
+        sim.run()
+    else:
+        while not sim.is_halted:
+            sim.step()
+    return sim
+
+
+def totals(model):
+    return (model.clocks, model.manual_clocks, model.n_instructions, model.prefetch_bus_cycles,
+            model.eu_bus_cycles, model.queue_wait_clocks, model.bus_wait_clocks, model.n_flushes,
+            model.n_discarded_bytes)
+
+
+@pytest.mark.parametrize("bin_data", PROGRAMS)
+def test_run_matches_step(bin_data):
+    ran = modelled(bin_data, use_run=True)
+    stepped = modelled(bin_data, use_run=False)
+    assert totals(ran.prefetch_model) == totals(stepped.prefetch_model)
+    assert ran.prefetch_model.report() == stepped.prefetch_model.report()
+
+
+@pytest.mark.parametrize("bin_data", PROGRAMS)
+def test_model_only_adds_clocks(bin_data):
+    plain = SG_HW8.Simulator(bin_data)
+    plain.run()
+    sim = modelled(bin_data, use_run=True)
+    model = sim.prefetch_model
+    assert sim.mem_layout.registers == plain.mem_layout.registers
+    assert sim.mem_layout.clocks == plain.mem_layout.clocks == model.manual_clocks
+    assert model.n_instructions == plain.instruction_count
+    assert model.clocks == model.manual_clocks + model.queue_wait_clocks + model.bus_wait_clocks
+
+
+def test_cold_queue_waits_for_fetches():
+    # Three bytes from an empty queue take two word fetches before the 4 clock execution
+    model = modelled(MOV_IMMEDIATE_BIN, use_run=True).prefetch_model
+    assert model.prefetch_bus_cycles == 2
+    assert model.queue_wait_clocks == 8
+    assert model.clocks == 12
+
+
+def test_odd_word_access_takes_two_bus_cycles():
+    assert modelled(EVEN_LOAD_BIN, use_run=True).prefetch_model.eu_bus_cycles == 1
+    assert modelled(ODD_LOAD_BIN, use_run=True).prefetch_model.eu_bus_cycles == 2
+
+
+def test_taken_jumps_flush_queue():
+    model = modelled(LOOP_BIN, use_run=True).prefetch_model
+    # Two of the three jne are taken
+    assert model.n_flushes == 2
+    assert model.n_discarded_bytes > 0
+
+
+def test_report():
+    model = modelled(LOOP_BIN, use_run=True).prefetch_model
+    report = model.report()
+    assert report.startswith("; Prefetch queue model\n")
+    assert f"; Clocks: {model.manual_clocks} manual, {model.clocks} modelled" in report
+    assert f"; Queue flushes: {model.n_flushes} " in report
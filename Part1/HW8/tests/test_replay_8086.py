@@ -0,0 +1,62 @@
+"""Replay tests: replaying to any instruction must give the state stepping reaches there.
+
+Author: Soumitra Goswami
+"""
+import zlib
+
+import pytest
+
+from sim8086 import SG_HW8
+from sim8086 import replay_8086
+
+# mov cx,3 ; l: add ax,1 ; sub cx,1 ; jne l ; add bx,1 ; add bx,1
+DEAD_FLAGS_LOOP_BIN = bytes.fromhex("B90300" "83C001" "83E901" "75F8" "83C301" "83C301")
+# mov cx,5 ; l: add word [0x2000],cx ; sub cx,1 ; jne l ; mov ax,[0x2000]
+MEMORY_LOOP_BIN = bytes.fromhex("B90500" "010E0020" "83E901" "75F7" "A10020")
+PROGRAMS = [DEAD_FLAGS_LOOP_BIN, MEMORY_LOOP_BIN]
+
+
+def state(sim):
+    layout = sim.mem_layout
+    return (list(layout.registers), layout.flags, layout.clocks, sim.instruction_count,
+            layout.memory.read_block(0, 0x3000))
+
+
+def stepped_states(bin_data):
+    sim = SG_HW8.Simulator(bin_data)
+    states = [state(sim)]
+    while not sim.is_halted:
+        sim.step()
+        states.append(state(sim))
+    return states
+
+
+@pytest.mark.parametrize("bin_data", PROGRAMS)
+def test_replay_to_every_instruction(bin_data, tmp_path):
+    states = stepped_states(bin_data)
+    recording = replay_8086.record(SG_HW8.Simulator(bin_data), checkpoint_every=3)
+    assert recording.n_instructions == len(states) - 1
+    recording_path = tmp_path / "run.rec"
+    recording.save(str(recording_path))
+    loaded = replay_8086.Recording8086.from_file(str(recording_path))
+    assert [count for count, _ in loaded.checkpoints] == [count for count, _ in recording.checkpoints]
+    for replayed in (recording, loaded):
+        for index, expected in enumerate(states):
+            assert state(replay_8086.replay_to(replayed, index)) == expected, f"instruction {index}"
+
+
+def test_record_budget():
+    recording = replay_8086.record(SG_HW8.Simulator(DEAD_FLAGS_LOOP_BIN), checkpoint_every=4, max_instructions=6)
+    assert recording.n_instructions == 6
+    assert [count for count, _ in recording.checkpoints] == [0, 4, 6]
+    with pytest.raises(ValueError):
+        replay_8086.replay_to(recording, 7)
+
+
+def test_bad_recordings(tmp_path):
+    with pytest.raises(ValueError):
+        replay_8086.record(SG_HW8.Simulator(DEAD_FLAGS_LOOP_BIN), checkpoint_every=0)
+    bad_path = tmp_path / "bad.rec"
+    bad_path.write_bytes(zlib.compress(b"NOTAREC!" + bytes(64)))
+    with pytest.raises(ValueError):
+        replay_8086.Recording8086.from_file(str(bad_path))
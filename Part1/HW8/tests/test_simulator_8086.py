@@ -0,0 +1,228 @@
+"""Simulator tests: run() from cached and fused ops must leave the same state as step().
+
+Author: Soumitra Goswami
+"""
+import asyncio
+
+import pytest
+
+from sim8086 import SG_HW8
+from sim8086 import loop_analysis_8086
+
+
+# mov cx,3 ; l: add ax,1 ; sub cx,1 ; jne l ; add bx,1 ; add bx,1
+# The fused SUB/JNE skips its flags, both exits overwrite them
+DEAD_FLAGS_LOOP_BIN = bytes.fromhex("B90300" "83C001" "83E901" "75F8" "83C301" "83C301")
+# mov cx,1 ; l: sub cx,1 ; jne l ; add ax,1
+BUDGET_BIN = bytes.fromhex("B90100" "83E901" "75FB" "83C001")
+# mov word [0x100],5 ; add word [0x100],3 ; mov bx,[0x100] ; cmp bx,8 ; je +3 ; mov cx,1 ; mov dx,[0x100]
+MEMORY_BIN = bytes.fromhex("C70600010500" "8306000103" "8B1E0001" "83FB08" "7403" "B90100" "8B160001")
+# mov bx,1 ; l: cmp ax,bx ; jne l ... jumps to its own CMP forever
+SELF_LOOP_BIN = bytes.fromhex("BB0100" "39D8" "75FC")
+# mov dx,2 ; l: mov cx,1 ; sub cx,1 ; jne +0 ; add al,0 ; mov word [0xb],0x9c9c ; sub dx,1 ; jne l
+# The fused SUB/JNE is compiled with dead flags, then the ADD after it becomes PUSHF PUSHF
+SELF_MODIFYING_BIN = bytes.fromhex("BA0200" "B90100" "83E901" "7500" "0400" "C7060B009C9C" "83EA01" "75EB")
+# mov cx,2 ; l: add ax,1 ; mov byte [5],5 ; sub cx,1 ; jne l      The second ADD adds 5
+PATCHED_IMMEDIATE_BIN = bytes.fromhex("B90200" "83C001" "C606050005" "83E901" "75F3")
+PROGRAMS = [DEAD_FLAGS_LOOP_BIN, BUDGET_BIN, MEMORY_BIN, SELF_MODIFYING_BIN, PATCHED_IMMEDIATE_BIN]
+
+
+def stepped(bin_data, n=None):
+    sim = SG_HW8.Simulator(bin_data)
+    while not sim.is_halted and (n is None or sim.instruction_count < n):
+        sim.step()
+    return sim
+
+
+def state(sim):
+    layout = sim.mem_layout
+    return (list(layout.registers), layout.flags, layout.clocks, sim.instruction_count,
+            layout.memory.read_block(0, 0x200), layout.memory.read_block(0xff00, 0x100))
+
+
+@pytest.mark.parametrize("bin_data", PROGRAMS)
+def test_run_matches_step_at_every_budget(bin_data):
+    total = stepped(bin_data).instruction_count
+    for n in range(total + 1):
+        sim = SG_HW8.Simulator(bin_data)
+        assert sim.run(n) == n
+        assert state(sim) == state(stepped(bin_data, n)), f"budget {n}"
+
+
+@pytest.mark.parametrize("bin_data", PROGRAMS)
+def test_run_in_slices_matches_one_run(bin_data):
+    sim = SG_HW8.Simulator(bin_data)
+    while sim.run(1):
+        pass
+    one_run = SG_HW8.Simulator(bin_data)
+    one_run.run()
+    assert state(sim) == state(one_run)
+
+
+def test_budget_stops_before_decoding_past_it():
+    # mov ax,1 ; then an opcode the simulator doesn't implement
+    sim = SG_HW8.Simulator(bytes.fromhex("B80100" "10C0"))
+    assert sim.run(1) == 1
+    assert sim.mem_layout.registers[0] == 1
+    with pytest.raises(NotImplementedError):
+        sim.run(1)
+
+
+def test_breakpoint_stops_before_decoding_past_it():
+    sim = SG_HW8.Simulator(bytes.fromhex("B80100" "10C0"))
+    sim.add_breakpoint(3)
+    assert sim.run() == 1
+    assert [event.kind for event in sim.debug_events] == ["break"]
+
+
+def test_fused_op_split_by_budget():
+    # The budget runs out between the SUB and the JNE of the fused op
+    sim = SG_HW8.Simulator(BUDGET_BIN)
+    assert sim.run(2) == 2
+    assert sim.mem_layout.registers[12] == 6
+    assert state(sim) == state(stepped(BUDGET_BIN, 2))
+
+
+def test_infinite_loop_through_fused_op():
+    sim = SG_HW8.Simulator(SELF_LOOP_BIN)
+    sim.enable_loop_detection()
+    with pytest.raises(loop_analysis_8086.InfiniteLoopError):
+        sim.run(1000)
+
+
+def result(sim):
+    return state(sim) + (sim.coverage.bitmap, sim.is_halted)
+
+
+@pytest.mark.parametrize("bin_data", PROGRAMS)
+def test_reset_runs_the_same_again(bin_data):
+    sim = SG_HW8.Simulator(bin_data)
+    sim.enable_opcode_stats()
+    sim.enable_loop_stats()
+    sim.run()
+    first = result(sim)
+    first_histogram = sim.opcode_stats.histogram()
+    first_loops = sim.loop_stats.report()
+    sim.reset()
+    assert sim.coverage.n_executed() == 0
+    sim.run()
+    assert result(sim) == first
+    assert sim.opcode_stats.histogram() == first_histogram
+    assert sim.loop_stats.report() == first_loops
+
+
+def test_reset_after_memory_writes():
+    sim = SG_HW8.Simulator(MEMORY_BIN)
+    sim.run()
+    first = result(sim)
+    sim.reset()
+    assert sim.mem_layout.memory.read_block(0x100, 2) == b"\x00\x00"
+    sim.run()
+    assert result(sim) == first
+
+
+def test_load_runs_like_a_new_simulator():
+    # Same CMP/JNE, but only the second program reads the flags after it (PUSHF)
+    flags_dead_bin = bytes.fromhex("39D8" "7502" "0400" "0400")
+    flags_read_bin = bytes.fromhex("39D8" "7502" "9C9C" "9C9C")
+    sim = SG_HW8.Simulator(flags_dead_bin)
+    sim.run()
+    for bin_data in (flags_read_bin, MEMORY_BIN, flags_dead_bin):
+        sim.load(bin_data)
+        sim.run()
+        fresh = SG_HW8.Simulator(bin_data)
+        fresh.run()
+        assert result(sim) == result(fresh)
+
+
+def raise_type_error(buf, mem_layout):
+    raise TypeError("unfinished handler")
+
+
+def test_type_error_names_the_handler_at_cs_ip(tmp_path, monkeypatch, capsys):
+    # call 0x10:0 ; then mov ax,1 at physical 0x100, where IP is 0 again
+    bin_data = bytes.fromhex("9A00001000").ljust(0x100, b"\x00") + bytes.fromhex("B80100")
+    bin_path = tmp_path / "far"
+    bin_path.write_bytes(bin_data)
+    monkeypatch.setitem(SG_HW8.op_funcs, "0b1011", raise_type_error)
+    # decode_opcode caches the handler of each first byte
+    SG_HW8.decode_opcode.cache_clear()
+    try:
+        SG_HW8.disassemble_CPU8086(str(bin_path))
+    finally:
+        SG_HW8.decode_opcode.cache_clear()
+    assert "'raise_type_error' function is not fleshed out yet" in capsys.readouterr().out
+
+
+def test_run_async_matches_run():
+    for yield_every in (1, 3, 1000):
+        sim = SG_HW8.Simulator(DEAD_FLAGS_LOOP_BIN)
+        assert asyncio.run(sim.run_async(yield_every=yield_every)) == sim.instruction_count
+        assert state(sim) == state(stepped(DEAD_FLAGS_LOOP_BIN))
+
+
+def test_run_async_shares_the_event_loop():
+    # Two endless loops on one event loop both get through their budgets
+    async def both():
+        sims = [SG_HW8.Simulator(SELF_LOOP_BIN), SG_HW8.Simulator(SELF_LOOP_BIN)]
+        counts = await asyncio.gather(*(sim.run_async(100, yield_every=7) for sim in sims))
+        return counts, sims
+    counts, sims = asyncio.run(both())
+    assert counts == [100, 100]
+    assert state(sims[0]) == state(sims[1]) == state(stepped(SELF_LOOP_BIN, 100))
+
+
+def test_run_async_stops_at_breakpoint():
+    sim = SG_HW8.Simulator(DEAD_FLAGS_LOOP_BIN)
+    sim.add_breakpoint(0xe)
+    assert asyncio.run(sim.run_async(yield_every=2)) == 11
+    assert sim.mem_layout.registers[12] == 0xe
+
+
+def test_run_async_rejects_no_yields():
+    with pytest.raises(ValueError):
+        asyncio.run(SG_HW8.Simulator(BUDGET_BIN).run_async(yield_every=0))
+
+
+def test_halted_simulator():
+    sim = SG_HW8.Simulator(BUDGET_BIN)
+    sim.run()
+    assert sim.is_halted
+    assert sim.run() == 0
+    with pytest.raises(RuntimeError):
+        sim.step()
+
+
+def test_fork_runs_apart_from_its_parent():
+    sim = SG_HW8.Simulator(MEMORY_BIN)
+    sim.run(1)
+    forked = sim.fork()
+    # Only the parent sees the write of the next instruction
+    sim.run(1)
+    assert sim.mem_layout.memory.read_block(0x100, 2) == bytes.fromhex("0800")
+    assert forked.mem_layout.memory.read_block(0x100, 2) == bytes.fromhex("0500")
+    forked.run()
+    sim.run()
+    assert result(forked) == result(sim) == result(stepped(MEMORY_BIN))
+
+
+@pytest.mark.parametrize("bin_data", [SELF_MODIFYING_BIN, PATCHED_IMMEDIATE_BIN])
+def test_self_modifying_code_runs_the_new_code(bin_data):
+    sim = SG_HW8.Simulator(bin_data)
+    sim.run()
+    assert state(sim) == state(stepped(bin_data))
+    # reset() puts the old code back, and its cached ops run again
+    first = result(sim)
+    sim.reset()
+    sim.run()
+    assert result(sim) == first
+
+
+def test_self_modified_results():
+    sim = SG_HW8.Simulator(PATCHED_IMMEDIATE_BIN)
+    sim.run()
+    assert sim.mem_layout.registers[0] == 6
+    # The flags of the last SUB are read by a PUSHF written over the dead flags ADD
+    sim = SG_HW8.Simulator(SELF_MODIFYING_BIN)
+    sim.run()
+    assert sim.mem_layout.memory.read_block(0xfffc, 4) == bytes.fromhex("44004400")
@@ -0,0 +1,75 @@
+"""Undo log tests: stepping back must give the state stepping forward passed through.
+
+Author: Soumitra Goswami
+"""
+import pytest
+
+from sim8086 import SG_HW8
+
+# mov cx,5 ; l: add word [0x2000],cx ; sub cx,1 ; jne l ; mov ax,[0x2000]
+MEMORY_LOOP_BIN = bytes.fromhex("B90500" "010E0020" "83E901" "75F7" "A10020")
+# mov dx,2 ; l: mov cx,1 ; sub cx,1 ; jne +0 ; add al,0 ; mov word [0xb],0x9c9c ; sub dx,1 ; jne l
+SELF_MODIFYING_BIN = bytes.fromhex("BA0200" "B90100" "83E901" "7500" "0400" "C7060B009C9C" "83EA01" "75EB")
+# mov sp,0x200 ; mov ax,0x100 ; mov es,ax ; mov cx,3 ; rep stosw ; push ax
+STACK_STRING_BIN = bytes.fromhex("BC0002" "B80001" "8EC0" "B90300" "F3AB" "50")
+PROGRAMS = [MEMORY_LOOP_BIN, SELF_MODIFYING_BIN, STACK_STRING_BIN]
+
+
+def state(sim):
+    layout = sim.mem_layout
+    return (list(layout.registers), layout.flags, layout.clocks, sim.instruction_count, dict(layout.segment_bases),
+            layout.memory.read_block(0, 0x3000))
+
+
+def stepped_states(bin_data):
+    sim = SG_HW8.Simulator(bin_data)
+    states = [state(sim)]
+    while not sim.is_halted:
+        sim.step()
+        states.append(state(sim))
+    return states
+
+
+@pytest.mark.parametrize("bin_data", PROGRAMS)
+@pytest.mark.parametrize("use_run", [False, True])
+def test_step_back_to_every_instruction(bin_data, use_run):
+    states = stepped_states(bin_data)
+    sim = SG_HW8.Simulator(bin_data)
+    sim.enable_undo_log()
+    if use_run:
+        sim.run()
+    else:
+        while not sim.is_halted:
+            sim.step()
+    for index in range(len(states) - 1, 0, -1):
+        assert state(sim) == states[index], f"instruction {index}"
+        assert sim.step_back() == 1
+    assert state(sim) == states[0]
+    assert sim.step_back() == 0
+    # And forward again over the undone code
+    sim.run()
+    assert state(sim) == states[-1]
+
+
+def test_full_ring_buffers():
+    states = stepped_states(MEMORY_LOOP_BIN)
+    sim = SG_HW8.Simulator(MEMORY_LOOP_BIN)
+    sim.enable_undo_log(max_steps=4)
+    sim.run()
+    assert sim.step_back(100) == 4
+    assert state(sim) == states[-5]
+    # Only the writes of the last two ADDs fit. Undoing stops at the SUB/JNE after the ADD before them.
+    sim = SG_HW8.Simulator(MEMORY_LOOP_BIN)
+    sim.enable_undo_log(max_mem_writes=2)
+    sim.run()
+    assert sim.step_back(100) == 9
+    assert state(sim) == states[-10]
+
+
+def test_step_back_needs_the_log():
+    sim = SG_HW8.Simulator(MEMORY_LOOP_BIN)
+    sim.run()
+    with pytest.raises(RuntimeError):
+        sim.step_back()
+    with pytest.raises(ValueError):
+        sim.enable_undo_log(max_steps=0)